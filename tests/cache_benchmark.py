@@ -0,0 +1,423 @@
+"""A benchmark suite for the Cache backends.
+
+Every backend is filled with a dataset of the given size, then measured running single and batched reads, with
+different mixes of hits and misses, and writes, from a number of concurrent threads. Each workload reports the
+p50/p95/p99 latency of its operations and its throughput, in videos per second.
+
+Runs are appended to a JSON Lines history, kept out of the repository in HISTORY_PATH (set YTPODCAST_BENCHMARK_HISTORY
+to move it): a new run is compared with the previous ones on the same machine and a
+metric is flagged as a regression only if it's an outlier of their distribution, not because of a single slower
+run. Run the whole matrix with:
+
+    python -m tests.cache_benchmark --sizes 1000,10000,100000,1000000 --threads 1,4,16,64
+"""
+from __future__ import annotations
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import dataclasses
+from datetime import datetime
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from redis import Redis
+
+from ytpodcast.cache import Cache, MemoryCache, RedisCache, ShelveCache, SqliteCache
+from ytpodcast.shared_cache import SharedMemoryCache
+from ytpodcast.youtube import Video
+
+
+HISTORY_FILE_NAME = "cache_benchmark_history.jsonl"
+HISTORY_PATH = os.environ.get(
+    "YTPODCAST_BENCHMARK_HISTORY",
+    os.path.join(os.path.expanduser("~"), ".cache", "ytpodcast", HISTORY_FILE_NAME),
+)
+
+# The metrics compared with the history, and if they regress when they grow (latencies) or when they shrink
+METRICS = {"p50_ms": True, "p95_ms": True, "p99_ms": True, "throughput": False}
+
+
+@dataclasses.dataclass(frozen=True)
+class Workload:
+    """What a benchmark measures: operation is "read" or "write", mode is "single" or "batch"."""
+
+    backend: str
+    size: int
+    operation: str
+    mode: str
+    threads: int
+    hit_ratio: float = 1.0
+
+    @property
+    def key(self) -> str:
+        """Identify the workload across runs."""
+        key = f"{self.backend}/{self.size}/{self.operation}/{self.mode}/t{self.threads}"
+        return f"{key}/h{self.hit_ratio:g}" if self.operation == "read" else key
+
+
+@dataclasses.dataclass
+class Result:
+    workload: Workload
+    ops: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    throughput: float
+
+    def to_dict(self) -> Dict:
+        data = dataclasses.asdict(self)
+        data.update(data.pop("workload"))
+        data["key"] = self.workload.key
+        return data
+
+
+@dataclasses.dataclass
+class Regression:
+    """A metric of a backend, key, worse than in the past runs."""
+
+    key: str
+    metric: str
+    baseline: float
+    value: float
+    score: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.key} {self.metric}: a geometric mean of {self.value:.4g} against a median of"
+            f" {self.baseline:.4g} (robust z-score {self.score:.1f})"
+        )
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Return the q-th percentile of samples, interpolating between the closest ranks."""
+    if not samples:
+        raise ValueError("no samples")
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def geometric_mean(values: Sequence[float]) -> float:
+    return math.exp(statistics.mean(math.log(max(value, 1e-12)) for value in values))
+
+
+def detect_regressions(
+    history: List[Dict],
+    results: List[Result],
+    window: int = 10,
+    min_runs: int = 5,
+    threshold: float = 3.5,
+    min_change: float = 0.1,
+) -> List[Regression]:
+    """Compare results with the last window runs of history, backend by backend.
+
+    Single workloads are too noisy to be judged one by one, and with dozens of them some would always look like
+    outliers: a backend is judged by the geometric mean of every metric over its workloads, against the same mean
+    in the past runs measuring the same workloads. It regresses if it's worse than the median of the past means by
+    more than threshold times their median absolute deviation (a robust z-score, not thrown off by a few noisy
+    runs) and by more than min_change of the median, so that tiny but stable differences aren't flagged. Nothing
+    is flagged until min_runs past runs are comparable."""
+    current: Dict[str, Dict[str, Result]] = {}
+    for result in results:
+        current.setdefault(result.workload.backend, {})[result.workload.key] = result
+    regressions = []
+    for backend, by_key in current.items():
+        past_means: Dict[str, List[float]] = {metric: [] for metric in METRICS}
+        for run in reversed(history):
+            past = {
+                result["key"]: result
+                for result in run["results"]
+                if result["key"] in by_key
+            }
+            if len(past) < len(by_key):
+                continue
+            for metric in METRICS:
+                past_means[metric].append(
+                    geometric_mean([result[metric] for result in past.values()])
+                )
+            if len(past_means["p50_ms"]) == window:
+                break
+        if len(past_means["p50_ms"]) < min_runs:
+            continue
+        for metric, higher_is_worse in METRICS.items():
+            values = past_means[metric]
+            median = statistics.median(values)
+            mad = statistics.median(abs(value - median) for value in values)
+            value = geometric_mean(
+                [getattr(result, metric) for result in by_key.values()]
+            )
+            change = value - median if higher_is_worse else median - value
+            if change <= min_change * median:
+                continue
+            # 1.4826 makes the MAD comparable with a standard deviation, for normally distributed values
+            score = change / (1.4826 * mad) if mad else float("inf")
+            if score > threshold:
+                regressions.append(Regression(backend, metric, median, value, score))
+    return regressions
+
+
+def load_history(path: str, machine: Optional[str] = None) -> List[Dict]:
+    """Load the past runs, only the ones of machine if given: timings of different machines can't be compared."""
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return [run for run in runs if machine is None or run["machine"] == machine]
+
+
+def append_history(path: str, results: List[Result]) -> Dict:
+    run = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "results": [result.to_dict() for result in results],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def build_video(video_id: str) -> Video:
+    return Video(
+        id=video_id,
+        title=f"Video {video_id}",
+        description="A benchmark video description. " * 20,
+        thumbnail=f"https://i.ytimg.com/vi/{video_id}/sddefault.jpg",
+        url=f"/api/stream/{video_id}",
+        length=600,
+    )
+
+
+def video_ids(start: int, stop: int) -> Iterator[str]:
+    return (f"bench{i:08d}" for i in range(start, stop))
+
+
+def fill(cache: Cache, size: int, chunk: int = 1000) -> None:
+    """Save size videos into cache, chunk at a time, without holding them all in memory."""
+    for start in range(0, size, chunk):
+        cache.save_many(
+            build_video(video_id)
+            for video_id in video_ids(start, min(start + chunk, size))
+        )
+
+
+def run_workload(
+    cache: Cache,
+    workload: Workload,
+    ops: int = 1000,
+    batch_size: int = 50,
+    seed: int = 0,
+) -> Result:
+    """Run ops operations of workload on cache, which holds workload.size videos, spread over its threads.
+
+    A batch operation reads or writes batch_size videos: its latency is the one of the whole batch, while
+    throughput counts videos."""
+    rng = random.Random(seed)
+    per_op = batch_size if workload.mode == "batch" else 1
+    if workload.operation == "read":
+        keys = [
+            f"bench{rng.randrange(workload.size):08d}"
+            if rng.random() < workload.hit_ratio
+            else f"miss{i:08d}"
+            for i in range(ops * per_op)
+        ]
+    else:
+        # New videos, written after the dataset
+        keys = list(video_ids(workload.size, workload.size + ops * per_op))
+    chunks = [keys[i : i + per_op] for i in range(0, len(keys), per_op)]
+
+    if workload.operation == "read" and workload.mode == "single":
+        operation = lambda chunk: cache.lookup(chunk[0])
+    elif workload.operation == "read":
+        operation = cache.lookup_many
+    elif workload.mode == "single":
+        operation = lambda chunk: cache.save(build_video(chunk[0]))
+    else:
+        operation = lambda chunk: cache.save_many(
+            [build_video(video_id) for video_id in chunk]
+        )
+
+    def run(thread_chunks: List[List[str]]) -> List[float]:
+        latencies = []
+        for chunk in thread_chunks:
+            start = time.perf_counter()
+            operation(chunk)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    # Untimed, so that first-use costs (like connecting, or filling caches) don't end up in the percentiles
+    for chunk in chunks[: max(1, len(chunks) // 10)]:
+        operation(chunk)
+    shares = [chunks[i :: workload.threads] for i in range(workload.threads)]
+    start = time.perf_counter()
+    if workload.threads == 1:
+        latencies = run(shares[0])
+    else:
+        with ThreadPoolExecutor(max_workers=workload.threads) as executor:
+            latencies = [
+                latency
+                for thread_latencies in executor.map(run, shares)
+                for latency in thread_latencies
+            ]
+    elapsed = time.perf_counter() - start
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return Result(
+        workload=workload,
+        ops=len(latencies),
+        p50_ms=percentile(latencies_ms, 50),
+        p95_ms=percentile(latencies_ms, 95),
+        p99_ms=percentile(latencies_ms, 99),
+        throughput=len(keys) / elapsed,
+    )
+
+
+def fake_redis() -> Redis:
+    """Return a client of a Redis living in this process, or of the local one if fakeredis isn't installed."""
+    try:
+        import fakeredis
+    except ImportError:
+        return Redis(host="localhost", port=6379, db=15)
+    return fakeredis.FakeRedis()
+
+
+@dataclasses.dataclass
+class Backend:
+    """How to build a Cache to benchmark in a directory, and close it. Backends that aren't thread safe run only
+    with a single thread."""
+
+    build: Callable[[str, int], Cache]
+    close: Callable[[Cache], None] = lambda cache: None
+    thread_safe: bool = True
+
+
+def _close_redis(cache: RedisCache) -> None:
+    cache.r.flushdb()
+    cache.r.close()
+
+
+BACKENDS: Dict[str, Backend] = {
+    "sqlite": Backend(
+        build=lambda directory, size: SqliteCache(
+            db_file=os.path.join(directory, "bench.sqlite3")
+        ),
+        close=lambda cache: cache.close(),
+    ),
+    "shelve": Backend(
+        build=lambda directory, size: ShelveCache(
+            db_file=os.path.join(directory, "bench")
+        ),
+        close=lambda cache: cache.db.close(),
+        thread_safe=False,
+    ),
+    "redis": Backend(
+        build=lambda directory, size: RedisCache(redis=fake_redis()),
+        close=_close_redis,
+    ),
+    "memory": Backend(
+        build=lambda directory, size: MemoryCache(
+            max_entries=size * 2, max_bytes=size * 4096, local_ttl=None
+        ),
+    ),
+    "shared": Backend(
+        build=lambda directory, size: SharedMemoryCache(
+            path=os.path.join(directory, "bench.shm"), max_bytes=size * 2048
+        ),
+        close=lambda cache: cache.close(),
+    ),
+}
+
+
+def workloads(
+    backend: str,
+    size: int,
+    threads: Sequence[int],
+    hit_ratios: Sequence[float] = (1.0, 0.5, 0.0),
+) -> List[Workload]:
+    """The reads and writes measured on a backend holding size videos."""
+    if not BACKENDS[backend].thread_safe:
+        threads = [1]
+    found = []
+    for mode in ("single", "batch"):
+        for count in threads:
+            for hit_ratio in hit_ratios:
+                found.append(Workload(backend, size, "read", mode, count, hit_ratio))
+            found.append(Workload(backend, size, "write", mode, count))
+    return found
+
+
+def run_suite(
+    backends: Sequence[str],
+    sizes: Sequence[int],
+    threads: Sequence[int],
+    ops: int = 1000,
+    batch_size: int = 50,
+) -> List[Result]:
+    """Benchmark every backend with every dataset size, on a fresh cache each time."""
+    results = []
+    for name in backends:
+        backend = BACKENDS[name]
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                cache = backend.build(directory, size)
+                try:
+                    fill(cache, size)
+                    for workload in workloads(name, size, threads):
+                        results.append(run_workload(cache, workload, ops, batch_size))
+                finally:
+                    backend.close(cache)
+    return results
+
+
+def format_results(results: List[Result]) -> str:
+    lines = [
+        f"{'workload':<48} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'videos/s':>11}"
+    ]
+    for result in results:
+        lines.append(
+            f"{result.workload.key:<48} {result.p50_ms:>9.3f} {result.p95_ms:>9.3f}"
+            f" {result.p99_ms:>9.3f} {result.throughput:>11.0f}"
+        )
+    return "\n".join(lines)
+
+
+def _ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--sizes", type=_ints, default=[1000, 10_000, 100_000])
+    parser.add_argument("--threads", type=_ints, default=[1, 4, 16, 64])
+    parser.add_argument("--ops", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--history",
+        default=HISTORY_PATH,
+    )
+    args = parser.parse_args(argv)
+    results = run_suite(
+        args.backends.split(","), args.sizes, args.threads, args.ops, args.batch_size
+    )
+    print(format_results(results))
+    regressions = detect_regressions(
+        load_history(args.history, platform.node()), results
+    )
+    append_history(args.history, results)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
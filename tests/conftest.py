@@ -7,11 +7,30 @@ import redis as _redis
 from pytube import Channel, Playlist
 from vcr.errors import CannotOverwriteExistingCassetteException
 
-from ytpodcast.cache import RedisCache, ShelveCache
+from ytpodcast.cache import RedisCache, ShelveCache, SqliteCache, MemoryCache
+from ytpodcast.youtube import Video
 from ytpodcast.api import get_stream_url
 from tests.vcr_config import *
 
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--performance-gate",
+        action="store_true",
+        help="compare the cache benchmarks with the history of past runs",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the tests marked performance_gate unless asked for with --performance-gate."""
+    if config.getoption("--performance-gate"):
+        return
+    skip = pytest.mark.skip(reason="needs --performance-gate")
+    for item in items:
+        if "performance_gate" in item.keywords:
+            item.add_marker(skip)
+
+
 @dataclasses.dataclass
 class TestVideoData:
     id: str
@@ -89,11 +108,57 @@ def test_redis_cache():
     return RedisCache()
 
 
+@pytest.fixture(scope="function")
+def test_memory_cache():
+    """Build a MemoryCache in front of a RedisCache usable in a test."""
+    return MemoryCache(backend=RedisCache())
+
+
 @pytest.fixture(scope="function")
 def reset_test_video_redis_cache(redis):
     """Ensure the test video redis cache is purged after every test."""
     yield
-    redis.delete(f"ytpodcast:video:{test_data.video_id}")
+    redis.delete(
+        f"ytpodcast:video:{test_data.video_id}",
+        f"ytpodcast:fetched:{test_data.video_id}",
+        f"ytpodcast:unavailable:{test_data.video_id}",
+    )
+
+
+def build_test_videos(count: int) -> List[Video]:
+    """Build count distinct test videos, without any network call."""
+    videos = []
+    for i in range(count):
+        video = Video.from_json(test_data.video_data_str)
+        video.id = f"{test_data.video_id}_{i}"
+        videos.append(video)
+    return videos
+
+
+@pytest.fixture(scope="function")
+def reset_test_videos_redis_cache(redis):
+    """Ensure the test videos built by build_test_videos are purged from the redis cache after every test."""
+    yield
+    keys = redis.keys(f"ytpodcast:*:{test_data.video_id}_*")
+    if keys:
+        redis.delete(*keys)
+
+
+@pytest.fixture(scope="function")
+def reset_test_playlist_redis_cache(redis):
+    """Ensure the test playlist and its videos are purged from the redis cache after every test."""
+    yield
+    redis.delete(
+        f"ytpodcast:membership:{test_data.playlist_id}",
+        *(
+            url.replace("https://www.youtube.com/watch?v=", "ytpodcast:video:")
+            for url in test_data.playlist_video_list
+        ),
+        *(
+            url.replace("https://www.youtube.com/watch?v=", "ytpodcast:fetched:")
+            for url in test_data.playlist_video_list
+        ),
+    )
 
 
 def _test_shelve_cache_db_path(request):
@@ -125,6 +190,26 @@ def reset_test_video_shelve_cache(test_shelve_cache_db_path):
     os.remove(test_shelve_cache_db_path)
 
 
+@pytest.fixture(scope="function")
+def test_sqlite_cache_db_path(tmp_path):
+    """Return a temporary SqliteCache db file path."""
+    return str(tmp_path / "db.sqlite3")
+
+
+@pytest.fixture(scope="function")
+def test_sqlite_cache(test_sqlite_cache_db_path):
+    """Build a SqliteCache usable in a test."""
+    cache = SqliteCache(db_file=test_sqlite_cache_db_path)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(scope="function")
+def reset_test_video_sqlite_cache():
+    """The SqliteCache lives in a temporary directory: nothing to purge."""
+    yield
+
+
 class NetworkCallMade(Exception):
     """Exception called if a network call has been made in a no_network_calls block."""
 
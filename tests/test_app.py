@@ -0,0 +1,277 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import ytpodcast.feed
+from ytpodcast.api import get_feed_url, get_stream_url
+from ytpodcast.app import create_app
+from ytpodcast.feed import FeedCache
+from ytpodcast.proxy import StreamProxy
+from ytpodcast.scheduler import RefreshScheduler, SubscriptionRegistry
+from ytpodcast.youtube import Channel, Playlist, Video, VideoUnavailableError
+from ytpodcast.youtube.base import AsyncYouTubeInfo, YouTubeInfo
+from tests.conftest import build_test_videos, test_data as td
+from tests.test_scheduler import CachingFakeInfo
+from tests.youtube.test_stream import FakeStream
+
+
+class FakeInfo(YouTubeInfo):
+    """A YouTubeInfo serving a fixed playlist, counting how many times it's built."""
+
+    name = "fake"
+
+    def __init__(self, videos: List[Video]):
+        super().__init__()
+        self.videos = videos
+        self.built = 0
+
+    def _playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        self.built += 1
+        return Playlist(
+            id=playlist_id,
+            title="title",
+            description="description",
+            thumbnail=self.videos[0].thumbnail,
+            url=f"https://www.youtube.com/playlist?list={playlist_id}",
+            videos=list(self.videos),
+        )
+
+    def _video_from_url(self, url: str) -> Video:
+        raise NotImplementedError
+
+
+class FakeAsyncInfo(AsyncYouTubeInfo):
+    """An AsyncYouTubeInfo serving a fixed playlist."""
+
+    name = "fake"
+
+    def __init__(self, videos: List[Video]):
+        super().__init__()
+        self.sync_info = FakeInfo(videos)
+
+    async def _playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        return self.sync_info._playlist_from_id(playlist_id, limit)
+
+    async def _video_from_url(self, url: str) -> Video:
+        raise NotImplementedError
+
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class TestAFeedEndpoint:
+    """Test: A feed endpoint..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        """Count the feeds rendered."""
+        self.rendered = 0
+        self.rendered_on_event_loop = False
+        render_feed = ytpodcast.feed.render_feed
+
+        def counting_render_feed(*args):
+            self.rendered += 1
+            self.rendered_on_event_loop |= on_event_loop()
+            return render_feed(*args)
+
+        monkeypatch.setattr("ytpodcast.feed.render_feed", counting_render_feed)
+        self.info = FakeInfo(build_test_videos(3))
+
+    def client(self, ttl: float = 60) -> TestClient:
+        return TestClient(create_app(self.info, FeedCache(ttl=ttl)))
+
+    def test_should_serve_a_podcast_feed_of_a_playlist(self):
+        """A feed endpoint should serve a podcast feed of a playlist."""
+        response = self.client().get(get_feed_url(td.playlist_id))
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/rss+xml"
+        assert response.headers["content-encoding"] == "gzip"
+        assert b"<itunes:duration>" in response.content
+        assert f"http://testserver/api/stream/{td.video_id}".encode() in (
+            response.content
+        )
+
+    def test_should_answer_conditional_requests_without_building_the_playlist(self):
+        """A feed endpoint should answer conditional requests without building the playlist again."""
+        client = self.client()
+        response = client.get(get_feed_url(td.playlist_id))
+        etag, last_modified = (
+            response.headers["etag"],
+            response.headers["last-modified"],
+        )
+        for headers in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+            response = client.get(get_feed_url(td.playlist_id), headers=headers)
+            assert response.status_code == 304
+            assert response.content == b""
+        response = client.get(
+            get_feed_url(td.playlist_id), headers={"If-None-Match": '"other"'}
+        )
+        assert response.status_code == 200
+        assert self.info.built == 1
+        assert self.rendered == 1
+
+    def test_should_render_a_feed_only_when_the_playlist_changes(self):
+        """A feed endpoint should render a feed again only when the playlist changes."""
+        client = self.client(ttl=0)
+        etag = client.get(get_feed_url(td.playlist_id)).headers["etag"]
+        response = client.get(
+            get_feed_url(td.playlist_id), headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert (self.info.built, self.rendered) == (2, 1)
+
+        self.info.videos = self.info.videos[1:]
+        response = client.get(
+            get_feed_url(td.playlist_id), headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert (self.info.built, self.rendered) == (3, 2)
+
+    def test_should_serve_an_uncompressed_feed_if_asked(self):
+        """A feed endpoint should serve an uncompressed feed to clients not accepting gzip."""
+        response = self.client().get(
+            get_feed_url(td.playlist_id), headers={"Accept-Encoding": "identity"}
+        )
+        assert "content-encoding" not in response.headers
+        assert response.content.startswith(b"<?xml")
+
+    def test_should_serve_a_gzipped_feed_only_to_clients_accepting_it(self):
+        """A feed endpoint should serve a gzipped feed only to the clients giving gzip a q-value above 0."""
+        client = self.client()
+        for accept_encoding, gzipped in [
+            ("gzip;q=0", False),
+            ("br, gzip; q=0.0, identity", False),
+            ("*;q=0", False),
+            ("deflate, gzip;q=0.5", True),
+            ("*", True),
+            ("gzip;q=0, *", False),
+        ]:
+            response = client.get(
+                get_feed_url(td.playlist_id),
+                headers={"Accept-Encoding": accept_encoding},
+            )
+            assert ("content-encoding" in response.headers) is gzipped, accept_encoding
+
+    def test_should_render_feeds_off_the_event_loop(self):
+        """A feed endpoint should render feeds off the event loop, even with an AsyncYouTubeInfo."""
+        for info in [self.info, FakeAsyncInfo(build_test_videos(3))]:
+            client = TestClient(create_app(info, FeedCache()))
+            assert client.get(get_feed_url(td.playlist_id)).status_code == 200
+        assert self.rendered == 2
+        assert not self.rendered_on_event_loop
+
+    def test_should_serve_subscribed_playlists_from_the_cache(self, test_sqlite_cache):
+        """A feed endpoint should serve subscribed playlists refreshed in background from the cache only."""
+        info = CachingFakeInfo(test_sqlite_cache)
+        info.playlists[td.playlist_id] = build_test_videos(3)
+        registry = SubscriptionRegistry(test_sqlite_cache)
+        registry.subscribe_playlist(td.playlist_id)
+        scheduler = RefreshScheduler(info, registry)
+        for future in scheduler.run_pending(time.time() + 60):
+            future.result()
+        scheduler.stop()
+        client = TestClient(create_app(info, FeedCache(ttl=0), registry=registry))
+        for _ in range(2):
+            response = client.get(get_feed_url(td.playlist_id))
+            assert response.status_code == 200
+            assert b"<itunes:duration>" in response.content
+        assert info.built == [td.playlist_id]
+
+
+class UnavailableStream(FakeStream):
+    """A YouTubeStream of videos that are all private."""
+
+    def _stream_url_from_id(self, video_id: str) -> str:
+        raise VideoUnavailableError(video_id, "private")
+
+
+class TestAStreamEndpoint:
+    """Test: A stream endpoint..."""
+
+    def test_should_redirect_to_the_stream_of_a_video(self, test_sqlite_cache):
+        """A stream endpoint should redirect to the stream of a video, resolving it once."""
+        stream = FakeStream(expires_in=6 * 60 * 60, cache=test_sqlite_cache)
+        client = TestClient(create_app(FakeInfo([]), stream=stream))
+        for _ in range(2):
+            response = client.get(get_stream_url(td.video_id), follow_redirects=False)
+            assert response.status_code == 302
+            assert response.headers["location"].startswith(
+                "https://rr1.googlevideo.com/videoplayback?id="
+            )
+        assert stream.resolved == 1
+
+    def test_should_answer_not_found_for_an_unavailable_video(self):
+        """A stream endpoint should answer not found for an unavailable video."""
+        client = TestClient(create_app(FakeInfo([]), stream=UnavailableStream(0)))
+        response = client.get(get_stream_url(td.video_id), follow_redirects=False)
+        assert response.status_code == 404
+
+
+class FakeGoogleVideo:
+    """A googlevideo stand-in for httpx, serving the same bytes for every url and honouring ranges.
+
+    Responses are streams, like the ones read from the network."""
+
+    body = bytes(range(256)) * 1024
+
+    def __init__(self):
+        self.ranges = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.ranges.append(request.headers.get("range"))
+        headers = {"Content-Type": "audio/mp4", "Accept-Ranges": "bytes"}
+        if "range" not in request.headers:
+            return httpx.Response(
+                200, headers=headers, stream=httpx.ByteStream(self.body)
+            )
+        start, end = request.headers["range"].replace("bytes=", "").split("-")
+        start, end = int(start), int(end) if end else len(self.body) - 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(self.body)}"
+        content = httpx.ByteStream(self.body[start : end + 1])
+        return httpx.Response(206, headers=headers, stream=content)
+
+
+class TestAStreamProxy:
+    """Test: A stream proxy..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Build an app relaying the streams of a fake googlevideo."""
+        self.upstream = FakeGoogleVideo()
+        proxy = StreamProxy(
+            httpx.AsyncClient(transport=httpx.MockTransport(self.upstream)),
+            chunk_size=4096,
+        )
+        stream = FakeStream(expires_in=6 * 60 * 60)
+        self.client = TestClient(create_app(FakeInfo([]), stream=stream, proxy=proxy))
+
+    def test_should_relay_a_whole_stream(self):
+        """A stream proxy should relay a whole stream."""
+        response = self.client.get(get_stream_url(td.video_id))
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/mp4"
+        assert response.content == FakeGoogleVideo.body
+
+    def test_should_pass_ranges_through(self):
+        """A stream proxy should pass range requests through."""
+        response = self.client.get(
+            get_stream_url(td.video_id), headers={"Range": "bytes=1000-1999"}
+        )
+        assert response.status_code == 206
+        assert response.headers["content-range"].startswith("bytes 1000-1999/")
+        assert response.content == FakeGoogleVideo.body[1000:2000]
+        assert self.upstream.ranges == ["bytes=1000-1999"]
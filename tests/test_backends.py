@@ -0,0 +1,111 @@
+import json
+import subprocess
+import sys
+from typing import Dict, List
+
+import pytest
+
+from ytpodcast.backends import BackendRegistry, cache_backend
+from ytpodcast.cache import MemoryCache, RedisCache, SqliteCache
+
+# The backend libraries, which must be imported only by the processes using them
+BACKEND_LIBRARIES = ["pytube", "youtube_dl", "redis", "shelve", "httpx"]
+
+# Milliseconds a cold import of a module may take, with everything it imports
+IMPORT_BUDGETS_MS = {
+    "ytpodcast.youtube": 100,
+    "ytpodcast.cache": 150,
+    "ytpodcast.youtube.backends": 250,
+}
+
+
+def fresh_import(modules: List[str]) -> Dict[str, object]:
+    """Import modules in a fresh interpreter: return which backend libraries it imported and the cumulative import
+    time of every module, in microseconds."""
+    script = (
+        "import json, sys\n"
+        f"for module in {modules!r}:\n"
+        "    __import__(module)\n"
+        f"print(json.dumps([name for name in {BACKEND_LIBRARIES!r} if name in sys.modules]))\n"
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return {"imported": json.loads(process.stdout), "times": times}
+
+
+class FakeCache(MemoryCache):
+    """A cache backend provided by another package."""
+
+
+class TestABackendRegistry:
+    """Test: A backend registry..."""
+
+    def test_should_select_a_cache_backend_by_name(self, monkeypatch):
+        """A backend registry should select a cache backend by name, or through the environment."""
+        assert cache_backend("redis") is RedisCache
+        assert cache_backend() is SqliteCache
+        monkeypatch.setenv("YTPODCAST_CACHE_BACKEND", "memory")
+        assert cache_backend() is MemoryCache
+        monkeypatch.setenv("YTPODCAST_CACHE_BACKEND", "tests.test_backends:FakeCache")
+        assert cache_backend() is FakeCache
+        with pytest.raises(ValueError):
+            cache_backend("unknown")
+
+    def test_should_find_the_backends_of_the_entry_points(self, monkeypatch):
+        """A backend registry should find the backends that other packages provide through entry points."""
+        monkeypatch.setattr(
+            "ytpodcast.backends._entry_points",
+            lambda group: {"fake": "tests.test_backends:FakeCache"},
+        )
+        registry = BackendRegistry(
+            "Cache", "ytpodcast.cache_backends", "UNSET", "memory", {}
+        )
+        assert registry.get("fake") is FakeCache
+        assert registry.names() == ["fake"]
+        registry.register("memory", MemoryCache)
+        assert registry.get() is MemoryCache
+
+    def test_should_import_a_backend_only_when_selected(self):
+        """A backend registry should import a backend, and its libraries, only when it's selected."""
+        found = fresh_import(
+            ["ytpodcast.youtube", "ytpodcast.cache", "ytpodcast.youtube.backends"]
+        )
+        assert found["imported"] == []
+        script = (
+            "from ytpodcast.youtube.backends import info_backend; import sys; "
+            "info_backend('youtube_dl'); print('pytube' in sys.modules, 'youtube_dl' in sys.modules)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        assert output.stdout.split() == ["False", "True"]
+        # Only the async pytube info needs httpx
+        script = (
+            "from ytpodcast.youtube.backends import info_backend; import sys; "
+            "info_backend('pytube'); print('pytube' in sys.modules, 'httpx' in sys.modules)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        assert output.stdout.split() == ["True", "False"]
+
+
+@pytest.mark.performance
+class TestImportPerformance:
+    """Test: ImportPerformance..."""
+
+    @pytest.mark.parametrize("module", list(IMPORT_BUDGETS_MS))
+    def test_should_keep_within_the_cold_start_budget(self, module):
+        """A cold import should keep within its budget: the best of a few runs, to leave out the noise."""
+        best = min(fresh_import([module])["times"][module] for _ in range(3))
+        assert best / 1000 <= IMPORT_BUDGETS_MS[module], f"{module}: {best / 1000}ms"
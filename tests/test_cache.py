@@ -1,10 +1,24 @@
+import asyncio
 import shelve
+import sqlite3
+import threading
+import time
 
 import pytest
+from redis import UnixDomainSocketConnection
 
-from ytpodcast.youtube import Video
-from ytpodcast.cache import RedisCache, ShelveCache
-from tests.conftest import test_data as td
+from ytpodcast.youtube import Video, Unavailable, Membership
+from ytpodcast.codec import JsonCodec, decode
+from ytpodcast.cache import (
+    AsyncRedisCache,
+    RedisCache,
+    ShelveCache,
+    SqliteCache,
+    MemoryCache,
+    MISS,
+    RedisOptions,
+)
+from tests.conftest import test_data as td, build_test_videos
 
 
 class TestARedisCache:
@@ -24,7 +38,19 @@ class TestARedisCache:
         key = self.cache._key_from_id(td.video_id)
         assert redis.get(key) is None
         self.cache.save(self.video)
-        assert redis.get(key).decode("UTF-8") == td.video_data_str
+        assert decode(redis.get(key)) == self.video
+
+    def test_should_store_values_with_the_chosen_codec(
+        self, redis, reset_test_video_redis_cache
+    ):
+        """A redis cache should store values with the chosen codec, reading them back whatever the codec."""
+        RedisCache(codec=JsonCodec()).save(self.video)
+        assert redis.get(self.cache._key_from_id(td.video_id)).startswith(b"{")
+        assert self.cache.get(td.video_id) == self.video
+        self.cache.save(self.video)
+        assert len(redis.get(self.cache._key_from_id(td.video_id))) < len(
+            td.video_data_str
+        )
 
     def test_should_be_able_to_tell_if_an_object_is_cached(
         self, redis, reset_test_video_redis_cache
@@ -44,6 +70,235 @@ class TestARedisCache:
         video = self.cache.load(td.video_id)
         assert video.id == td.video_id
 
+    def test_should_be_able_to_look_up_an_object_with_a_single_call(
+        self, redis, reset_test_video_redis_cache
+    ):
+        """A redis cache should be able to look up an object with a single call."""
+        assert self.cache.get(td.video_id) is MISS
+        redis.set(self.cache._key_from_id(td.video_id), td.video_data_str)
+        assert self.cache.get(td.video_id) == self.video
+
+    def test_should_remember_unavailable_objects_for_a_while(
+        self, redis, reset_test_video_redis_cache
+    ):
+        """A redis cache should remember unavailable objects for a while."""
+        self.cache.save_unavailable(td.video_id, "private")
+        assert self.cache.get(td.video_id) == Unavailable(td.video_id, "private")
+        key = self.cache._unavailable_key_from_id(td.video_id)
+        assert 0 < redis.ttl(key) <= self.cache.unavailable_ttl
+
+    def test_should_be_able_to_store_a_record(self, redis):
+        """A redis cache should be able to store a record."""
+        key = self.cache._record_key("membership", td.playlist_id)
+        try:
+            assert self.cache.load_membership(td.playlist_id) is None
+            membership = Membership(td.playlist_id, [td.video_id], time.time())
+            self.cache.save_membership(membership)
+            assert self.cache.load_membership(td.playlist_id) == membership
+            self.cache.save_record("test", td.playlist_id, {"a": 1}, ttl=60)
+            assert self.cache.load_record("test", td.playlist_id) == {"a": 1}
+        finally:
+            redis.delete(key, self.cache._record_key("test", td.playlist_id))
+
+    def test_should_update_a_record_again_if_another_client_changed_it(self, redis):
+        """A redis cache should update a record in a transaction, updating it again if another client changed it
+        first."""
+        key = self.cache._record_key("test", td.playlist_id)
+        calls = []
+
+        def update(record):
+            if not calls:
+                redis.set(key, '{"ids": ["other"]}')
+            calls.append(record)
+            return {"ids": (record["ids"] if record else []) + ["mine"]}
+
+        try:
+            record = self.cache.update_record("test", td.playlist_id, update)
+            assert record == {"ids": ["other", "mine"]}
+            assert calls == [None, {"ids": ["other"]}]
+            assert self.cache.load_record("test", td.playlist_id) == record
+        finally:
+            redis.delete(key)
+
+    def test_should_tell_when_an_object_is_stale(
+        self, redis, reset_test_video_redis_cache
+    ):
+        """A redis cache should tell when an object is stale, and let it expire later."""
+        cache = RedisCache(ttl=0, stale_ttl=60)
+        cache.save(self.video)
+        entry = cache.lookup(td.video_id)
+        assert entry.value == self.video
+        assert entry.stale
+        assert 0 < redis.ttl(cache._key_from_id(td.video_id)) <= 60
+        assert not self.cache.lookup(td.video_id).stale
+
+    @pytest.mark.usefixtures("reset_test_videos_redis_cache")
+    def test_should_be_able_to_store_and_recover_many_objects_at_once(self):
+        """A redis cache should be able to store and recover many objects at once."""
+        videos = build_test_videos(5)
+        self.cache.save_many(videos[:3])
+        ids = [video.id for video in videos]
+        assert self.cache.cached_ids(ids) == set(ids[:3])
+        loaded = self.cache.load_many(ids)
+        assert list(loaded) == ids[:3]
+        assert loaded[ids[0]] == videos[0]
+
+    def test_should_connect_with_the_chosen_options(self):
+        """A redis cache should connect with the chosen options, or share the client it's given."""
+        options = RedisOptions(
+            unix_socket_path="/tmp/redis.sock", max_connections=4, socket_timeout=1.5
+        )
+        pool = RedisCache(options=options).r.connection_pool
+        assert pool.connection_class is UnixDomainSocketConnection
+        assert pool.max_connections == 4
+        assert pool.connection_kwargs["path"] == "/tmp/redis.sock"
+        assert pool.connection_kwargs["socket_timeout"] == 1.5
+        assert RedisCache(redis=self.cache.r).r is self.cache.r
+
+    @pytest.mark.usefixtures("reset_test_videos_redis_cache")
+    def test_should_keep_its_keys_under_its_prefix(self, redis):
+        """A redis cache should keep its keys under its prefix, apart from other caches."""
+        video = build_test_videos(1)[0]
+        cache = RedisCache(key_prefix="ytpodcast:other")
+        cache.save(video)
+        assert redis.exists(f"ytpodcast:other:video:{video.id}")
+        assert cache.get(video.id) == video
+        assert self.cache.get(video.id) is MISS
+
+
+class TestAHashRedisCache:
+    """Test: A Hash Redis Cache..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, reset_test_videos_redis_cache):
+        """TestAHashRedisCache setup"""
+        self.cache = RedisCache(
+            ttl=60, stale_ttl=60, layout="hash", compress_description_over=16
+        )
+        self.videos = build_test_videos(3)
+        self.videos[0].description = "A long description. " * 20
+
+    def test_should_store_every_video_as_a_hash(self, redis):
+        """A hash redis cache should store every video as a hash, with a compressed description if it's long."""
+        self.cache.save_many(self.videos)
+        key = self.cache._key_from_id(self.videos[0].id)
+        assert redis.type(key) == b"hash"
+        assert 0 < redis.ttl(key) <= 120
+        assert redis.hget(key, "compressed") == b"1"
+        assert len(redis.hget(key, "description")) < len(self.videos[0].description)
+        ids = [video.id for video in self.videos] + ["missing"]
+        assert self.cache.cached_ids(ids) == set(ids[:3])
+        assert self.cache.load_many(ids) == {video.id: video for video in self.videos}
+        assert self.cache.load(self.videos[0].id) == self.videos[0]
+        assert not self.cache.lookup(self.videos[0].id).stale
+
+    def test_should_read_single_fields(self):
+        """A hash redis cache should read single fields of a video, like a blob one."""
+        video = self.videos[0]
+        for cache in (self.cache, RedisCache()):
+            cache.save(video)
+            assert cache.load_fields(video.id, ["length", "description"]) == {
+                "length": video.length,
+                "description": video.description,
+            }
+            assert cache.load_fields("missing", ["thumbnail"]) is None
+            with pytest.raises(ValueError):
+                cache.load_fields(video.id, ["unknown"])
+
+    def test_should_forget_a_description_no_longer_compressed(self):
+        """A hash redis cache should forget that a description was compressed when it's saved again short."""
+        video = self.videos[0]
+        self.cache.save(video)
+        video.description = "Short."
+        self.cache.save(video)
+        assert self.cache.load(video.id) == video
+
+    def test_should_remember_unavailable_objects_for_a_while(self):
+        """A hash redis cache should remember unavailable objects for a while."""
+        self.cache.save_unavailable(self.videos[1].id, "private")
+        assert self.cache.get(self.videos[1].id) == Unavailable(
+            self.videos[1].id, "private"
+        )
+
+    def test_should_refuse_an_unknown_layout(self):
+        """A hash redis cache should be one of the known layouts."""
+        with pytest.raises(ValueError):
+            RedisCache(layout="unknown")
+
+
+class TestAnAsyncRedisCache:
+    """Test: An Async Redis Cache..."""
+
+    @pytest.mark.usefixtures("reset_test_videos_redis_cache")
+    def test_should_be_able_to_store_and_look_up_many_objects_at_once(self):
+        """An async redis cache should be able to store and look up many objects at once, sharing them with a redis
+        cache."""
+        videos = build_test_videos(5)
+        ids = [video.id for video in videos]
+
+        async def store_and_look_up():
+            cache = AsyncRedisCache()
+            try:
+                await cache.save_many(videos[:3])
+                return await cache.lookup_many(ids), await cache.get(ids[4])
+            finally:
+                await cache.close()
+
+        entries, missing = asyncio.run(store_and_look_up())
+        assert list(entries) == ids[:3]
+        assert entries[ids[0]].value == videos[0]
+        assert missing is MISS
+        assert RedisCache().load_many(ids) == {
+            video_id: entry.value for video_id, entry in entries.items()
+        }
+
+    def test_should_remember_unavailable_objects_for_a_while(
+        self, redis, reset_test_video_redis_cache
+    ):
+        """An async redis cache should remember unavailable objects for a while."""
+
+        async def remember():
+            cache = AsyncRedisCache()
+            try:
+                await cache.save_unavailable(td.video_id, "private")
+                return await cache.get(td.video_id)
+            finally:
+                await cache.close()
+
+        assert asyncio.run(remember()) == Unavailable(td.video_id, "private")
+        assert redis.ttl(RedisCache()._unavailable_key_from_id(td.video_id)) > 0
+
+    @pytest.mark.usefixtures("reset_test_playlist_redis_cache")
+    def test_should_be_able_to_store_a_membership(self):
+        """An async redis cache should be able to store a playlist membership."""
+        membership = Membership(td.playlist_id, [td.video_id], time.time())
+
+        async def store():
+            cache = AsyncRedisCache()
+            try:
+                await cache.save_membership(membership)
+                return await cache.load_membership(td.playlist_id)
+            finally:
+                await cache.close()
+
+        assert asyncio.run(store()) == membership
+
+    @pytest.mark.usefixtures("reset_test_videos_redis_cache")
+    def test_should_share_the_hash_layout_with_a_redis_cache(self):
+        """An async redis cache should share the hash layout, and its fields, with a redis cache."""
+        videos = build_test_videos(2)
+
+        async def store_and_read():
+            cache = AsyncRedisCache(layout="hash", options=RedisOptions())
+            try:
+                await cache.save_many(videos)
+                return await cache.load_fields(videos[1].id, ["title"])
+            finally:
+                await cache.close()
+
+        assert asyncio.run(store_and_read()) == {"title": videos[1].title}
+        assert RedisCache(layout="hash").get(videos[0].id) == videos[0]
+
 
 @pytest.mark.usefixtures("reset_test_video_shelve_cache")
 class TestAShelveCache:
@@ -67,7 +322,7 @@ class TestAShelveCache:
         assert cache.db[td.video_id] is not None
         del cache  # This is needed to access the db, since it will close shelve connection with the db file
         with shelve.open(self.db) as db:
-            assert db.get(td.video_id) == td.video_data_str
+            assert decode(db.get(td.video_id)) == self.video
 
     def test_should_be_able_to_tell_if_an_object_is_cached(self):
         """A Shelve cache should be able to tell if an object is cached."""
@@ -86,3 +341,301 @@ class TestAShelveCache:
         cache = ShelveCache(self.db)
         video = cache.load(td.video_id)
         assert video.id == td.video_id
+
+    def test_should_be_able_to_look_up_an_object_with_a_single_call(self):
+        """A shelve cache should be able to look up an object with a single call."""
+        cache = ShelveCache(self.db)
+        assert cache.get(td.video_id) is MISS
+        cache.save(self.video)
+        assert cache.get(td.video_id) == self.video
+
+    def test_should_remember_unavailable_objects_for_a_while(self):
+        """A shelve cache should remember unavailable objects for a while."""
+        cache = ShelveCache(self.db)
+        cache.save_unavailable(td.video_id, "private")
+        assert cache.get(td.video_id) == Unavailable(td.video_id, "private")
+        cache.save_unavailable(td.video_id, "private", ttl=-1)
+        assert cache.get(td.video_id) is MISS
+
+    def test_should_be_able_to_store_a_record(self):
+        """A shelve cache should be able to store a record."""
+        cache = ShelveCache(self.db)
+        membership = Membership(td.playlist_id, [td.video_id], time.time())
+        cache.save_membership(membership)
+        assert cache.load_membership(td.playlist_id) == membership
+        cache.save_record("test", td.playlist_id, {"a": 1}, ttl=-1)
+        assert cache.load_record("test", td.playlist_id) is None
+
+    def test_should_tell_when_an_object_is_stale_or_expired(self):
+        """A shelve cache should tell when an object is stale or expired."""
+        cache = ShelveCache(self.db, ttl=0)
+        cache.save(self.video)
+        entry = cache.lookup(td.video_id)
+        assert entry.value == self.video
+        assert entry.stale
+        cache.stale_ttl = 0
+        assert cache.lookup(td.video_id) is MISS
+        assert not cache.is_cached(td.video_id)
+
+    def test_should_be_able_to_store_and_recover_many_objects_at_once(self):
+        """A shelve cache should be able to store and recover many objects at once."""
+        videos = build_test_videos(5)
+        cache = ShelveCache(self.db)
+        cache.save_many(videos[:3])
+        ids = [video.id for video in videos]
+        assert cache.cached_ids(ids) == set(ids[:3])
+        loaded = cache.load_many(ids)
+        assert list(loaded) == ids[:3]
+        assert loaded[ids[0]] == videos[0]
+
+
+class TestASqliteCache:
+    """Test: A Sqlite Cache..."""
+
+    video: Video
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request):
+        """TestASqliteCache setup"""
+        request.cls.video = Video.from_json(td.video_data_str)
+
+    def test_should_be_able_to_store_a_value(self, test_sqlite_cache_db_path):
+        """A Sqlite Cache should be able to store a value, durably."""
+        cache = SqliteCache(test_sqlite_cache_db_path)
+        cache.save(self.video)
+        with sqlite3.connect(test_sqlite_cache_db_path) as db:
+            (data,) = db.execute(
+                "SELECT data FROM videos WHERE id = ?", (td.video_id,)
+            ).fetchone()
+        assert decode(data) == self.video
+
+    def test_should_use_wal_mode_and_index_the_fetch_time(
+        self, test_sqlite_cache, test_sqlite_cache_db_path
+    ):
+        """A Sqlite Cache should use WAL mode and index the fetch time."""
+        with sqlite3.connect(test_sqlite_cache_db_path) as db:
+            assert db.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+            indexes = db.execute("PRAGMA index_list(videos)").fetchall()
+        assert "videos_fetched_at" in [index[1] for index in indexes]
+
+    def test_should_be_able_to_look_up_an_object_with_a_single_call(
+        self, test_sqlite_cache
+    ):
+        """A Sqlite cache should be able to look up an object with a single call."""
+        assert not test_sqlite_cache.is_cached(td.video_id)
+        assert test_sqlite_cache.get(td.video_id) is MISS
+        test_sqlite_cache.save(self.video)
+        assert test_sqlite_cache.is_cached(td.video_id)
+        assert test_sqlite_cache.get(td.video_id) == self.video
+        assert test_sqlite_cache.load(td.video_id) == self.video
+
+    def test_should_remember_unavailable_objects_for_a_while(self, test_sqlite_cache):
+        """A Sqlite cache should remember unavailable objects for a while."""
+        test_sqlite_cache.save_unavailable(td.video_id, "private")
+        assert test_sqlite_cache.get(td.video_id) == Unavailable(td.video_id, "private")
+        test_sqlite_cache.save_unavailable(td.video_id, "private", ttl=-1)
+        assert test_sqlite_cache.get(td.video_id) is MISS
+
+    def test_should_be_able_to_store_a_record(self, test_sqlite_cache):
+        """A Sqlite cache should be able to store a record."""
+        assert test_sqlite_cache.load_membership(td.playlist_id) is None
+        membership = Membership(td.playlist_id, [td.video_id], time.time())
+        test_sqlite_cache.save_membership(membership)
+        assert test_sqlite_cache.load_membership(td.playlist_id) == membership
+        test_sqlite_cache.save_record("test", td.playlist_id, {"a": 1}, ttl=-1)
+        assert test_sqlite_cache.load_record("test", td.playlist_id) is None
+
+    def test_should_apply_every_concurrent_update_of_a_record(self, test_sqlite_cache):
+        """A Sqlite cache should apply every update of a record made concurrently, from many connections."""
+
+        def work():
+            for _ in range(20):
+                test_sqlite_cache.update_record(
+                    "test",
+                    td.playlist_id,
+                    lambda record: {"count": (record["count"] if record else 0) + 1},
+                )
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert test_sqlite_cache.load_record("test", td.playlist_id) == {"count": 80}
+
+    def test_should_tell_when_an_object_is_stale_or_expired(self, test_sqlite_cache):
+        """A Sqlite cache should tell when an object is stale or expired."""
+        test_sqlite_cache.save(self.video)
+        assert not test_sqlite_cache.lookup(td.video_id).stale
+        test_sqlite_cache.ttl = 0
+        entry = test_sqlite_cache.lookup(td.video_id)
+        assert entry.stale
+        assert entry.fetched_at <= time.time()
+        test_sqlite_cache.stale_ttl = 0
+        assert test_sqlite_cache.lookup(td.video_id) is MISS
+        assert test_sqlite_cache.load_many([td.video_id]) == {}
+        assert not test_sqlite_cache.is_cached(td.video_id)
+
+    def test_should_be_able_to_store_and_recover_many_objects_at_once(
+        self, test_sqlite_cache
+    ):
+        """A Sqlite cache should be able to store and recover many objects at once."""
+        videos = build_test_videos(SqliteCache.BATCH_SIZE + 5)
+        test_sqlite_cache.save_many(videos[:-2])
+        ids = [video.id for video in videos]
+        assert test_sqlite_cache.cached_ids(ids) == set(ids[:-2])
+        loaded = test_sqlite_cache.load_many(reversed(ids))
+        assert list(loaded) == list(reversed(ids[:-2]))
+        assert loaded[ids[0]] == videos[0]
+
+    def test_should_be_usable_from_many_threads(self, test_sqlite_cache):
+        """A Sqlite cache should be usable from many threads."""
+        videos = build_test_videos(40)
+        threads = [
+            threading.Thread(target=test_sqlite_cache.save_many, args=(videos[i::4],))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(test_sqlite_cache.load_many(video.id for video in videos)) == 40
+
+    def test_should_be_able_to_evict_the_oldest_objects(self, test_sqlite_cache):
+        """A Sqlite cache should be able to evict the oldest objects."""
+        videos = build_test_videos(3)
+        for video in videos:
+            test_sqlite_cache.save(video)
+        assert test_sqlite_cache.evict_oldest(max_entries=1) == 2
+        assert test_sqlite_cache.cached_ids(video.id for video in videos) == {
+            videos[-1].id
+        }
+        assert test_sqlite_cache.evict_older_than(seconds=-1) == 1
+
+    def test_should_be_able_to_import_a_shelve_cache(self, test_sqlite_cache, tmp_path):
+        """A Sqlite cache should be able to import a shelve cache, records included."""
+        shelve_path = str(tmp_path / "shelve_db")
+        shelve_cache = ShelveCache(shelve_path)
+        shelve_cache.save(self.video)
+        shelve_cache.save_unavailable("unavailable_id", "private")
+        shelve_cache.save_membership(
+            Membership(td.playlist_id, [td.video_id], fetched_at=1.0)
+        )
+        del shelve_cache
+        assert test_sqlite_cache.import_shelve(shelve_path) == 1
+        assert test_sqlite_cache.get(td.video_id) == self.video
+        assert test_sqlite_cache.get("unavailable_id") == Unavailable(
+            "unavailable_id", "private"
+        )
+        assert test_sqlite_cache.load_membership(td.playlist_id) == Membership(
+            td.playlist_id, [td.video_id], fetched_at=1.0
+        )
+
+
+class TestAMemoryCache:
+    """Test: A Memory Cache..."""
+
+    video: Video
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request):
+        """TestAMemoryCache setup"""
+        request.cls.video = Video.from_json(td.video_data_str)
+
+    def test_should_serve_hits_from_memory(self, test_sqlite_cache):
+        """A Memory cache should serve hits from memory, without asking its backend."""
+        cache = MemoryCache(backend=test_sqlite_cache)
+        cache.save(self.video)
+        test_sqlite_cache.evict_older_than(seconds=-1)
+        assert cache.get(td.video_id) is self.video
+        assert cache.stats.hits == 1
+
+    def test_should_fall_back_to_its_backend(self, test_sqlite_cache):
+        """A Memory cache should fall back to its backend, remembering what it found."""
+        test_sqlite_cache.save(self.video)
+        test_sqlite_cache.save_unavailable("unavailable_id", "private")
+        cache = MemoryCache(backend=test_sqlite_cache)
+        assert cache.get(td.video_id) == self.video
+        assert cache.get("unavailable_id") == Unavailable("unavailable_id", "private")
+        assert cache.get("missing_id") is MISS
+        assert (cache.stats.hits, cache.stats.misses) == (0, 3)
+        assert cache.get(td.video_id) == self.video
+        assert cache.stats.hits == 1
+
+    def test_should_keep_the_fetch_time_of_its_backend(self, test_sqlite_cache):
+        """A Memory cache should keep the fetch time and the ttl of its backend."""
+        test_sqlite_cache.ttl = 0
+        test_sqlite_cache.save(self.video)
+        fetched_at = test_sqlite_cache.lookup(td.video_id).fetched_at
+        cache = MemoryCache(backend=test_sqlite_cache)
+        cache.get(td.video_id)
+        entry = cache.lookup(td.video_id)
+        assert cache.stats.hits == 1
+        assert entry.stale
+        assert entry.fetched_at == fetched_at
+
+    def test_should_forget_an_unavailable_video_when_it_expires(
+        self, test_sqlite_cache
+    ):
+        """A Memory cache should forget an unavailable video when it expires, even if it keeps entries for longer."""
+        cache = MemoryCache(local_ttl=None)
+        cache.save_unavailable("unavailable_id", "private", ttl=0)
+        test_sqlite_cache.save_unavailable("other_id", "private", ttl=60)
+        test_sqlite_cache.save_unavailable("expiring_id", "private", ttl=1)
+        cache_over_backend = MemoryCache(backend=test_sqlite_cache, local_ttl=None)
+        assert cache_over_backend.lookup("expiring_id")
+        assert cache_over_backend.lookup("other_id")
+        time.sleep(1)
+        assert cache.get("unavailable_id") is MISS
+        assert cache_over_backend.get("expiring_id") is MISS
+        assert cache_over_backend.get("other_id") == Unavailable("other_id", "private")
+
+    def test_should_load_only_the_misses_from_its_backend(self, test_sqlite_cache):
+        """A Memory cache should load only the misses from its backend."""
+        videos = build_test_videos(4)
+        test_sqlite_cache.save_many(videos)
+        cache = MemoryCache(backend=test_sqlite_cache)
+        cache.save(videos[1])
+        ids = [video.id for video in videos]
+        assert list(cache.load_many(ids)) == ids
+        assert cache.cached_ids(ids) == set(ids)
+        assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+
+    def test_should_be_able_to_store_a_record(self, test_sqlite_cache):
+        """A Memory cache should be able to store a record, in its backend if any."""
+        for cache in [MemoryCache(), MemoryCache(backend=test_sqlite_cache)]:
+            cache.save_record("test", td.playlist_id, {"a": 1})
+            assert cache.load_record("test", td.playlist_id) == {"a": 1}
+            cache.update_record("test", td.playlist_id, lambda record: {"a": 2})
+        assert test_sqlite_cache.load_record("test", td.playlist_id) == {"a": 2}
+
+    def test_should_evict_the_least_recently_used_entries(self):
+        """A Memory cache should evict the least recently used entries."""
+        videos = build_test_videos(3)
+        cache = MemoryCache(max_entries=2)
+        cache.save(videos[0])
+        cache.save(videos[1])
+        cache.get(videos[0].id)
+        cache.save(videos[2])
+        assert cache.get(videos[1].id) is MISS
+        assert cache.get(videos[0].id) == videos[0]
+        assert (cache.stats.entries, cache.stats.evictions) == (2, 1)
+
+    def test_should_limit_the_memory_taken(self):
+        """A Memory cache should limit the memory taken by its entries."""
+        videos = build_test_videos(3)
+        cache = MemoryCache()
+        cache.save(videos[0])
+        size = cache.stats.bytes
+        cache = MemoryCache(max_bytes=size * 2)
+        cache.save_many(videos)
+        assert cache.stats.entries == 2
+        assert cache.stats.bytes <= size * 2
+
+    def test_should_drop_entries_after_their_ttl(self):
+        """A Memory cache should drop entries after their ttl."""
+        cache = MemoryCache(local_ttl=0.01)
+        cache.save(self.video)
+        time.sleep(0.02)
+        assert cache.get(td.video_id) is MISS
+        assert cache.stats.entries == 0
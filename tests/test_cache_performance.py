@@ -1,117 +1,107 @@
-from datetime import datetime
-import json
 import os
-import time
-from typing import Tuple, Dict, Union
+import platform
+from typing import List
 
 import pytest
 
-from ytpodcast.youtube import Video
-from ytpodcast.cache import RedisCache, ShelveCache
-from tests.conftest import test_data as td
+from tests.cache_benchmark import (
+    BACKENDS,
+    HISTORY_PATH,
+    Result,
+    Workload,
+    append_history,
+    detect_regressions,
+    format_results,
+    load_history,
+    percentile,
+    run_suite,
+)
 
 
-EntryType = Dict[str, Union[str, Dict[str, Dict[str, float]]]]
+def _env_ints(name: str, default: str) -> List[int]:
+    return [int(value) for value in os.environ.get(name, default).split(",")]
 
 
 @pytest.mark.performance
 class TestCachePerformance:
-    """Test: CachePerformance..."""
-
-    LOG_FILE_NAME = "cache_performance_results.json"
-    new_entry: EntryType
-    db: Dict[str, EntryType]
-
-    @pytest.fixture(scope="class", autouse=True)
-    def _setup(self, request):
-        """TestCachePerformance setup"""
-        videos = []
-        for video_url in td.channel_video_list:
-            video = Video.from_json(td.video_data_str)
-            video.id = video_url.replace("https://www.youtube.com/watch?v=", "")
-            videos.append(video)
-        request.cls.videos = videos
-
-        db_path = f"{request.config.rootdir}/tests/{self.LOG_FILE_NAME}"
-        if os.path.isfile(db_path):
-            with open(db_path, "r") as f:
-                db = json.load(f)
-        else:
-            db = {"entries": []}
-
-        request.cls.new_entry = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        request.cls.db = db
-
-        yield
-        db["entries"].append(request.cls.new_entry)
-        with open(db_path, "w+") as f:
-            json.dump(db, f, indent=4)
-
-    @pytest.fixture
-    def redis_performance_test(self, redis) -> Tuple[RedisCache, str]:
-        """Setup and Teardown for redis cache performance test."""
-        cache = RedisCache()
-        yield cache, "redis"
-        for video in self.videos:
-            redis.delete(cache._key_from_id(video.id))
-
-    @pytest.fixture
-    def shelve_performance_test(
-        self, test_shelve_cache_db_path
-    ) -> Tuple[ShelveCache, str]:
-        """Setup and Teardown for shelve cache performance test."""
-        cache = ShelveCache(db_file=test_shelve_cache_db_path)
-        yield cache, "shelve"
-        os.remove(test_shelve_cache_db_path)
-
-    @pytest.mark.parametrize(
-        "cache_fixture",
-        ["redis_performance_test", "shelve_performance_test"],
-        ids=["redis_cache", "shelve_cache"],
+    """Test: CachePerformance...
+
+    A quick run of the benchmark suite: set YTPODCAST_BENCHMARK_SIZES and YTPODCAST_BENCHMARK_THREADS (comma
+    separated) to run a bigger matrix, or run tests/cache_benchmark.py. The comparison with the history only runs with
+    --performance-gate."""
+
+    @pytest.mark.performance_gate
+    @pytest.mark.parametrize("backend", list(BACKENDS))
+    def test_should_not_regress(self, backend):
+        """Cache performance should not regress against the history of past runs."""
+        results = run_suite(
+            [backend],
+            sizes=_env_ints("YTPODCAST_BENCHMARK_SIZES", "1000"),
+            threads=_env_ints("YTPODCAST_BENCHMARK_THREADS", "1,8"),
+            ops=200,
+        )
+        assert all(result.throughput > 0 for result in results)
+        regressions = detect_regressions(
+            load_history(HISTORY_PATH, platform.node()), results
+        )
+        append_history(HISTORY_PATH, results)
+        assert not regressions, "\n".join(
+            [format_results(results)] + [str(regression) for regression in regressions]
+        )
+
+
+def build_result(p50_ms: float, throughput: float, threads: int = 1) -> Result:
+    return Result(
+        workload=Workload("memory", 1000, "read", "single", threads),
+        ops=100,
+        p50_ms=p50_ms,
+        p95_ms=p50_ms * 2,
+        p99_ms=p50_ms * 3,
+        throughput=throughput,
     )
-    def test_should_be_acceptable(self, cache_fixture, fixture_from_param):
-        """Cache performance should be acceptable."""
-        # Enable the setup&teardown fixture: must be called here at the start, so it will always trigger on teardown
-        cache, name = fixture_from_param(cache_fixture)
-
-        start = time.time()
-        for video in self.videos:
-            cache.save(video)
-        end = time.time()
-        write_time = (end - start) / len(self.videos) * 1000
-
-        start = time.time()
-        for video in self.videos:
-            _ = cache.load(video.id)
-        end = time.time()
-        read_time = (end - start) / len(self.videos) * 1000
-
-        self.new_entry[name] = {"read": read_time, "write": write_time}
 
-        if len(self.db["entries"]) > 0 and self.db["entries"][-1].get(name):
-            # There are past data for this cache, check against that
-            last_entry = self.db["entries"][-1][name]
 
-            # A difference of more than 30% should fail the test:
-            #   these values are highly dependent on the OS load and machine specs, so this test is only meant
-            #   as a quick way to notice if something is wrong and to compare different caches.
-            tolerance = 0.3
-
-            assert_new_time_is_close_enough(last_entry, "read", read_time, tolerance)
-            assert_new_time_is_close_enough(last_entry, "write", write_time, tolerance)
-
-
-def assert_new_time_is_close_enough(
-    last_entry: Dict[str, float], name: str, new: float, tolerance: float
-) -> None:
-    if last_entry.get(name):
-        max_time = last_entry[name] + last_entry[name] * tolerance
+class TestABenchmarkAnalysis:
+    """Test: A benchmark analysis..."""
+
+    def test_should_interpolate_percentiles(self):
+        """A benchmark analysis should interpolate percentiles between the closest ranks."""
+        samples = list(range(1, 101))
+        assert percentile(samples, 50) == 50.5
+        assert percentile(samples, 99) == pytest.approx(99.01)
+        assert percentile([3.0], 95) == 3.0
+
+    def test_should_flag_only_statistical_outliers(self):
+        """A benchmark analysis should flag a regression only for outliers of the past runs of a backend."""
+        history = [
+            {"results": [build_result(p50, 1000).to_dict()]}
+            for p50 in (1.0, 1.1, 0.9, 1.05, 0.95)
+        ]
+        assert detect_regressions(history[:4], [build_result(5.0, 1000)]) == []
+        assert detect_regressions(history, [build_result(1.15, 1000)]) == []
+        regressions = detect_regressions(history, [build_result(2.0, 400)])
+        assert {regression.key for regression in regressions} == {"memory"}
+        assert {regression.metric for regression in regressions} == {
+            "p50_ms",
+            "p95_ms",
+            "p99_ms",
+            "throughput",
+        }
 
-        if new > max_time:
-            pytest.fail(
-                f"There's a {tolerance * 100}% difference with the last {name} measure! Something is wrong."
-            )
-        else:
-            pass
+    def test_should_judge_a_backend_over_all_its_workloads(self):
+        """A benchmark analysis should judge a backend over all its workloads, not over a single noisy one."""
+        history = [
+            {
+                "results": [
+                    build_result(p50, 1000, threads).to_dict()
+                    for threads in range(1, 11)
+                ]
+            }
+            for p50 in (1.0, 1.1, 0.9, 1.05, 0.95)
+        ]
+        noisy = [build_result(3.0, 1000, 1)] + [
+            build_result(1.0, 1000, threads) for threads in range(2, 11)
+        ]
+        assert detect_regressions(history, noisy) == []
+        slower = [build_result(2.0, 1000, threads) for threads in range(1, 11)]
+        assert detect_regressions(history, slower)
@@ -0,0 +1,50 @@
+import pytest
+
+from ytpodcast.codec import BinaryCodec, JsonCodec, decode
+from ytpodcast.youtube import Video
+from tests.conftest import test_data as td
+
+
+class TestACodec:
+    """Test: A Codec..."""
+
+    video: Video
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request):
+        """TestACodec setup"""
+        request.cls.video = Video.from_json(td.video_data_str)
+
+    @pytest.mark.parametrize(
+        "codec",
+        [JsonCodec(), BinaryCodec(), BinaryCodec(compress_over=None)],
+        ids=["json", "binary", "binary_uncompressed"],
+    )
+    def test_should_encode_and_decode_a_video(self, codec):
+        """A codec should encode a video in bytes and decode it back."""
+        data = codec.encode(self.video)
+        assert isinstance(data, bytes)
+        assert codec.decode(data) == self.video
+        assert decode(data) == self.video
+
+    def test_should_compress_long_descriptions(self):
+        """A binary codec should compress long descriptions, when it's worth it."""
+        video = Video(**{**td.video_data_dict, "description": "a long one " * 200})
+        compressed = BinaryCodec(compress_over=512).encode(video)
+        plain = BinaryCodec(compress_over=None).encode(video)
+        assert len(compressed) < len(plain)
+        assert decode(compressed) == video
+
+    def test_should_be_more_compact_than_json(self):
+        """A binary codec should be more compact than json."""
+        assert len(BinaryCodec().encode(self.video)) < len(self.video.to_json())
+
+    def test_should_read_json_payloads_of_older_versions(self):
+        """A codec should read the json payloads of older versions, as str or bytes."""
+        assert decode(td.video_data_str) == self.video
+        assert decode(td.video_data_str.encode("UTF-8")) == self.video
+
+    def test_should_refuse_unknown_payloads(self):
+        """A codec should refuse payloads of unknown formats."""
+        with pytest.raises(ValueError):
+            decode(b"\xffnot a video")
@@ -0,0 +1,171 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ytpodcast.api import get_feed_url
+from ytpodcast.app import create_app
+from ytpodcast.cache import SqliteCache
+from ytpodcast.instrumentation import HIT_COUNTERS, Instrumentation
+from ytpodcast.metrics import Registry
+from ytpodcast.tracing import RecordingTracer
+from tests.conftest import build_test_videos, test_data as td
+from tests.test_scheduler import CachingFakeInfo
+
+
+class TestARegistry:
+    """Test: A Registry..."""
+
+    def test_should_render_metrics_in_the_prometheus_format(self):
+        """A registry should render its metrics in the Prometheus text format."""
+        registry = Registry()
+        registry.counter("requests_total", "Requests.", ("path",)).labels('/a"b').inc()
+        histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.labels().observe(value)
+        assert registry.render().splitlines() == [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{path="/a\\"b"} 1',
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 2',
+            'latency_seconds_bucket{le="+Inf"} 3',
+            "latency_seconds_sum 5.55",
+            "latency_seconds_count 3",
+        ]
+
+    def test_should_refuse_a_name_registered_with_another_kind(self):
+        """A registry should refuse a name already registered as another kind of metric."""
+        registry = Registry()
+        assert registry.counter("a", "A.") is registry.counter("a", "A.")
+        with pytest.raises(ValueError):
+            registry.gauge("a", "A.")
+
+    def test_should_render_metrics_while_their_labels_are_added(self):
+        """A registry should render a metric while other threads add labels to it."""
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests.", ("path",))
+        done = threading.Event()
+
+        def add_labels():
+            for i in range(20000):
+                counter.labels(f"/{i}").inc()
+            done.set()
+
+        thread = threading.Thread(target=add_labels)
+        thread.start()
+        while not done.is_set():
+            registry.render()
+        thread.join()
+        assert len(registry.render().splitlines()) == 20002
+
+
+class TestAnInstrumentation:
+    """Test: An Instrumentation..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, test_sqlite_cache):
+        """Instrument a cache."""
+        self.cache = test_sqlite_cache
+        self.tracer = RecordingTracer()
+        self.instrumentation = Instrumentation(tracer=self.tracer)
+        self.instrumentation.instrument_cache(self.cache)
+        self.labels = ("cache", "SqliteCache", "lookup_many")
+
+    def test_should_count_cache_hits_misses_and_bytes(self):
+        """An instrumentation should count the hits, misses and bytes of a cache."""
+        videos = build_test_videos(3)
+        self.cache.save_many(videos)
+        found = self.cache.lookup_many(iter([video.id for video in videos] + ["x"]))
+        assert len(found) == 3
+        instrumentation = self.instrumentation
+        assert instrumentation.hits.labels(*self.labels).value == 3
+        assert instrumentation.misses.labels(*self.labels).value == 1
+        assert instrumentation.calls.labels(*self.labels, "ok").value == 1
+        assert instrumentation.durations.labels(*self.labels).count == 1
+        assert instrumentation.in_flight.labels(*self.labels).value == 0
+        written = instrumentation.bytes.labels("SqliteCache", "write").value
+        read = instrumentation.bytes.labels("SqliteCache", "read").value
+        assert written == read > 0
+
+    def test_should_count_a_hit_or_miss_once_through_nested_calls(self):
+        """An instrumentation should count the hits and misses only in the outermost call, not in the methods of
+        the cache it calls in turn."""
+        video = build_test_videos(1)[0]
+        self.cache.save(video)
+        assert self.cache.get(video.id) == video
+        assert self.cache.load("missing") is None
+        assert self.cache.load_many([video.id, "missing"]) == {video.id: video}
+
+        def total(metric):
+            return sum(
+                metric.labels("cache", "SqliteCache", method).value
+                for method in HIT_COUNTERS
+            )
+
+        assert total(self.instrumentation.hits) == 2
+        assert total(self.instrumentation.misses) == 2
+        assert self.instrumentation.hits.labels("cache", "SqliteCache", "get").value
+
+    def test_should_count_errors(self):
+        """An instrumentation should count the calls that failed."""
+        self.cache.close()
+        self.cache.db_file = "/nonexistent/db.sqlite3"
+        with pytest.raises(Exception):
+            self.cache.lookup_many(["id"])
+        assert self.instrumentation.calls.labels(*self.labels, "error").value == 1
+        assert self.tracer.spans[-1].error is not None
+
+    def test_should_leave_alone_what_is_not_instrumented(self, tmp_path):
+        """An instrumentation should leave the objects not instrumented untouched."""
+        cache = SqliteCache(db_file=str(tmp_path / "other.sqlite3"))
+        assert "lookup" not in vars(cache)
+        assert "lookup" in vars(self.cache)
+        cache.close()
+
+    def test_should_nest_spans(self):
+        """An instrumentation should nest the spans of the calls made within another span."""
+        with self.tracer.span("request", {}) as request:
+            self.cache.load_membership("playlist")
+        spans = list(self.tracer.spans)
+        assert [span.name for span in spans] == [
+            "cache.load_record",
+            "cache.load_membership",
+            "request",
+        ]
+        assert spans[1].parent_id == request.span_id
+        assert spans[0].parent_id == spans[1].span_id
+        assert {span.trace_id for span in spans} == {request.span_id}
+
+
+class TestAMetricsEndpoint:
+    """Test: A metrics endpoint..."""
+
+    def test_should_expose_the_metrics_of_the_application(self, test_sqlite_cache):
+        """A metrics endpoint should expose the metrics of requests, info and cache."""
+        info = CachingFakeInfo(test_sqlite_cache)
+        info.playlists[td.playlist_id] = build_test_videos(2)
+        tracer = RecordingTracer()
+        client = TestClient(
+            create_app(info, instrumentation=Instrumentation(tracer=tracer))
+        )
+        assert client.get(get_feed_url(td.playlist_id)).status_code == 200
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert (
+            'ytpodcast_calls_total{component="info",backend="fake",'
+            'method="playlist_from_id",outcome="ok"} 1'
+        ) in body
+        assert (
+            'ytpodcast_http_requests_total{method="GET",'
+            'route="/api/feed/{playlist_id}",status="200"} 1'
+        ) in body
+        assert 'ytpodcast_cache_bytes_total{backend="SqliteCache"' in body
+        request = next(span for span in tracer.spans if span.name == "http.request")
+        assert any(
+            span.name == "info.playlist_from_id" and span.trace_id == request.span_id
+            for span in tracer.spans
+        )
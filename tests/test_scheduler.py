@@ -0,0 +1,187 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pytest
+
+from ytpodcast.cache import Cache
+from ytpodcast.scheduler import RefreshScheduler, SubscriptionRegistry
+from ytpodcast.youtube import Channel, Membership, Playlist, Video
+from ytpodcast.youtube.base import YouTubeInfo
+from tests.conftest import build_test_videos
+
+
+class CachingFakeInfo(YouTubeInfo):
+    """A YouTubeInfo whose playlists are set by the test, cached like a real one caches them."""
+
+    name = "fake"
+
+    def __init__(self, cache: Optional[Cache] = None, block: bool = False):
+        super().__init__(cache=cache)
+        self.playlists: Dict[str, List[Video]] = {}
+        self.built: List[str] = []
+        self.running = 0
+        self.max_running = 0
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+        self._lock = threading.Lock()
+
+    def _playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        with self._lock:
+            self.built.append(playlist_id)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+        videos = self.playlists[playlist_id]
+        if self.cache:
+            self.cache.save_many(videos)
+            self.cache.save_membership(
+                Membership(playlist_id, [video.id for video in videos], time.time())
+            )
+        return Playlist(
+            id=playlist_id,
+            title="title",
+            description="description",
+            thumbnail="thumbnail",
+            url=f"https://www.youtube.com/playlist?list={playlist_id}",
+            videos=list(videos),
+        )
+
+    def _video_from_url(self, url: str) -> Video:
+        raise NotImplementedError
+
+
+class TestASubscriptionRegistry:
+    """Test: A SubscriptionRegistry..."""
+
+    def test_should_keep_the_subscriptions_in_the_cache(self, test_sqlite_cache):
+        """A subscription registry should keep the subscriptions in the cache."""
+        SubscriptionRegistry(test_sqlite_cache).subscribe_playlist("PL1")
+        registry = SubscriptionRegistry(test_sqlite_cache)
+        registry.subscribe_channel("UC2")
+        assert registry.playlist_ids() == ["PL1", "UU2"]
+        registry.unsubscribe("PL1")
+        assert "PL1" not in SubscriptionRegistry(test_sqlite_cache)
+        assert "UU2" in SubscriptionRegistry(test_sqlite_cache)
+
+    def test_should_keep_every_concurrent_subscription(
+        self, test_sqlite_cache, monkeypatch
+    ):
+        """A subscription registry should keep every subscription, even the ones made at once by registries sharing
+        the cache."""
+        load_record = test_sqlite_cache.load_record
+
+        def slow_load_record(kind: str, key: str):
+            # Widens the window between reading and writing the subscriptions
+            record = load_record(kind, key)
+            time.sleep(0.001)
+            return record
+
+        monkeypatch.setattr(test_sqlite_cache, "load_record", slow_load_record)
+
+        def work(offset: int):
+            registry = SubscriptionRegistry(test_sqlite_cache)
+            for i in range(offset, 40, 4):
+                registry.subscribe_playlist(f"PL{i}")
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        playlist_ids = SubscriptionRegistry(test_sqlite_cache).playlist_ids()
+        assert sorted(playlist_ids) == sorted(f"PL{i}" for i in range(40))
+
+
+class TestARefreshScheduler:
+    """Test: A RefreshScheduler..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, test_sqlite_cache):
+        """Subscribe to three playlists."""
+        self.cache = test_sqlite_cache
+        self.registry = SubscriptionRegistry(self.cache)
+        self.videos = build_test_videos(4)
+        for playlist_id in ("PL1", "PL2", "PL3"):
+            self.registry.subscribe_playlist(playlist_id)
+
+    def scheduler(self, info: YouTubeInfo, **kwargs) -> RefreshScheduler:
+        info.playlists = {
+            playlist_id: self.videos[:2] for playlist_id in ("PL1", "PL2", "PL3")
+        }
+        kwargs.setdefault("jitter", 0)
+        return RefreshScheduler(info, self.registry, **kwargs)
+
+    def test_should_refresh_playlists_only_when_due(self):
+        """A refresh scheduler should refresh playlists only when they're due."""
+        info = CachingFakeInfo(self.cache)
+        scheduler = self.scheduler(info, min_interval=60, max_concurrent=3)
+        now = time.time()
+        for future in scheduler.run_pending(now):
+            future.result()
+        assert sorted(info.built) == ["PL1", "PL2", "PL3"]
+        assert scheduler.run_pending(now + 1) == []
+        for future in scheduler.run_pending(time.time() + 91):
+            future.result()
+        assert len(info.built) == 6
+        scheduler.stop()
+
+    def test_should_stay_within_its_concurrency_budget(self):
+        """A refresh scheduler should refresh at most max_concurrent playlists at a time."""
+        info = CachingFakeInfo(self.cache, block=True)
+        scheduler = self.scheduler(info, max_concurrent=2)
+        started = scheduler.run_pending()
+        assert len(started) == 2
+        assert scheduler.run_pending() == []
+        info.release.set()
+        for future in started:
+            future.result()
+        for future in scheduler.run_pending(time.time() + 24 * 60 * 60):
+            future.result()
+        assert info.max_running <= 2
+        assert len(info.built) == 4
+        scheduler.stop()
+
+    def test_should_adapt_the_interval_to_new_videos(self):
+        """A refresh scheduler should refresh more often the playlists getting new videos."""
+        self.registry.unsubscribe("PL2")
+        self.registry.unsubscribe("PL3")
+        info = CachingFakeInfo(self.cache)
+        scheduler = self.scheduler(info, min_interval=60, max_interval=1000)
+        scheduler.run_pending()[0].result()
+        subscription = scheduler.subscriptions["PL1"]
+        assert subscription.interval == 90
+        scheduler.run_pending(time.time() + 1000)[0].result()
+        assert subscription.interval == 135
+        info.playlists["PL1"] = self.videos[1:]
+        scheduler.run_pending(time.time() + 1000)[0].result()
+        assert subscription.interval == 67.5
+        scheduler.stop()
+
+    def test_should_write_playlists_into_the_cache(self):
+        """A refresh scheduler should write the playlists it refreshes into the cache."""
+        info = CachingFakeInfo(self.cache)
+        scheduler = self.scheduler(info, max_concurrent=3)
+        assert info.cached_playlist("PL1") is None
+        for future in scheduler.run_pending():
+            future.result()
+        playlist = info.cached_playlist("PL1")
+        assert playlist.title == "title"
+        assert playlist.videos == self.videos[:2]
+        scheduler.stop()
+
+    def test_should_refresh_from_a_background_thread(self):
+        """A refresh scheduler should refresh the subscribed playlists from a background thread."""
+        info = CachingFakeInfo(self.cache)
+        scheduler = self.scheduler(info, max_concurrent=3, poll_interval=0.01)
+        scheduler.start()
+        deadline = time.monotonic() + 5
+        while len(info.built) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scheduler.stop()
+        assert sorted(info.built) == ["PL1", "PL2", "PL3"]
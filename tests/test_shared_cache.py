@@ -0,0 +1,212 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from ytpodcast.cache import MISS, MemoryCache
+from ytpodcast.shared_cache import SEQUENCE, SharedMemoryCache
+from ytpodcast.youtube import Unavailable
+from tests.conftest import build_test_videos, test_data as td
+
+# Saves count copies of a video to the segment at path from another process, rounds times
+WRITER = """
+import sys
+from ytpodcast.shared_cache import SharedMemoryCache
+from ytpodcast.youtube import Video
+
+path, data, count, rounds = sys.argv[1:]
+cache = SharedMemoryCache(path=path)
+videos = [Video.from_json(data) for _ in range(int(count))]
+for i, video in enumerate(videos):
+    video.id = f"{video.id}_{i}"
+for _ in range(int(rounds)):
+    for video in videos:
+        cache.save(video)
+"""
+
+
+def run_writer(path: str, count: int, rounds: int = 1) -> subprocess.Popen:
+    """Save the videos of build_test_videos(count) from another process."""
+    arguments = [path, td.video_data_str, str(count), str(rounds)]
+    return subprocess.Popen([sys.executable, "-c", WRITER, *arguments])
+
+
+class TestASharedMemoryCache:
+    """Test: A shared memory cache..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        """Open a segment in a temporary directory."""
+        self.path = str(tmp_path / "segment")
+        self.cache = SharedMemoryCache(path=self.path, max_bytes=1024 * 1024)
+        yield
+        self.cache.close()
+
+    def test_should_be_able_to_store_and_recover_objects(self):
+        """A shared memory cache should be able to store and recover videos, unavailable videos and records."""
+        videos = build_test_videos(3)
+        self.cache.save_many(videos)
+        self.cache.save_unavailable("private", "private video", ttl=60)
+        self.cache.save_record("membership", td.playlist_id, {"ids": ["a", "b"]})
+        assert self.cache.load(videos[1].id) == videos[1]
+        assert self.cache.is_cached(videos[0].id)
+        assert self.cache.get("private") == Unavailable("private", "private video")
+        assert self.cache.get("missing") is MISS
+        assert list(
+            self.cache.lookup_many(["missing", videos[2].id, videos[0].id])
+        ) == [
+            videos[2].id,
+            videos[0].id,
+        ]
+        assert self.cache.cached_ids([videos[0].id, "private"]) == {videos[0].id}
+        assert self.cache.load_record("membership", td.playlist_id) == {
+            "ids": ["a", "b"]
+        }
+        self.cache.clear()
+        assert self.cache.get(videos[0].id) is MISS
+
+    def test_should_replace_an_object_saved_again(self):
+        """A shared memory cache should serve the last version of a video saved more than once."""
+        video = build_test_videos(1)[0]
+        self.cache.save(video)
+        video.title = "New title"
+        self.cache.save(video)
+        assert self.cache.load(video.id).title == "New title"
+        assert self.cache.stats.entries == 1
+
+    def test_should_evict_the_oldest_objects_when_full(self):
+        """A shared memory cache should evict the oldest videos when it's full, keeping every other one reachable."""
+        cache = SharedMemoryCache(path=self.path + "-small", max_bytes=64 * 1024)
+        videos = build_test_videos(1000)
+        for video in videos:
+            cache.save(video)
+        cached = cache.cached_ids(video.id for video in videos)
+        assert videos[0].id not in cached
+        assert videos[-1].id in cached
+        assert len(cached) == cache.stats.entries
+        assert cache.stats.evictions > 0
+        assert cache.stats.bytes <= 64 * 1024
+        for video in videos[-len(cached) :]:
+            assert cache.load(video.id) == video
+        cache.close()
+
+    def test_should_be_shared_with_other_processes(self):
+        """A shared memory cache should serve the videos another process saved, without asking its backend."""
+        run_writer(self.path, 10).wait(timeout=30)
+        backend = MemoryCache()
+        cache = SharedMemoryCache(path=self.path, backend=backend)
+        assert cache.load_many(video.id for video in build_test_videos(10)) == {
+            video.id: video for video in build_test_videos(10)
+        }
+        assert backend.stats.misses == 0
+        cache.close()
+
+    def test_should_never_serve_a_torn_object(self):
+        """A shared memory cache should serve either the video or a miss while another process writes, never a
+        half written video."""
+        videos = {video.id: video for video in build_test_videos(50)}
+        writer = run_writer(self.path, 50, rounds=40)
+        reads = 0
+        while writer.poll() is None:
+            for video_id, video in videos.items():
+                found = self.cache.get(video_id)
+                assert found is MISS or found == video
+                reads += 1
+        assert writer.returncode == 0
+        assert reads > 0
+
+    def test_should_reset_a_segment_left_halfway_through_a_write(self):
+        """A shared memory cache should drop what a writer that died halfway through a write left."""
+        video = build_test_videos(1)[0]
+        self.cache.save(video)
+        self.cache._set_counter(SEQUENCE, self.cache._counter(SEQUENCE) + 1)
+        assert self.cache.get(video.id) is MISS
+        other = build_test_videos(2)[1]
+        self.cache.save(other)
+        assert self.cache.get(video.id) is MISS
+        assert self.cache.load(other.id) == other
+
+    def test_should_fill_itself_from_its_backend(self):
+        """A shared memory cache should save in the segment the videos it found in its backend."""
+        backend = MemoryCache()
+        videos = build_test_videos(2)
+        backend.save_many(videos)
+        cache = SharedMemoryCache(path=self.path, backend=backend)
+        assert cache.lookup(videos[0].id).value == videos[0]
+        assert self.cache.load(videos[0].id) == videos[0]
+        assert self.cache.get(videos[1].id) is MISS
+        cache.close()
+
+    def test_should_keep_an_unavailable_video_only_as_long_as_its_backend(self):
+        """A shared memory cache should forget an unavailable video it found in its backend when it expires there."""
+        backend = MemoryCache()
+        backend.save_unavailable("private", "private video", ttl=1)
+        cache = SharedMemoryCache(path=self.path, backend=backend)
+        assert cache.lookup("private")
+        time.sleep(1)
+        assert self.cache.get("private") is MISS
+        cache.close()
+
+    def test_should_be_usable_from_many_threads(self):
+        """A shared memory cache should be usable from many threads at once."""
+        videos = build_test_videos(20)
+
+        def work(offset: int):
+            for video in videos[offset::4]:
+                self.cache.save(video)
+                assert self.cache.load(video.id) == video
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(self.cache.cached_ids(video.id for video in videos)) == 20
+
+    def test_should_apply_every_concurrent_update_of_a_record(self):
+        """A shared memory cache should apply every update of a record made concurrently, from many instances."""
+        caches = [SharedMemoryCache(path=self.path) for _ in range(4)]
+
+        def work(cache: SharedMemoryCache):
+            for _ in range(20):
+                cache.update_record(
+                    "test",
+                    td.playlist_id,
+                    lambda record: {"count": (record["count"] if record else 0) + 1},
+                )
+
+        threads = [threading.Thread(target=work, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for cache in caches:
+            cache.close()
+        assert self.cache.load_record("test", td.playlist_id) == {"count": 80}
+
+    def test_should_exclude_the_writers_of_other_instances_in_the_same_process(self):
+        """A shared memory cache should keep the other instances on its segment from writing while it writes, even
+        in the same process and when a third one is closed meanwhile."""
+        other = SharedMemoryCache(path=self.path)
+        closed = SharedMemoryCache(path=self.path)
+        video = build_test_videos(1)[0]
+        writer = threading.Thread(target=other.save, args=(video,))
+        with self.cache._writing():
+            closed.close()
+            writer.start()
+            writer.join(timeout=0.2)
+            assert writer.is_alive()
+        writer.join(timeout=5)
+        assert self.cache.load(video.id) == video
+        other.close()
+
+    def test_should_tell_when_an_object_is_stale(self):
+        """A shared memory cache should tell when a video is stale."""
+        cache = SharedMemoryCache(path=self.path, ttl=0, stale_ttl=60)
+        video = build_test_videos(1)[0]
+        cache.save(video)
+        time.sleep(0.01)
+        assert cache.lookup(video.id).stale
+        cache.close()
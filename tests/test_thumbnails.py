@@ -0,0 +1,182 @@
+import asyncio
+import os
+from typing import List, Tuple
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from ytpodcast.api import get_feed_url, get_thumbnail_url
+from ytpodcast.app import create_app
+from ytpodcast.thumbnails import ThumbnailStore, sniff_extension
+from tests.conftest import build_test_videos, test_data as td
+from tests.test_app import FakeInfo
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+class FakeYtimg:
+    """An i.ytimg.com stand-in for httpx, serving an image made from the path of every url."""
+
+    def __init__(self):
+        self.requests: List[str] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(str(request.url))
+        if request.url.path.startswith("/missing"):
+            return httpx.Response(404)
+        return httpx.Response(200, content=PNG + request.url.path.encode() * 50)
+
+
+class CountingResize:
+    """A resize keeping images as they are, counting how many it was asked for."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data: bytes, size: int) -> Tuple[bytes, str]:
+        self.calls += 1
+        return data, sniff_extension(data)
+
+
+class TestAThumbnailStore:
+    """Test: A thumbnail store..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        """Build a store downloading from a fake i.ytimg.com."""
+        self.directory = str(tmp_path)
+        self.upstream = FakeYtimg()
+        self.resize = CountingResize()
+
+    def store(self, max_bytes: int = 1024 * 1024) -> ThumbnailStore:
+        return ThumbnailStore(
+            self.directory,
+            max_bytes=max_bytes,
+            resize=self.resize,
+            client=httpx.AsyncClient(transport=httpx.MockTransport(self.upstream)),
+        )
+
+    def test_should_download_and_resize_a_thumbnail_once(self):
+        """A thumbnail store should download and resize a thumbnail once, even if it's asked for concurrently."""
+        store = self.store()
+        url = "https://i.ytimg.com/vi/a/maxresdefault.jpg"
+
+        async def ask():
+            return await asyncio.gather(*(store.artwork(url) for _ in range(5)))
+
+        artworks = asyncio.run(ask())
+        assert len({artwork.path for artwork in artworks}) == 1
+        artwork = artworks[0]
+        assert artwork.media_type == "image/png"
+        with open(artwork.path, "rb") as f:
+            assert f.read().startswith(PNG)
+        assert asyncio.run(store.artwork(url)) == artwork
+        assert self.upstream.requests == [url]
+        assert self.resize.calls == 1
+
+    def test_should_store_the_same_artwork_once(self):
+        """A thumbnail store should store the same artwork once, whatever the urls it's made from."""
+        store = self.store()
+        first = store.store("https://i.ytimg.com/a", PNG)
+        second = store.store("https://i.ytimg.com/b", PNG)
+        assert first == second
+        assert store.total_bytes == len(PNG)
+
+    def test_should_evict_the_least_recently_used_artwork(self):
+        """A thumbnail store should keep within its quota, evicting the least recently used artwork first."""
+        store = self.store(max_bytes=250)
+        first = store.store("https://i.ytimg.com/1", PNG + b"1" * 100)
+        second = store.store("https://i.ytimg.com/2", PNG + b"2" * 100)
+        assert store.lookup("https://i.ytimg.com/1") == first
+        third = store.store("https://i.ytimg.com/3", PNG + b"3" * 100)
+        assert store.total_bytes <= 250
+        assert not os.path.exists(second.path)
+        assert store.lookup("https://i.ytimg.com/2") is None
+        assert store.lookup("https://i.ytimg.com/1") == first
+        assert store.lookup("https://i.ytimg.com/3") == third
+
+    def test_should_remove_the_index_entries_of_the_evicted_artwork(self):
+        """A thumbnail store should remove the index entries pointing to the artwork it evicts, even the ones it
+        stored before a restart."""
+        store = self.store(max_bytes=250)
+        store.store("https://i.ytimg.com/1", PNG + b"1" * 100)
+        store.store("https://i.ytimg.com/2", PNG + b"2" * 100)
+        store = self.store(max_bytes=250)
+        store.store("https://i.ytimg.com/3", PNG + b"3" * 100)
+        store.store("https://i.ytimg.com/4", PNG + b"4" * 100)
+        assert len(os.listdir(os.path.join(self.directory, "urls"))) == 2
+        assert store.lookup("https://i.ytimg.com/1") is None
+        assert store.lookup("https://i.ytimg.com/4") is not None
+
+    def test_should_prune_the_index_entries_left_pointing_to_evicted_artwork(self):
+        """A thumbnail store should drop an index entry left pointing to artwork it doesn't have, like one another
+        process evicted, when it restarts and when it's read."""
+        store = self.store()
+        artwork = store.store("https://i.ytimg.com/1", PNG)
+        store.store("https://i.ytimg.com/2", PNG + b"2")
+        os.remove(artwork.path)
+        store = self.store()
+        urls = os.path.join(self.directory, "urls")
+        assert len(os.listdir(urls)) == 1
+        name = os.path.relpath(artwork.path, os.path.join(self.directory, "objects"))
+        with open(
+            os.path.join(urls, store._url_key("https://i.ytimg.com/1")), "w"
+        ) as f:
+            f.write(name)
+        assert store.lookup("https://i.ytimg.com/1") is None
+        assert len(os.listdir(urls)) == 1
+        assert store.lookup("https://i.ytimg.com/2") is not None
+
+    def test_should_survive_a_restart(self):
+        """A thumbnail store should find again what it stored before a restart."""
+        artwork = self.store().store("https://i.ytimg.com/a", PNG)
+        store = self.store()
+        assert store.lookup("https://i.ytimg.com/a") == artwork
+        assert store.total_bytes == len(PNG)
+
+
+class TestAThumbnailEndpoint:
+    """Test: A thumbnail endpoint..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path, test_sqlite_cache):
+        """Build an app serving the artwork of a fake i.ytimg.com."""
+        self.upstream = FakeYtimg()
+        videos = build_test_videos(2)
+        videos[1].thumbnail = "https://i.ytimg.com/missing.jpg"
+        test_sqlite_cache.save_many(videos)
+        info = FakeInfo(videos)
+        info.cache = test_sqlite_cache
+        self.thumbnails = ThumbnailStore(
+            str(tmp_path),
+            resize=CountingResize(),
+            client=httpx.AsyncClient(transport=httpx.MockTransport(self.upstream)),
+        )
+        self.client = TestClient(create_app(info, thumbnails=self.thumbnails))
+        self.videos = videos
+
+    def test_should_serve_the_artwork_of_a_video(self):
+        """A thumbnail endpoint should serve the artwork of a video, for clients to keep."""
+        url = get_thumbnail_url(self.videos[0].id)
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert "max-age=" in response.headers["cache-control"]
+        assert response.content.startswith(PNG)
+        etag = response.headers["etag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert len(self.upstream.requests) == 1
+
+    def test_should_answer_bad_gateway_when_the_thumbnail_is_missing(self):
+        """A thumbnail endpoint should answer bad gateway when YouTube doesn't serve the thumbnail."""
+        response = self.client.get(get_thumbnail_url(self.videos[1].id))
+        assert response.status_code == 502
+
+    def test_should_be_linked_by_the_feeds(self):
+        """A thumbnail endpoint should serve the artwork linked by the feeds."""
+        response = self.client.get(get_feed_url(td.playlist_id))
+        artwork = f"http://testserver{get_thumbnail_url(self.videos[0].id)}"
+        assert f'<itunes:image href="{artwork}"'.encode() in response.content
+        assert self.videos[0].thumbnail.encode() not in response.content
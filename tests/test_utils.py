@@ -1,4 +1,9 @@
-from ytpodcast.utils import video_url_from_id, playlist_url_from_id
+from ytpodcast.utils import (
+    video_url_from_id,
+    video_id_from_url,
+    playlist_url_from_id,
+    uploads_playlist_id,
+)
 from tests.conftest import test_data as td
 
 
@@ -12,3 +17,13 @@ def test_can_return_the_full_playlist_url_from_the_id():
     """Can return the full playlist url from the id."""
     url = playlist_url_from_id(td.playlist_id)
     assert url == td.playlist_url
+
+
+def test_can_return_the_video_id_from_the_full_url():
+    """Can return the video id from the full url."""
+    assert video_id_from_url(td.video_url) == td.video_id
+
+
+def test_can_return_the_uploads_playlist_id_of_a_channel():
+    """Can return the id of the uploads playlist of a channel."""
+    assert uploads_playlist_id("UCabcdef") == "UUabcdef"
@@ -0,0 +1,200 @@
+import time
+from typing import List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ytpodcast.api import get_feed_url
+from ytpodcast.app import create_app
+from ytpodcast.cache import MemoryCache
+from ytpodcast.scheduler import RefreshScheduler, SubscriptionRegistry
+from ytpodcast.youtube import UploadsPage, UpstreamUnavailableError, Video
+from ytpodcast.youtube.base import ChannelCrawler, YouTubeInfo
+from ytpodcast.youtube.governor import CircuitBreaker, UpstreamGovernor
+from tests.test_scheduler import CachingFakeInfo
+from tests.youtube.test_youtube import fake_video_from_url
+
+CHANNEL_ID = "UCchannel"
+
+
+class PagedChannelInfo(YouTubeInfo, ChannelCrawler):
+    """A YouTubeInfo whose channel uploads are set by the test, served page_size at a time: the continuation of a
+    page is the id of the upload after it, so that it keeps working when new uploads come."""
+
+    name = "fake"
+
+    def __init__(self, uploads: List[str], page_size: int = 3, **kwargs):
+        super().__init__(**kwargs)
+        self.uploads = uploads
+        self.page_size = page_size
+        self.pages: List[Optional[str]] = []
+        self.fetched: List[str] = []
+        self.expired = False
+
+    def _playlist_from_id(self, playlist_id: str, limit: Optional[int] = None):
+        raise NotImplementedError
+
+    def _video_from_url(self, url: str) -> Video:
+        video = fake_video_from_url(url)
+        self.fetched.append(video.id)
+        return video
+
+    def _uploads_page(
+        self, channel_id: str, continuation: Optional[str] = None
+    ) -> UploadsPage:
+        self.pages.append(continuation)
+        if continuation is not None and self.expired:
+            raise ValueError("Invalid continuation")
+        offset = self.uploads.index(continuation) if continuation else 0
+        end = offset + self.page_size
+        return UploadsPage(
+            video_ids=self.uploads[offset:end],
+            continuation=self.uploads[end] if end < len(self.uploads) else None,
+            info={
+                "title": "channel",
+                "description": "description",
+                "url": f"https://www.youtube.com/channel/{channel_id}",
+            },
+        )
+
+
+def refresh(info: YouTubeInfo, registry: SubscriptionRegistry) -> None:
+    """Refresh once every subscription of registry."""
+    scheduler = RefreshScheduler(info, registry)
+    for day in range(2):
+        for future in scheduler.run_pending(time.time() + day * 24 * 60 * 60):
+            future.result()
+    scheduler.stop()
+
+
+class TestAChannelCrawl:
+    """Test: A channel crawl..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Build a channel with ten uploads, served three at a time."""
+        self.cache = MemoryCache()
+        self.uploads = [f"id{i}" for i in range(10)]
+        self.info = PagedChannelInfo(self.uploads, cache=self.cache)
+
+    def test_should_resume_where_the_last_crawl_stopped(self):
+        """A channel crawl should read a few pages a call, resuming from the continuation it cached."""
+        channel = self.info.channel_from_id(CHANNEL_ID, max_pages=2)
+        assert [video.id for video in channel.videos] == self.uploads[:6]
+        assert channel.title == "channel"
+        assert self.info.pages == [None, "id3"]
+        assert self.cache.load_record("crawl", CHANNEL_ID) == {
+            "continuation": "id6",
+            "complete": False,
+        }
+        info = PagedChannelInfo(self.uploads, cache=self.cache)
+        channel = info.channel_from_id(CHANNEL_ID, max_pages=2)
+        assert [video.id for video in channel.videos] == self.uploads
+        assert info.pages == [None, "id6", "id9"]
+        assert info.fetched == self.uploads[6:]
+        assert self.cache.load_record("crawl", CHANNEL_ID)["complete"]
+
+    def test_should_find_the_new_uploads_first(self):
+        """A channel crawl should walk from the first page down to the first upload it knows, then go on with the
+        back catalogue."""
+        self.info.channel_from_id(CHANNEL_ID, max_pages=2)
+        self.info.uploads = ["new0", "new1", "new2", "new3"] + self.uploads
+        self.info.pages = []
+        channel = self.info.channel_from_id(CHANNEL_ID, limit=5, max_pages=1)
+        assert [video.id for video in channel.videos] == [
+            "new0",
+            "new1",
+            "new2",
+            "new3",
+            "id0",
+        ]
+        assert self.info.pages == [None, "new3", "id6"]
+        assert self.cache.load_membership(CHANNEL_ID).video_ids == (
+            ["new0", "new1", "new2", "new3"] + self.uploads[:9]
+        )
+
+    def test_should_restart_when_its_continuation_expired(self):
+        """A channel crawl should start again from the first page when its continuation expired, keeping what it
+        found and without fetching it again."""
+        self.info.channel_from_id(CHANNEL_ID, max_pages=1)
+        self.info.expired = True
+        channel = self.info.channel_from_id(CHANNEL_ID, max_pages=1)
+        assert [video.id for video in channel.videos] == self.uploads[:3]
+        assert self.cache.load_record("crawl", CHANNEL_ID)["continuation"] is None
+        self.info.expired = False
+        self.info.pages = []
+        for _ in range(2):
+            channel = self.info.channel_from_id(CHANNEL_ID, max_pages=1)
+        assert [video.id for video in channel.videos] == self.uploads[:6]
+        assert self.info.pages == [None, None, None, "id3"]
+        assert self.info.fetched == self.uploads[:6]
+
+    def test_should_serve_what_it_found_while_youtube_is_unavailable(self):
+        """A channel crawl should serve the uploads it found so far while YouTube is unavailable."""
+        self.info.channel_from_id(CHANNEL_ID, max_pages=1)
+        self.info.governor = UpstreamGovernor(breaker=CircuitBreaker(1))
+        self.info.governor.breaker.record_failure()
+        channel = self.info.channel_from_id(CHANNEL_ID)
+        assert [video.id for video in channel.videos] == self.uploads[:3]
+        assert channel.title == "channel"
+        with pytest.raises(UpstreamUnavailableError):
+            self.info.channel_from_id("UCother")
+
+    def test_should_be_spread_over_the_refreshes_of_a_scheduler(self):
+        """A channel crawl should go on at every refresh of a channel subscribed with crawl."""
+        registry = SubscriptionRegistry(self.cache)
+        registry.subscribe_channel(CHANNEL_ID, crawl=True)
+        scheduler = RefreshScheduler(self.info, registry, channel_limit=2)
+        for day in range(1, 5):
+            for future in scheduler.run_pending(time.time() + day * 24 * 60 * 60):
+                future.result()
+        scheduler.stop()
+        assert self.cache.load_membership(CHANNEL_ID).video_ids == self.uploads
+        assert self.cache.load_record("crawl", CHANNEL_ID)["complete"]
+
+    def test_should_fetch_every_upload_once_without_a_cache(self):
+        """A channel crawl without a cache should fetch the uploads it returns only once."""
+        info = PagedChannelInfo(self.uploads)
+        channel = info.channel_from_id(CHANNEL_ID, max_pages=2)
+        assert [video.id for video in channel.videos] == self.uploads[:6]
+        assert info.fetched == self.uploads[:6]
+
+    def test_should_be_read_from_the_cache(self):
+        """A channel crawl should be readable from the cache only, as far as it went."""
+        assert self.info.cached_channel(CHANNEL_ID) is None
+        self.info.channel_from_id(CHANNEL_ID, max_pages=1)
+        channel = self.info.cached_channel(CHANNEL_ID, limit=2)
+        assert [video.id for video in channel.videos] == self.uploads[:2]
+        assert channel.title == "channel"
+        assert channel.thumbnail == channel.videos[0].thumbnail
+        assert self.info.cached_channel("UCother") is None
+
+    def test_should_serve_the_feed_of_a_channel_subscribed_with_crawl(self):
+        """A channel crawl should be what the feed of a channel subscribed with crawl serves, from the cache once
+        a refresh crawled it."""
+        registry = SubscriptionRegistry(self.cache)
+        registry.subscribe_channel(CHANNEL_ID, crawl=True)
+        body = TestClient(create_app(self.info, registry=registry)).get(
+            get_feed_url(CHANNEL_ID)
+        )
+        assert all(f"watch?v={video_id}" in body.text for video_id in self.uploads)
+        self.info.uploads = ["new0"] + self.uploads
+        refresh(self.info, registry)
+        pages = list(self.info.pages)
+        body = TestClient(create_app(self.info, registry=registry)).get(
+            get_feed_url(CHANNEL_ID)
+        )
+        assert "watch?v=new0" in body.text
+        assert self.info.pages == pages
+
+    def test_should_be_left_to_the_infos_that_can_crawl(self):
+        """A channel crawl should be left to the infos that can crawl: the others refresh a channel subscribed with
+        crawl as a playlist."""
+        info = CachingFakeInfo(self.cache)
+        info.playlists[CHANNEL_ID] = []
+        registry = SubscriptionRegistry(self.cache)
+        registry.subscribe_channel(CHANNEL_ID, crawl=True)
+        refresh(info, registry)
+        assert info.built == [CHANNEL_ID]
+        with pytest.raises(TypeError):
+            info.channel_from_id(CHANNEL_ID)
@@ -0,0 +1,318 @@
+import asyncio
+from typing import List, Optional
+from urllib.error import HTTPError, URLError
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from ytpodcast.api import get_feed_url
+from ytpodcast.app import create_app
+from ytpodcast.cache import MemoryCache
+from ytpodcast.youtube import PytubeInfo, UpstreamUnavailableError, Video
+from ytpodcast.youtube import VideoUnavailableError
+from ytpodcast.youtube.base import YouTubeInfo
+from ytpodcast.youtube.governor import (
+    FATAL,
+    INTERRUPTED,
+    OK,
+    THROTTLED,
+    TRANSIENT,
+    AdaptiveConcurrency,
+    CircuitBreaker,
+    TokenBucket,
+    UpstreamGovernor,
+    classify,
+)
+from ytpodcast.utils import video_id_from_url
+from tests.conftest import build_test_videos, test_data as td
+from tests.test_scheduler import CachingFakeInfo
+
+
+class FakeClock:
+    """A clock moving only when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def http_error(code: int, retry_after: Optional[str] = None) -> HTTPError:
+    headers = {"Retry-After": retry_after} if retry_after else {}
+    return HTTPError("https://www.youtube.com", code, "error", headers, None)
+
+
+class FlakyInfo(YouTubeInfo):
+    """A YouTubeInfo whose videos fail with the errors set by the test, then succeed."""
+
+    name = "fake"
+
+    def __init__(self, errors: List[Exception], **kwargs):
+        super().__init__(**kwargs)
+        self.errors = errors
+        self.calls = 0
+
+    def _playlist_from_id(self, playlist_id: str, limit: Optional[int] = None):
+        raise NotImplementedError
+
+    def _video_from_url(self, url: str) -> Video:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        video = build_test_videos(1)[0]
+        video.title = "fresh"
+        return video
+
+
+def build_governor(**kwargs) -> UpstreamGovernor:
+    """A governor that doesn't sleep, recording the backoffs instead."""
+    sleeps = []
+    governor = UpstreamGovernor(sleep=sleeps.append, jitter=lambda: 1.0, **kwargs)
+    governor.sleeps = sleeps
+    return governor
+
+
+class TestAnUpstreamErrorClassification:
+    """Test: An upstream error classification..."""
+
+    def test_should_tell_throttling_from_transient_and_fatal_errors(self):
+        """An upstream error classification should tell throttling from transient and fatal errors."""
+        request = httpx.Request("GET", "https://www.youtube.com")
+        throttled = httpx.HTTPStatusError(
+            "", request=request, response=httpx.Response(429, request=request)
+        )
+        assert classify(http_error(429)) == THROTTLED
+        assert classify(throttled) == THROTTLED
+        assert classify(Exception("ERROR: HTTP Error 429: Too Many Requests")) == (
+            THROTTLED
+        )
+        assert classify(http_error(503)) == TRANSIENT
+        assert classify(URLError("timed out")) == TRANSIENT
+        assert classify(httpx.ConnectTimeout("timed out")) == TRANSIENT
+        assert classify(http_error(404)) == FATAL
+        assert classify(VideoUnavailableError(td.video_id, "private")) == FATAL
+        assert classify(KeyError("title")) == FATAL
+
+    def test_should_remember_only_the_failures_for_good(self):
+        """An upstream error classification should let a video be remembered as failed only if it's unavailable or
+        YouTube refused it, not after an error nobody knows."""
+        unavailable = VideoUnavailableError(td.video_id, "private")
+        assert YouTubeInfo._failure_reason(unavailable) == "private"
+        assert YouTubeInfo._failure_reason(http_error(404)) is not None
+        assert YouTubeInfo._failure_reason(http_error(429)) is None
+        assert YouTubeInfo._failure_reason(http_error(503)) is None
+        assert YouTubeInfo._failure_reason(KeyError("title")) is None
+
+
+class TestATokenBucket:
+    """Test: A token bucket..."""
+
+    def test_should_hand_out_tokens_at_its_rate(self):
+        """A token bucket should hand out a burst of tokens, and then tokens at its rate."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+        clock.now += 10
+        assert bucket.reserve() == 0
+
+
+class TestAnAdaptiveConcurrency:
+    """Test: An adaptive concurrency..."""
+
+    def test_should_grow_while_calls_go_well_and_shrink_when_throttled(self):
+        """An adaptive concurrency should grow additively while calls go well, and shrink multiplicatively, once
+        per interval, when they're throttled."""
+        clock = FakeClock()
+        concurrency = AdaptiveConcurrency(initial=4, maximum=8, clock=clock)
+        for _ in range(4):
+            assert concurrency.try_enter()
+        assert not concurrency.try_enter()
+        for _ in range(4):
+            concurrency.exit(OK, 0.1)
+        assert 4.9 < concurrency.limit < 5
+        for _ in range(3):
+            assert concurrency.try_enter()
+            concurrency.exit(THROTTLED, 0.1)
+        assert 2.4 < concurrency.limit < 2.5
+        clock.now += 1
+        concurrency.try_enter()
+        concurrency.exit(OK, 60)
+        assert 1.2 < concurrency.limit < 1.25
+        concurrency.try_enter()
+        concurrency.exit(INTERRUPTED, 60)
+        assert 1.2 < concurrency.limit < 1.25
+
+
+class TestACircuitBreaker:
+    """Test: A circuit breaker..."""
+
+    def test_should_open_and_let_a_single_probe_through_later(self):
+        """A circuit breaker should open after failures in a row and let a single probe through later."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.rejecting and not breaker.allow()
+        clock.now += 30
+        assert not breaker.rejecting
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.rejecting
+        clock.now += 30
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.allow() and breaker.allow()
+
+
+class TestAnUpstreamGovernor:
+    """Test: An upstream governor..."""
+
+    def test_should_retry_with_a_jittered_exponential_backoff(self):
+        """An upstream governor should retry throttled calls, backing off exponentially or as asked."""
+        governor = build_governor(backoff_base=1, backoff_cap=8)
+        errors = [http_error(429), http_error(503), http_error(429, "20")]
+        info = FlakyInfo(errors)
+        assert governor.call(info._video_from_url, "url").title == "fresh"
+        assert governor.sleeps == [1, 2, 8]
+        assert governor.concurrency.in_flight == 0
+
+    def test_should_not_retry_a_fatal_error(self):
+        """An upstream governor should not retry an error that would fail again, like an unavailable video."""
+        governor = build_governor()
+        info = FlakyInfo([VideoUnavailableError(td.video_id, "private")])
+        with pytest.raises(VideoUnavailableError):
+            governor.call(info._video_from_url, "url")
+        assert info.calls == 1
+        assert governor.breaker.failures == 0
+
+    def test_should_give_up_and_stop_calling_an_unhealthy_upstream(self):
+        """An upstream governor should give up after its attempts, and stop calling an unhealthy upstream."""
+        governor = build_governor(
+            max_attempts=2, breaker=CircuitBreaker(failure_threshold=3)
+        )
+        info = FlakyInfo([http_error(429)] * 3)
+        with pytest.raises(UpstreamUnavailableError):
+            governor.call(info._video_from_url, "url")
+        with pytest.raises(UpstreamUnavailableError) as error:
+            governor.call(info._video_from_url, "url")
+        assert info.calls == 3
+        assert not governor.available
+        assert error.value.retry_after > 0
+
+    def test_should_govern_coroutines(self):
+        """An upstream governor should pace and retry coroutines too."""
+        governor = UpstreamGovernor(
+            bucket=TokenBucket(rate=1000), backoff_base=0.001, max_attempts=3
+        )
+        errors = [http_error(429), URLError("timed out")]
+
+        async def fetch() -> str:
+            if errors:
+                raise errors.pop(0)
+            return "fetched"
+
+        assert asyncio.run(governor.call_async(fetch)) == "fetched"
+        assert governor.concurrency.in_flight == 0
+
+    def test_should_not_count_an_interrupted_call(self):
+        """An upstream governor should count a call cancelled or interrupted before it answered neither as a
+        success nor as a failure, letting another probe through."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        governor = build_governor(breaker=breaker, clock=clock)
+        breaker.record_failure()
+        clock.now += 30
+        info = FlakyInfo([KeyboardInterrupt()])
+        with pytest.raises(KeyboardInterrupt):
+            governor.call(info._video_from_url, "url")
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(governor.call_async(cancelled))
+        assert breaker.state == breaker.HALF_OPEN
+        assert breaker.failures == 1
+        assert governor.concurrency.in_flight == 0
+        assert governor.call(info._video_from_url, "url").title == "fresh"
+        assert breaker.state == breaker.CLOSED
+
+
+class TestAGovernedYouTubeInfo:
+    """Test: A governed YouTubeInfo..."""
+
+    def test_should_serve_a_stale_video_while_youtube_is_unavailable(self):
+        """A governed YouTubeInfo should serve a stale cached video while YouTube is unavailable."""
+        cache = MemoryCache(ttl=0, stale_ttl=3600)
+        video = build_test_videos(1)[0]
+        cache.save(video)
+        governor = build_governor(max_attempts=2)
+        info = FlakyInfo([http_error(429)] * 2, cache=cache, governor=governor)
+        assert info.video_from_id(video.id) == video
+        assert info.video_from_id(video.id).title == "fresh"
+        info.errors = [http_error(429)] * 2
+        with pytest.raises(UpstreamUnavailableError):
+            info.video_from_id("missing")
+
+    def test_should_serve_a_cached_playlist_while_youtube_is_unavailable(self):
+        """A governed YouTubeInfo should serve a playlist from the cache, without asking YouTube, while it's
+        unavailable, and answer 503 for the rest."""
+        cache = MemoryCache()
+        governor = build_governor(breaker=CircuitBreaker(failure_threshold=1))
+        info = CachingFakeInfo(cache)
+        info.governor = governor
+        info.playlists[td.playlist_id] = build_test_videos(2)
+        info.playlist_from_id(td.playlist_id)
+        governor.breaker.record_failure()
+        assert info.playlist_from_id(td.playlist_id).videos == build_test_videos(2)
+        assert info.built == [td.playlist_id]
+        response = TestClient(create_app(info)).get(get_feed_url("other"))
+        assert response.status_code == 503
+        assert int(response.headers["retry-after"]) > 0
+
+    def test_should_govern_the_pages_of_a_pytube_playlist(self, monkeypatch):
+        """A governed PytubeInfo should ask for every page of a playlist through its governor, retrying the ones
+        that failed instead of cutting the playlist short."""
+        pages = {
+            None: (["/watch?v=a", "/watch?v=b"], "next"),
+            "next": (["/watch?v=c"], None),
+        }
+        errors = [http_error(503)]
+        asked = []
+
+        def page(playlist, continuation):
+            asked.append(continuation)
+            if continuation == "next" and errors:
+                raise errors.pop(0)
+            return pages[continuation]
+
+        monkeypatch.setattr(PytubeInfo, "_playlist_page", staticmethod(page))
+        governor = build_governor()
+        urls = list(PytubeInfo._playlist_urls(object(), governor))
+        assert [video_id_from_url(url) for url in urls] == ["a", "b", "c"]
+        assert asked == [None, "next", "next"]
+        assert governor.sleeps == [0.5]
+
+
+class TestAPytubeField:
+    """Test: A pytube field..."""
+
+    def test_should_fall_back_only_when_missing(self):
+        """A pytube field should fall back to its default only when it's missing, not when the request failed."""
+
+        class FakePlaylist:
+            @property
+            def title(self):
+                return {}["title"]
+
+            @property
+            def description(self):
+                raise http_error(429)
+
+        assert PytubeInfo._get_field(FakePlaylist(), "title", "default") == "default"
+        with pytest.raises(HTTPError):
+            PytubeInfo._get_field(FakePlaylist(), "description")
@@ -0,0 +1,168 @@
+from typing import Dict, List, Union
+
+import pytest
+
+from ytpodcast.feed import FeedCache, content_version
+from ytpodcast.utils import video_url_from_id
+from ytpodcast.youtube import PytubeInfo, Video, VideoUnavailableError
+from ytpodcast.youtube.lazy import LazyVideo, LazyVideos
+from tests.conftest import test_data as td
+from tests.youtube.test_youtube import FakePlaylist, fake_video_from_url
+
+
+class FakeBatchResolver:
+    """Resolve batches of urls without any network call, remembering every batch."""
+
+    def __init__(self, unavailable: List[str] = ()):
+        self.unavailable = unavailable
+        self.batches: List[List[str]] = []
+
+    def __call__(self, urls: List[str]) -> Dict[str, Union[Video, Exception]]:
+        self.batches.append(urls)
+        results = {}
+        for url in urls:
+            video = fake_video_from_url(url)
+            if video.id in self.unavailable:
+                results[video.id] = VideoUnavailableError(video.id, "private")
+            else:
+                results[video.id] = video
+        return results
+
+
+class TestLazyVideos:
+    """Test: LazyVideos..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """Build the urls of a playlist."""
+        self.urls = [video_url_from_id(f"id{i}") for i in range(10)]
+        self.resolve = FakeBatchResolver(unavailable=["id7"])
+        self.videos = LazyVideos(self.urls, self.resolve, batch_size=4)
+
+    def test_should_know_ids_and_urls_without_resolving(self):
+        """LazyVideos should know the ids and urls of the videos without resolving them."""
+        assert len(self.videos) == 10
+        assert [self.videos.peek(i).id for i in range(10)] == [
+            f"id{i}" for i in range(10)
+        ]
+        assert self.videos.peek(-1).url == "/api/stream/id9"
+        assert self.resolve.batches == []
+        with pytest.raises(IndexError):
+            self.videos.peek(10)
+
+    def test_should_resolve_a_batch_on_first_access(self):
+        """LazyVideos should resolve the batch of a video on the first access to one of its fields."""
+        video = self.videos.peek(5)
+        assert isinstance(video, LazyVideo)
+        assert self.resolve.batches == []
+        assert video.title == fake_video_from_url(self.urls[5]).title
+        assert self.videos[4].length == fake_video_from_url(self.urls[4]).length
+        assert self.resolve.batches == [self.urls[4:8]]
+
+    def test_should_equal_the_resolved_videos(self):
+        """LazyVideos should equal the videos they resolve to."""
+        assert self.videos[:3] == [fake_video_from_url(url) for url in self.urls[:3]]
+        assert fake_video_from_url(self.urls[0]) == self.videos[0]
+
+    def test_should_leave_out_the_videos_that_failed(self):
+        """LazyVideos should leave out the videos that failed when iterated, telling why instead of raising it."""
+        assert self.videos.peek(7).error is None
+        assert [video.id for video in self.videos] == [
+            f"id{i}" for i in range(10) if i != 7
+        ]
+        assert self.videos.errors == {
+            "id7": str(VideoUnavailableError("id7", "private"))
+        }
+        assert self.videos.peek(7).error == self.videos.errors["id7"]
+        assert self.videos.peek(7).title == ""
+
+    def test_should_raise_for_the_videos_that_failed_when_indexed(self):
+        """LazyVideos should count the videos that failed, and raise why they failed when they're indexed."""
+        assert len(self.videos) == 10
+        with pytest.raises(VideoUnavailableError) as error:
+            self.videos[7]
+        assert error.value.video_id == "id7"
+        assert error.value.reason == self.videos.errors["id7"]
+        with pytest.raises(VideoUnavailableError):
+            self.videos[6:8]
+        assert self.videos[-2].id == "id8"
+        assert self.resolve.batches == [self.urls[4:8], self.urls[8:]]
+
+
+class TestALazyPytubeInfo:
+    """Test: A lazy PytubeInfo..."""
+
+    @pytest.fixture(autouse=True)
+    def fake_pytube(self, monkeypatch):
+        """Replace every pytube network call, counting the videos fetched."""
+        self.fetched = []
+
+        def counting_video_from_url(url: str) -> Video:
+            self.fetched.append(url)
+            return fake_video_from_url(url)
+
+        monkeypatch.setattr("ytpodcast.youtube.pytube._Playlist", FakePlaylist)
+        monkeypatch.setattr(
+            PytubeInfo, "_playlist_page", staticmethod(FakePlaylist.page)
+        )
+        monkeypatch.setattr(
+            PytubeInfo, "_video_from_url", staticmethod(counting_video_from_url)
+        )
+        FakePlaylist.urls = [video_url_from_id(f"id{i}") for i in range(50, 0, -1)]
+
+    def test_should_return_a_playlist_before_resolving_its_videos(
+        self, test_sqlite_cache
+    ):
+        """A lazy PytubeInfo should return a playlist resolving only the videos it needs."""
+        info = PytubeInfo(cache=test_sqlite_cache, lazy=True, batch_size=10)
+        playlist = info.playlist_from_id(td.playlist_id)
+        assert len(playlist.videos) == 50
+        # Not even the first batch, for the thumbnail of the playlist
+        assert self.fetched == []
+        assert playlist.thumbnail == ""
+        assert [video.title for video in playlist.videos[:15]]
+        assert len(self.fetched) == 20
+        assert test_sqlite_cache.lookup("id41").value == playlist.videos[9]
+
+    def test_should_render_a_feed_around_the_videos_that_failed(self, monkeypatch):
+        """A lazy PytubeInfo should build a playlist whose first video failed, and its feed should be checked without
+        resolving its videos and rendered without the ones that failed."""
+
+        def video_from_url(url: str) -> Video:
+            self.fetched.append(url)
+            if url in (video_url_from_id("id50"), video_url_from_id("id25")):
+                raise VideoUnavailableError(url, "private")
+            return fake_video_from_url(url)
+
+        monkeypatch.setattr(PytubeInfo, "_video_from_url", staticmethod(video_from_url))
+        info = PytubeInfo(lazy=True, batch_size=10)
+        playlist = info.playlist_from_id(td.playlist_id)
+        content_version(playlist, "http://testserver/")
+        assert self.fetched == []
+        body = FeedCache().update(playlist, "http://testserver/").body
+        assert len(self.fetched) == 50
+        # The thumbnail of the feed is the one of its first video that didn't fail
+        thumbnail = fake_video_from_url(video_url_from_id("id49")).thumbnail
+        assert f'<itunes:image href="{thumbnail}"'.encode() in body
+        assert b"watch?v=id49" in body
+        assert b"watch?v=id25" not in body
+
+    def test_should_leave_out_the_videos_that_failed(
+        self, test_sqlite_cache, monkeypatch
+    ):
+        """A lazy PytubeInfo should leave out of a playlist the videos that failed, telling why in its errors as they're
+        reached."""
+
+        def video_from_url(url: str) -> Video:
+            if url == video_url_from_id("id45"):
+                raise VideoUnavailableError("id45", "private")
+            if url == video_url_from_id("id30"):
+                raise KeyError("title")
+            return fake_video_from_url(url)
+
+        monkeypatch.setattr(PytubeInfo, "_video_from_url", staticmethod(video_from_url))
+        info = PytubeInfo(cache=test_sqlite_cache, lazy=True, batch_size=10)
+        playlist = info.playlist_from_id(td.playlist_id)
+        assert playlist.errors == {}
+        assert len(list(playlist.videos)) == 48
+        assert playlist.errors == {"id45": "private", "id30": "KeyError: 'title'"}
@@ -42,3 +42,9 @@ class TestAVideo:
         video = Video.from_json(td.video_data_str)
         assert isinstance(video, Video)
         assert video.id == self.video.id
+
+    def test_should_not_have_an_instance_dict(self):
+        """A video should use slots instead of an instance dict."""
+        assert not hasattr(self.video, "__dict__")
+        with pytest.raises(AttributeError):
+            self.video.not_a_field = True
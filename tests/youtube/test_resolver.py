@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from ytpodcast.youtube.resolver import ParallelResolver
+
+
+class TestAParallelResolver:
+    """Test: A ParallelResolver..."""
+
+    def test_should_keep_the_order_of_the_urls(self):
+        """A ParallelResolver should keep the order of the urls."""
+        urls = [f"https://www.youtube.com/watch?v={i}" for i in range(20)]
+
+        def fn(url):
+            # Make later urls complete first
+            time.sleep((20 - int(url.split("=")[-1])) / 1000)
+            return url
+
+        assert ParallelResolver(workers=8).resolve(fn, urls) == urls
+
+    def test_should_not_cancel_the_other_urls_on_a_failure(self):
+        """A ParallelResolver should not cancel the other urls on a failure."""
+        urls = ["https://a/1", "https://a/2", "https://a/3"]
+        done = []
+
+        def fn(url):
+            if url.endswith("1"):
+                raise ValueError(url)
+            done.append(url)
+            return url
+
+        results = ParallelResolver(workers=2).resolve(fn, urls)
+        assert isinstance(results[0], ValueError)
+        assert results[1:] == urls[1:]
+        assert sorted(done) == urls[1:]
+
+    def test_should_cap_the_concurrency_per_host(self):
+        """A ParallelResolver should cap the concurrency per host."""
+        urls = [f"https://host{i % 2}/{i}" for i in range(12)]
+        running = {"host0": 0, "host1": 0}
+        peak = {"host0": 0, "host1": 0}
+        lock = threading.Lock()
+
+        def fn(url):
+            host = url.split("/")[2]
+            with lock:
+                running[host] += 1
+                peak[host] = max(peak[host], running[host])
+            time.sleep(0.01)
+            with lock:
+                running[host] -= 1
+            return url
+
+        ParallelResolver(workers=8, max_per_host=2).resolve(fn, urls)
+        assert peak == {"host0": 2, "host1": 2}
+
+    def test_should_refuse_an_empty_pool(self):
+        """A ParallelResolver should refuse an empty pool."""
+        with pytest.raises(ValueError):
+            ParallelResolver(workers=0)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ytpodcast.cache import MemoryCache
+from ytpodcast.youtube.singleflight import (
+    AsyncSingleFlight,
+    RedisSingleFlight,
+    SingleFlight,
+)
+from tests.conftest import build_test_videos, test_data as td
+from tests.test_scheduler import CachingFakeInfo
+
+
+class TestASingleFlight:
+    """Test: A SingleFlight..."""
+
+    def test_should_run_concurrent_calls_with_the_same_key_once(self):
+        """A SingleFlight should run concurrent calls with the same key once, sharing the result."""
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.1)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: flight.do("key", fn), range(8)))
+        assert results == ["result"] * 8
+        assert len(calls) == 1
+        assert flight.do("key", fn) == "result"
+        assert len(calls) == 2
+
+    def test_should_share_the_exception_of_a_call(self):
+        """A SingleFlight should share the exception of a call with the waiting ones."""
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def fn():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, "key", fn)
+            started.wait()
+            follower = executor.submit(flight.do, "key", fn)
+            for future in (leader, follower):
+                with pytest.raises(ValueError):
+                    future.result()
+
+    def test_should_run_calls_with_different_keys_separately(self):
+        """A SingleFlight should run calls with different keys separately."""
+        flight = SingleFlight()
+        assert flight.do("a", lambda: 1) == 1
+        assert flight.do("b", lambda: 2) == 2
+
+
+class TestARedisSingleFlight:
+    """Test: A RedisSingleFlight..."""
+
+    def test_should_wait_for_another_process_holding_the_lock(self, redis):
+        """A RedisSingleFlight should wait for another process holding the lock, then use its result."""
+        flight = RedisSingleFlight(redis, poll_interval=0.01)
+        other = redis.lock(flight._lock_key("key"), timeout=5, thread_local=False)
+        assert other.acquire(blocking=False)
+        threading.Timer(0.1, other.release).start()
+        started = time.monotonic()
+        assert flight.do("key", lambda: "mine", lambda: "theirs") == "theirs"
+        assert time.monotonic() - started >= 0.1
+
+    def test_should_run_the_call_if_there_is_no_result_to_use(self, redis):
+        """A RedisSingleFlight should run the call itself if the other process left no result to use."""
+        flight = RedisSingleFlight(redis, wait_timeout=0.05, poll_interval=0.01)
+        other = redis.lock(flight._lock_key("key"), timeout=5, thread_local=False)
+        assert other.acquire(blocking=False)
+        try:
+            assert flight.do("key", lambda: "mine", lambda: None) == "mine"
+        finally:
+            other.release()
+
+    def test_should_hold_the_lock_while_running(self, redis):
+        """A RedisSingleFlight should hold the lock of a key while running its call, and release it."""
+        flight = RedisSingleFlight(redis)
+        key = flight._lock_key("key")
+        assert flight.do("key", lambda: redis.exists(key)) == 1
+        assert not redis.exists(key)
+
+    def test_should_coalesce_the_builds_of_a_playlist_across_processes(self, redis):
+        """A RedisSingleFlight should let a process serve the playlist another process built, without building it
+        again."""
+        cache = MemoryCache()
+        infos = [CachingFakeInfo(cache, block=True), CachingFakeInfo(cache)]
+        for info in infos:
+            # Each process has its own SingleFlight: only the Redis lock is shared
+            info.single_flight = RedisSingleFlight(redis, poll_interval=0.01)
+            info.playlists[td.playlist_id] = build_test_videos(2)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(infos[0].playlist_from_id, td.playlist_id)
+            while not infos[0].built:
+                time.sleep(0.01)
+            follower = executor.submit(infos[1].playlist_from_id, td.playlist_id)
+            time.sleep(0.1)
+            infos[0].release.set()
+            assert follower.result().videos == leader.result().videos
+        assert infos[1].built == []
+
+
+class TestAnAsyncSingleFlight:
+    """Test: An AsyncSingleFlight..."""
+
+    def test_should_run_concurrent_calls_with_the_same_key_once(self):
+        """An AsyncSingleFlight should run concurrent calls with the same key once, sharing the result."""
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("key", fn) for _ in range(8)))
+
+        assert asyncio.run(main()) == ["result"] * 8
+        assert len(calls) == 1
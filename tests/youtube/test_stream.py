@@ -0,0 +1,79 @@
+import time
+from types import SimpleNamespace
+
+from pytube.query import StreamQuery
+
+from ytpodcast.youtube import PytubeStream
+from ytpodcast.youtube.base import YouTubeStream
+from tests.conftest import test_data as td
+
+
+class FakeStream(YouTubeStream):
+    """A YouTubeStream resolving signed urls expiring in expires_in seconds, counting the resolutions."""
+
+    name = "fake"
+
+    def __init__(self, expires_in: int, **kwargs):
+        super().__init__(**kwargs)
+        self.expires_in = expires_in
+        self.resolved = 0
+
+    def _stream_url_from_id(self, video_id: str) -> str:
+        self.resolved += 1
+        expire = int(time.time()) + self.expires_in
+        return f"https://rr1.googlevideo.com/videoplayback?id={video_id}&expire={expire}&n={self.resolved}"
+
+
+class TestAYouTubeStream:
+    """Test: A YouTubeStream..."""
+
+    def test_should_cache_a_stream_url_until_shortly_before_it_expires(
+        self, test_sqlite_cache
+    ):
+        """A YouTubeStream should cache a stream url until shortly before it expires."""
+        stream = FakeStream(expires_in=6 * 60 * 60, cache=test_sqlite_cache)
+        url = stream.stream_url(td.video_id)
+        assert stream.stream_url(td.video_id) == url
+        assert stream.resolved == 1
+        record = test_sqlite_cache.load_record("stream", td.video_id)
+        assert record["url"] == url
+
+    def test_should_not_cache_a_stream_url_about_to_expire(self, test_sqlite_cache):
+        """A YouTubeStream should not cache a stream url about to expire."""
+        stream = FakeStream(expires_in=60, cache=test_sqlite_cache, expire_margin=120)
+        assert stream.stream_url(td.video_id) != stream.stream_url(td.video_id)
+        assert stream.resolved == 2
+        assert test_sqlite_cache.load_record("stream", td.video_id) is None
+
+
+class TestAPytubeStream:
+    """Test: A PytubeStream..."""
+
+    def test_should_pick_the_best_m4a_audio_stream(self, monkeypatch):
+        """A PytubeStream should pick the m4a audio stream of the highest bitrate, which the feeds declare, over a
+        webm/opus one of a higher bitrate."""
+
+        def stream(itag: int, mime_type: str, abr: str, video: bool = False):
+            return SimpleNamespace(
+                itag=itag,
+                mime_type=mime_type,
+                abr=abr,
+                includes_audio_track=True,
+                includes_video_track=video,
+                url=f"https://rr1.googlevideo.com/videoplayback?itag={itag}",
+            )
+
+        streams = StreamQuery(
+            [
+                stream(18, "video/mp4", "96kbps", video=True),
+                stream(139, "audio/mp4", "48kbps"),
+                stream(140, "audio/mp4", "128kbps"),
+                stream(251, "audio/webm", "160kbps"),
+            ]
+        )
+        monkeypatch.setattr(
+            "ytpodcast.youtube.pytube.YouTube",
+            lambda url: SimpleNamespace(streams=streams),
+        )
+        url = PytubeStream().stream_url(td.video_id)
+        assert url.endswith("itag=140")
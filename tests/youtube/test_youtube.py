@@ -1,14 +1,36 @@
-from typing import Type
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Type, List, Optional, Tuple
 
+import httpx
 import pytest
+from youtube_dl.utils import DownloadError
 
-from ytpodcast.cache import Cache
-from ytpodcast.utils import video_url_from_id
-from ytpodcast.youtube import Video, Playlist, PytubeInfo
+from ytpodcast.cache import MISS, AsyncRedisCache, Cache
+from ytpodcast.utils import video_url_from_id, playlist_url_from_id
+from ytpodcast.youtube import (
+    AsyncPytubeInfo,
+    Video,
+    Playlist,
+    PytubeInfo,
+    VideoUnavailableError,
+    YoutubeDLInfo,
+)
+from ytpodcast.youtube.backends import info_backend
 from ytpodcast.youtube.base import YouTubeInfo
 from tests.conftest import vcr_record, test_data as td, forbid_network_calls
 
 
+def fake_video_from_url(url: str) -> Video:
+    """Build a Video from a url without any network call."""
+    video = Video.from_json(td.video_data_str)
+    video.id = url.replace("https://www.youtube.com/watch?v=", "")
+    return video
+
+
 @vcr_record
 @pytest.mark.parametrize("info_cls", [PytubeInfo])
 class TestAYouTubeInfoImplementation:
@@ -34,6 +56,41 @@ class TestAYouTubeInfoImplementation:
         for video in playlist.videos:
             assert video_url_from_id(video.id) in td.playlist_video_list
 
+    def test_should_be_able_to_get_a_playlist_in_parallel(
+        self, info_cls: Type[YouTubeInfo], monkeypatch
+    ):
+        """A YouTubeInfo implementation should be able to get a Playlist resolving its videos in parallel."""
+        # vcrpy is not thread safe: only the playlist listing is replayed, single videos are faked
+        monkeypatch.setattr(
+            info_cls, "_video_from_url", staticmethod(fake_video_from_url)
+        )
+        playlist = info_cls(workers=4, max_per_host=2).playlist_from_id(td.playlist_id)
+        assert isinstance(playlist, Playlist)
+        assert [video_url_from_id(video.id) for video in playlist.videos] == list(
+            td.playlist_video_list
+        )
+
+    @pytest.mark.usefixtures("reset_test_playlist_redis_cache")
+    def test_can_read_a_playlist_from_a_cache(
+        self, info_cls: Type[YouTubeInfo], test_redis_cache, monkeypatch
+    ):
+        """A YouTubeInfo implementation can read the videos of a Playlist from a Cache, fetching only the missing ones."""
+        cached = [fake_video_from_url(url) for url in td.playlist_video_list[1:]]
+        test_redis_cache.save_many(cached)
+        fetched = []
+
+        def video_from_url(url: str) -> Video:
+            fetched.append(url)
+            return fake_video_from_url(url)
+
+        monkeypatch.setattr(info_cls, "_video_from_url", staticmethod(video_from_url))
+        playlist = info_cls(cache=test_redis_cache).playlist_from_id(td.playlist_id)
+        assert fetched == td.playlist_video_list[:1]
+        assert [video_url_from_id(video.id) for video in playlist.videos] == list(
+            td.playlist_video_list
+        )
+        assert test_redis_cache.is_cached(playlist.videos[0].id)
+
     def test_should_be_able_to_get_part_of_a_playlist_from_the_id(
         self, info_cls: Type[YouTubeInfo]
     ):
@@ -50,8 +107,10 @@ class TestAYouTubeInfoImplementation:
         [
             ["test_shelve_cache", "reset_test_video_shelve_cache"],
             ["test_redis_cache", "reset_test_video_redis_cache"],
+            ["test_sqlite_cache", "reset_test_video_sqlite_cache"],
+            ["test_memory_cache", "reset_test_video_redis_cache"],
         ],
-        ids=["shelve_cache", "redis_cache"],
+        ids=["shelve_cache", "redis_cache", "sqlite_cache", "memory_cache"],
     )
     def test_can_write_to_a_cache(
         self,
@@ -74,8 +133,10 @@ class TestAYouTubeInfoImplementation:
         [
             ["test_shelve_cache", "reset_test_video_shelve_cache"],
             ["test_redis_cache", "reset_test_video_redis_cache"],
+            ["test_sqlite_cache", "reset_test_video_sqlite_cache"],
+            ["test_memory_cache", "reset_test_video_redis_cache"],
         ],
-        ids=["shelve_cache", "redis_cache"],
+        ids=["shelve_cache", "redis_cache", "sqlite_cache", "memory_cache"],
     )
     def test_can_read_from_a_cache(
         self,
@@ -94,3 +155,468 @@ class TestAYouTubeInfoImplementation:
         with forbid_network_calls():
             cached_video = info.video_from_id(td.video_id)
         assert video.id == cached_video.id
+
+    def test_should_remember_unavailable_videos(
+        self,
+        info_cls: Type[YouTubeInfo],
+        test_redis_cache,
+        reset_test_video_redis_cache,
+        monkeypatch,
+    ):
+        """A YouTubeInfo implementation should remember unavailable videos, without asking YouTube again."""
+        calls = []
+
+        def video_from_url(url: str) -> Video:
+            calls.append(url)
+            raise VideoUnavailableError(td.video_id, "private")
+
+        monkeypatch.setattr(info_cls, "_video_from_url", staticmethod(video_from_url))
+        info = info_cls(cache=test_redis_cache)
+        for _ in range(2):
+            with pytest.raises(VideoUnavailableError) as e:
+                info.video_from_id(td.video_id)
+            assert e.value.reason == "private"
+        assert calls == [td.video_url]
+
+    @pytest.mark.parametrize("stale_while_revalidate", [True, False])
+    def test_should_refresh_stale_videos(
+        self,
+        info_cls: Type[YouTubeInfo],
+        test_sqlite_cache,
+        monkeypatch,
+        stale_while_revalidate,
+    ):
+        """A YouTubeInfo implementation should refresh stale videos, in the background if asked to."""
+        stale = fake_video_from_url(td.video_url)
+        test_sqlite_cache.save(stale)
+        test_sqlite_cache.ttl = 0
+        refreshed = threading.Event()
+
+        def video_from_url(url: str) -> Video:
+            video = fake_video_from_url(url)
+            video.title = "new title"
+            refreshed.set()
+            return video
+
+        monkeypatch.setattr(info_cls, "_video_from_url", staticmethod(video_from_url))
+        info = info_cls(
+            cache=test_sqlite_cache, stale_while_revalidate=stale_while_revalidate
+        )
+        video = info.video_from_id(td.video_id)
+        if stale_while_revalidate:
+            assert video.title == stale.title
+            assert refreshed.wait(timeout=5)
+            info._refresher.shutdown(wait=True)
+        else:
+            assert video.title == "new title"
+        assert test_sqlite_cache.get(td.video_id).title == "new title"
+
+
+class FakePlaylist:
+    """A pytube Playlist stand-in, serving its urls a page of one without any network call and counting how many
+    are walked."""
+
+    urls: List[str] = []
+    walked = 0
+
+    def __init__(self, url: str):
+        self.title = "title"
+        self.description = "description"
+        self.playlist_url = url
+
+    @staticmethod
+    def page(
+        playlist: "FakePlaylist", continuation: Optional[str]
+    ) -> Tuple[List[str], Optional[str]]:
+        """Stand in for PytubeInfo._playlist_page: the continuation is the index of the next url."""
+        index = int(continuation or 0)
+        if index >= len(FakePlaylist.urls):
+            return [], None
+        FakePlaylist.walked += 1
+        end = index + 1
+        return (
+            [FakePlaylist.urls[index].replace("https://www.youtube.com", "")],
+            str(end) if end < len(FakePlaylist.urls) else None,
+        )
+
+
+class TestAPytubeInfo:
+    """Test: A PytubeInfo..."""
+
+    @pytest.fixture(autouse=True)
+    def fake_pytube(self, monkeypatch):
+        """Replace every pytube network call."""
+        monkeypatch.setattr("ytpodcast.youtube.pytube._Playlist", FakePlaylist)
+        monkeypatch.setattr(
+            PytubeInfo, "_playlist_page", staticmethod(FakePlaylist.page)
+        )
+        monkeypatch.setattr(
+            PytubeInfo, "_video_from_url", staticmethod(fake_video_from_url)
+        )
+        FakePlaylist.urls = [video_url_from_id(f"id{i}") for i in range(10, 0, -1)]
+        FakePlaylist.walked = 0
+
+    def test_should_refresh_a_playlist_walking_only_its_new_videos(
+        self, test_sqlite_cache
+    ):
+        """A PytubeInfo should refresh a playlist walking only its new videos."""
+        info = PytubeInfo(cache=test_sqlite_cache)
+        playlist = info.playlist_from_id(td.playlist_id)
+        assert len(playlist.videos) == 10
+        assert FakePlaylist.walked == 10
+
+        FakePlaylist.urls = [video_url_from_id("id12"), video_url_from_id("id11")]
+        FakePlaylist.urls += [video_url_from_id(f"id{i}") for i in range(10, 0, -1)]
+        FakePlaylist.walked = 0
+        playlist = info.playlist_from_id(td.playlist_id, limit=5)
+        assert FakePlaylist.walked == 3
+        assert [video.id for video in playlist.videos] == [
+            "id12",
+            "id11",
+            "id10",
+            "id9",
+            "id8",
+        ]
+        assert len(test_sqlite_cache.load_membership(td.playlist_id).video_ids) == 12
+
+    def test_should_rebuild_a_playlist_once_in_a_while(self, test_sqlite_cache):
+        """A PytubeInfo should rebuild a playlist walking all its videos once in a while."""
+        info = PytubeInfo(cache=test_sqlite_cache, playlist_rebuild_after=0)
+        info.playlist_from_id(td.playlist_id)
+        FakePlaylist.urls = FakePlaylist.urls[1:]
+        FakePlaylist.walked = 0
+        playlist = info.playlist_from_id(td.playlist_id)
+        assert FakePlaylist.walked == 9
+        assert playlist.url == playlist_url_from_id(td.playlist_id)
+        assert len(test_sqlite_cache.load_membership(td.playlist_id).video_ids) == 9
+
+    def test_should_coalesce_concurrent_requests_for_the_same_video(self, monkeypatch):
+        """A PytubeInfo should coalesce concurrent requests for the same video in a single fetch."""
+        fetched = []
+
+        def slow_video_from_url(url: str) -> Video:
+            fetched.append(url)
+            time.sleep(0.1)
+            return fake_video_from_url(url)
+
+        monkeypatch.setattr(
+            PytubeInfo, "_video_from_url", staticmethod(slow_video_from_url)
+        )
+        info = PytubeInfo()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            videos = list(executor.map(lambda _: info.video_from_id("id1"), range(4)))
+        assert len(fetched) == 1
+        assert all(video.id == "id1" for video in videos)
+
+    def test_should_not_remember_a_partial_walk(self, test_sqlite_cache):
+        """A PytubeInfo should not remember a partial walk of a playlist."""
+        info = PytubeInfo(cache=test_sqlite_cache)
+        playlist = info.playlist_from_id(td.playlist_id, limit=2)
+        assert len(playlist.videos) == 2
+        assert test_sqlite_cache.load_membership(td.playlist_id) is None
+
+    def test_should_leave_out_the_videos_that_failed(
+        self, test_sqlite_cache, monkeypatch
+    ):
+        """A PytubeInfo should leave out of a playlist the videos that failed, telling why, without asking YouTube
+        again on the next refresh for the ones that failed for good."""
+        fetched = []
+
+        def video_from_url(url: str) -> Video:
+            fetched.append(url)
+            if url == video_url_from_id("id5"):
+                raise VideoUnavailableError("id5", "private")
+            if url == video_url_from_id("id3"):
+                raise KeyError("title")
+            return fake_video_from_url(url)
+
+        monkeypatch.setattr(PytubeInfo, "_video_from_url", staticmethod(video_from_url))
+        info = PytubeInfo(cache=test_sqlite_cache)
+        for _ in range(2):
+            playlist = info.playlist_from_id(td.playlist_id)
+            assert len(playlist.videos) == 8
+            assert playlist.errors == {"id5": "private", "id3": "KeyError: 'title'"}
+        assert len(fetched) == 11
+        assert fetched.count(video_url_from_id("id3")) == 2
+        assert test_sqlite_cache.get("id5").reason == "private"
+        assert test_sqlite_cache.get("id3") is MISS
+
+    def test_should_build_a_playlist_whose_videos_all_failed(self, monkeypatch):
+        """A PytubeInfo should build a playlist even if all its videos failed."""
+
+        def video_from_url(url: str) -> Video:
+            raise VideoUnavailableError(url, "private")
+
+        monkeypatch.setattr(PytubeInfo, "_video_from_url", staticmethod(video_from_url))
+        playlist = PytubeInfo().playlist_from_id(td.playlist_id)
+        assert playlist.videos == []
+        assert playlist.thumbnail == ""
+        assert len(playlist.errors) == 10
+
+    def test_should_back_off_from_videos_failing_again(self, test_sqlite_cache):
+        """A PytubeInfo should remember a video failing again for longer every time."""
+        ttls = []
+        save_unavailable = test_sqlite_cache.save_unavailable
+        test_sqlite_cache.save_unavailable = lambda video_id, reason, ttl: ttls.append(
+            ttl
+        ) or save_unavailable(video_id, reason, ttl)
+        info = PytubeInfo(cache=test_sqlite_cache)
+        info.max_failure_ttl = 3 * info.failure_ttl
+        for _ in range(3):
+            info._remember_failure("id1", "private")
+        assert ttls == [info.failure_ttl, 2 * info.failure_ttl, 3 * info.failure_ttl]
+
+
+class FakePlayerApi:
+    """An innertube player API stand-in for httpx, counting the requests and how many were served at once."""
+
+    def __init__(self, unavailable: List[str] = ()):
+        self.unavailable = unavailable
+        self.requests = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        video_id = request.url.params["videoId"]
+        if video_id in self.unavailable:
+            playability = {
+                "status": "LOGIN_REQUIRED",
+                "reason": "This is a private video.",
+            }
+            return httpx.Response(200, json={"playabilityStatus": playability})
+        details = {
+            "title": td.video_data.title,
+            "shortDescription": td.video_data.description,
+            "thumbnail": {"thumbnails": [{"url": td.video_data.thumbnail}]},
+            "lengthSeconds": str(td.video_data.length),
+        }
+        return httpx.Response(
+            200, json={"playabilityStatus": {"status": "OK"}, "videoDetails": details}
+        )
+
+
+class TestAnAsyncPytubeInfo:
+    """Test: An AsyncPytubeInfo..."""
+
+    @pytest.fixture(autouse=True)
+    def fake_pytube(self, monkeypatch):
+        """Replace every pytube network call."""
+        monkeypatch.setattr("ytpodcast.youtube.pytube._Playlist", FakePlaylist)
+        monkeypatch.setattr(
+            PytubeInfo, "_playlist_page", staticmethod(FakePlaylist.page)
+        )
+        FakePlaylist.urls = [video_url_from_id(f"aid{i}") for i in range(10, 0, -1)]
+        FakePlaylist.walked = 0
+
+    @pytest.fixture
+    def reset_fake_playlist_redis_cache(self, redis):
+        """Ensure the fake playlist and its videos are purged from the redis cache after every test."""
+        yield
+        keys = redis.keys("ytpodcast:*:aid*")
+        redis.delete(f"ytpodcast:membership:{td.playlist_id}", *keys)
+
+    @staticmethod
+    def run(api: FakePlayerApi, coroutine, **kwargs):
+        """Run coroutine(info) with an AsyncPytubeInfo served by api, closing it (and its cache) afterwards."""
+
+        async def main():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(api))
+            info = AsyncPytubeInfo(client=client, **kwargs)
+            try:
+                return await coroutine(info)
+            finally:
+                await info.close()
+                await client.aclose()
+                if info.cache:
+                    await info.cache.close()
+
+        return asyncio.run(main())
+
+    def test_should_be_able_to_get_a_video_from_the_id(self):
+        """An AsyncPytubeInfo should be able to get a Video from the id."""
+        video = self.run(FakePlayerApi(), lambda info: info.video_from_id(td.video_id))
+        assert video == Video.from_json(td.video_data_str)
+
+    def test_should_tell_why_a_video_is_unavailable(self):
+        """An AsyncPytubeInfo should tell why a video is unavailable."""
+        with pytest.raises(VideoUnavailableError) as e:
+            self.run(
+                FakePlayerApi(unavailable=[td.video_id]),
+                lambda info: info.video_from_id(td.video_id),
+            )
+        assert e.value.reason == "private"
+
+    def test_should_resolve_a_playlist_concurrently(self):
+        """An AsyncPytubeInfo should resolve the videos of a playlist concurrently, within its concurrency."""
+        api = FakePlayerApi()
+        playlist = self.run(
+            api, lambda info: info.playlist_from_id(td.playlist_id), concurrency=4
+        )
+        assert [video.id for video in playlist.videos] == [
+            f"aid{i}" for i in range(10, 0, -1)
+        ]
+        assert playlist.title == "title"
+        assert api.requests == 10
+        assert 1 < api.max_running <= 4
+
+    @pytest.mark.usefixtures("reset_fake_playlist_redis_cache")
+    def test_should_use_an_async_cache(self):
+        """An AsyncPytubeInfo should use an async cache, refreshing a playlist walking only its new videos."""
+        api = FakePlayerApi(unavailable=["aid11"])
+
+        async def get_playlist_twice(info: AsyncPytubeInfo):
+            await info.playlist_from_id(td.playlist_id)
+            FakePlaylist.urls.insert(0, video_url_from_id("aid11"))
+            FakePlaylist.walked = 0
+            playlist = await info.playlist_from_id(td.playlist_id)
+            assert len(playlist.videos) == 10
+            assert playlist.errors == {"aid11": "private"}
+            return await info.cache.lookup("aid11")
+
+        entry = self.run(api, get_playlist_twice, cache=AsyncRedisCache())
+        assert api.requests == 11
+        assert FakePlaylist.walked == 2
+        assert entry.value.reason == "private"
+
+
+class FakeYoutubeDL:
+    """A YoutubeDL stand-in, listing FakePlaylist.urls flat and extracting videos without any network call.
+
+    The description of a video is the pid of the process extracting it."""
+
+    def __init__(self, options: dict):
+        self.options = options
+
+    def extract_info(self, url: str, download: bool = True, process: bool = True):
+        assert not download
+        if "list=" in url:
+            assert not process
+            return {
+                "_type": "playlist",
+                "title": "title",
+                "webpage_url": url,
+                "entries": self._entries(),
+            }
+        video = fake_video_from_url(url)
+        if video.id == "private":
+            raise DownloadError(
+                "ERROR: Private video\nSign in if you've been granted access to this video",
+                (None, None, None),
+            )
+        return {
+            "id": video.id,
+            "title": video.title,
+            "description": str(os.getpid()),
+            "thumbnail": video.thumbnail,
+            "duration": video.length,
+        }
+
+    @staticmethod
+    def _entries():
+        for url in FakePlaylist.urls:
+            FakePlaylist.walked += 1
+            yield {"_type": "url", "id": url.rsplit("=", 1)[-1], "url": url}
+
+
+class TestAYoutubeDLInfo:
+    """Test: A YoutubeDLInfo..."""
+
+    @pytest.fixture(autouse=True)
+    def fake_youtube_dl(self, monkeypatch):
+        """Replace every youtube_dl network call."""
+        monkeypatch.setattr("ytpodcast.youtube.youtube_dl.YoutubeDL", FakeYoutubeDL)
+        monkeypatch.setattr("ytpodcast.youtube.youtube_dl._local", threading.local())
+        FakePlaylist.urls = [video_url_from_id(f"id{i}") for i in range(10, 0, -1)]
+        FakePlaylist.walked = 0
+
+    def test_should_list_a_playlist_flat_walking_only_its_new_videos(
+        self, test_sqlite_cache
+    ):
+        """A YoutubeDLInfo should list a playlist flat, walking only its new videos on refresh."""
+        info = YoutubeDLInfo(cache=test_sqlite_cache, processes=0)
+        playlist = info.playlist_from_id(td.playlist_id)
+        assert [video.id for video in playlist.videos] == [
+            f"id{i}" for i in range(10, 0, -1)
+        ]
+        assert playlist.title == "title"
+        assert playlist.url == playlist_url_from_id(td.playlist_id)
+
+        FakePlaylist.urls.insert(0, video_url_from_id("id11"))
+        FakePlaylist.walked = 0
+        playlist = info.playlist_from_id(td.playlist_id)
+        assert FakePlaylist.walked == 2
+        assert len(playlist.videos) == 11
+
+    def test_should_tell_why_a_video_is_unavailable(self):
+        """A YoutubeDLInfo should tell why a video is unavailable."""
+        with pytest.raises(VideoUnavailableError) as e:
+            YoutubeDLInfo(processes=0).video_from_id("private")
+        assert (e.value.video_id, e.value.reason) == ("private", "private")
+
+    def test_should_crawl_a_channel_walking_its_uploads_once(
+        self, test_sqlite_cache, monkeypatch
+    ):
+        """A YoutubeDLInfo should crawl the uploads of a channel listing them once, every page going on from where
+        the last one stopped, and walk them again up to where a crawl stopped only to resume it elsewhere."""
+        monkeypatch.setattr("ytpodcast.youtube.youtube_dl.UPLOADS_PAGE_SIZE", 3)
+        listed = []
+        extract_info = FakeYoutubeDL.extract_info
+
+        def counting_extract_info(self, url, download=True, process=True):
+            if "list=" in url:
+                listed.append(url)
+            return extract_info(self, url, download, process)
+
+        monkeypatch.setattr(FakeYoutubeDL, "extract_info", counting_extract_info)
+        info = YoutubeDLInfo(processes=0)
+        channel = info.channel_from_id("UCchannel", max_pages=None)
+        assert len(channel.videos) == 10
+        # Four pages, of a single listing whose entries are each read once
+        assert len(listed) == 1
+        assert FakePlaylist.walked == 10
+
+        YoutubeDLInfo(cache=test_sqlite_cache, processes=0).channel_from_id(
+            "UCchannel", max_pages=2
+        )
+        listed.clear()
+        FakePlaylist.walked = 0
+        info = YoutubeDLInfo(cache=test_sqlite_cache, processes=0)
+        info.channel_from_id("UCchannel", max_pages=None)
+        # The new uploads, then the back catalogue from the seventh upload, in the same listing
+        assert len(listed) == 1
+        assert FakePlaylist.walked == 10
+
+    def test_should_extract_videos_in_worker_processes(self):
+        """A YoutubeDLInfo should extract videos in worker processes, even unavailable ones."""
+        info = YoutubeDLInfo(processes=1)
+        try:
+            video = info.video_from_id("id1")
+            assert video.id == "id1"
+            assert video.description != str(os.getpid())
+            with pytest.raises(VideoUnavailableError) as e:
+                info.video_from_id("private")
+            assert e.value.reason == "private"
+        finally:
+            info.close()
+
+
+class TestAnInfoBackend:
+    """Test: An info backend..."""
+
+    def test_should_be_selected_by_name(self):
+        """An info backend should be selected by name."""
+        assert info_backend("pytube") is PytubeInfo
+        assert info_backend("youtube_dl") is YoutubeDLInfo
+        with pytest.raises(ValueError):
+            info_backend("unknown")
+
+    def test_should_be_selected_by_the_deployment(self, monkeypatch):
+        """An info backend should be selected by the deployment, through the environment."""
+        assert info_backend() is PytubeInfo
+        monkeypatch.setenv("YTPODCAST_INFO_BACKEND", "youtube_dl")
+        assert info_backend() is YoutubeDLInfo
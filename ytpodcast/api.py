@@ -1,2 +1,10 @@
 def get_stream_url(video_id: str) -> str:
     return f"/api/stream/{video_id}"
+
+
+def get_feed_url(playlist_id: str) -> str:
+    return f"/api/feed/{playlist_id}"
+
+
+def get_thumbnail_url(video_id: str) -> str:
+    return f"/api/thumbnail/{video_id}"
@@ -0,0 +1,232 @@
+from __future__ import annotations
+import math
+import time
+from typing import Optional, Union, TYPE_CHECKING
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+from starlette.concurrency import run_in_threadpool
+
+from ytpodcast.feed import FeedCache, RenderedFeed
+from ytpodcast.instrumentation import Instrumentation
+from ytpodcast.scheduler import SubscriptionRegistry
+from ytpodcast.utils import is_channel_id
+from ytpodcast.youtube import UpstreamUnavailableError, VideoUnavailableError
+from ytpodcast.youtube.base import (
+    AsyncYouTubeInfo,
+    ChannelCrawler,
+    YouTubeInfo,
+    YouTubeStream,
+)
+
+if TYPE_CHECKING:
+    from ytpodcast.proxy import StreamProxy
+    from ytpodcast.thumbnails import ThumbnailStore
+
+
+def create_app(
+    info: Union[YouTubeInfo, AsyncYouTubeInfo],
+    feeds: Optional[FeedCache] = None,
+    stream: Optional[YouTubeStream] = None,
+    proxy: Optional[StreamProxy] = None,
+    registry: Optional[SubscriptionRegistry] = None,
+    instrumentation: Optional[Instrumentation] = None,
+    thumbnails: Optional[ThumbnailStore] = None,
+) -> FastAPI:
+    """Build the ytpodcast web application, getting everything from YouTube with info and stream.
+
+    Unless given, stream is a PytubeStream sharing the cache of info, if it's a YouTubeInfo. Streams are served
+    redirecting to them, or relaying them through proxy if given.
+
+    The feeds of the playlists subscribed in registry are built from the cache only, where a RefreshScheduler keeps
+    them fresh: YouTube is asked only if a playlist was never refreshed. When info crawls channels, the channels
+    subscribed with crawl are served as it crawled them.
+
+    With instrumentation, info and its cache are instrumented, every request is measured (and traced, if it has a
+    tracer) and the metrics are served at /metrics.
+
+    When YouTube is unavailable, as told by the governor of info, what can't be served from the cache is answered
+    with a 503.
+
+    With thumbnails, the artwork of the feeds is served from the store, which downloads and resizes every thumbnail
+    once: clients can keep it for thumbnails.max_age seconds."""
+    app = FastAPI(title="ytpodcast")
+
+    @app.exception_handler(UpstreamUnavailableError)
+    async def upstream_unavailable(
+        request: Request, error: UpstreamUnavailableError
+    ) -> Response:
+        headers = {}
+        if error.retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+        return Response(str(error), status_code=503, headers=headers)
+
+    feeds = feeds if feeds is not None else FeedCache()
+    if stream is None:
+        from ytpodcast.youtube.pytube import PytubeStream
+
+        stream = PytubeStream(
+            cache=info.cache if isinstance(info, YouTubeInfo) else None
+        )
+
+    proxy_thumbnails = thumbnails is not None
+
+    async def build_feed(playlist_id: str, base_url: str) -> RenderedFeed:
+        # The channels subscribed with crawl are read as the scheduler crawls them
+        crawled = isinstance(info, ChannelCrawler) and is_channel_id(playlist_id)
+        playlist = None
+        if registry is not None and await run_in_threadpool(
+            registry.__contains__, playlist_id
+        ):
+            if isinstance(info, AsyncYouTubeInfo):
+                playlist = await info.cached_playlist(playlist_id)
+            elif crawled:
+                playlist = await run_in_threadpool(info.cached_channel, playlist_id)
+            else:
+                playlist = await run_in_threadpool(info.cached_playlist, playlist_id)
+        if playlist is None:
+            if isinstance(info, AsyncYouTubeInfo):
+                playlist = await info.playlist_from_id(playlist_id)
+            elif crawled:
+                playlist = await run_in_threadpool(info.channel_from_id, playlist_id)
+            else:
+                playlist = await run_in_threadpool(info.playlist_from_id, playlist_id)
+        # Rendering and compressing a large feed would block the event loop
+        return await run_in_threadpool(
+            feeds.update, playlist, base_url, proxy_thumbnails
+        )
+
+    @app.get("/api/feed/{playlist_id}")
+    async def feed(
+        playlist_id: str,
+        request: Request,
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+        accept_encoding: Optional[str] = Header(None),
+    ) -> Response:
+        base_url = str(request.base_url)
+        rendered = feeds.lookup(playlist_id, base_url)
+        if rendered is None:
+            rendered = await build_feed(playlist_id, base_url)
+        headers = {
+            "ETag": rendered.etag,
+            "Last-Modified": rendered.last_modified,
+            "Vary": "Accept-Encoding",
+        }
+        if rendered.not_modified(if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
+        if accepts_gzip(accept_encoding):
+            headers["Content-Encoding"] = "gzip"
+            body = rendered.gzipped
+        else:
+            body = rendered.body
+        return Response(body, media_type="application/rss+xml", headers=headers)
+
+    @app.api_route("/api/stream/{video_id}", methods=["GET", "HEAD"])
+    async def stream_url(video_id: str, request: Request) -> Response:
+        try:
+            url = await run_in_threadpool(stream.stream_url, video_id)
+        except VideoUnavailableError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if proxy is None:
+            return RedirectResponse(url, status_code=302)
+        return await proxy.relay(url, request.method, request.headers)
+
+    if thumbnails is not None:
+        import httpx
+
+        @app.get("/api/thumbnail/{video_id}")
+        async def thumbnail(
+            video_id: str, if_none_match: Optional[str] = Header(None)
+        ) -> Response:
+            try:
+                if isinstance(info, AsyncYouTubeInfo):
+                    video = await info.video_from_id(video_id)
+                else:
+                    video = await run_in_threadpool(info.video_from_id, video_id)
+            except VideoUnavailableError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            if not video.thumbnail:
+                raise HTTPException(status_code=404, detail="No thumbnail")
+            try:
+                artwork = await thumbnails.artwork(video.thumbnail)
+            except httpx.HTTPError as e:
+                raise HTTPException(status_code=502, detail=str(e))
+            headers = {
+                "ETag": f'"{artwork.digest}"',
+                "Cache-Control": f"public, max-age={thumbnails.max_age}",
+            }
+            if if_none_match is not None and headers["ETag"] in if_none_match:
+                return Response(status_code=304, headers=headers)
+            # Sent with sendfile, by the servers supporting the ASGI pathsend extension
+            return FileResponse(
+                artwork.path, media_type=artwork.media_type, headers=headers
+            )
+
+        app.on_event("shutdown")(thumbnails.close)
+
+    if proxy is not None:
+        app.on_event("shutdown")(proxy.close)
+
+    if instrumentation is not None:
+        instrument_app(app, info, instrumentation)
+
+    return app
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Tell if an Accept-Encoding header accepts gzip: named, or matched by "*", with a q-value above 0."""
+    if not accept_encoding:
+        return False
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def instrument_app(
+    app: FastAPI,
+    info: Union[YouTubeInfo, AsyncYouTubeInfo],
+    instrumentation: Instrumentation,
+) -> None:
+    instrumentation.instrument_info(info)
+    tracer = instrumentation.tracer
+
+    @app.middleware("http")
+    async def measure(request: Request, call_next) -> Response:
+        start = time.perf_counter()
+        if tracer is None:
+            response = await call_next(request)
+        else:
+            with tracer.span(
+                "http.request", {"method": request.method, "path": request.url.path}
+            ):
+                response = await call_next(request)
+        # The template, not the path, to keep the number of label values bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        instrumentation.requests.labels(
+            request.method, route, str(response.status_code)
+        ).inc()
+        instrumentation.request_durations.labels(request.method, route).observe(
+            time.perf_counter() - start
+        )
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> Response:
+        return Response(
+            instrumentation.registry.render(),
+            media_type=instrumentation.registry.CONTENT_TYPE,
+        )
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import importlib
+import os
+import sys
+import threading
+from typing import Dict, Generic, List, Optional, Type, TypeVar, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ytpodcast.cache import Cache
+
+
+T = TypeVar("T")
+
+
+def _entry_points(group: str) -> Dict[str, str]:
+    """Return the "module:attribute" references of the entry points of group, by name."""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python 3.7, where there are entry points only with the importlib_metadata backport
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return {}
+    if sys.version_info >= (3, 10):
+        found = entry_points(group=group)
+    else:
+        found = entry_points().get(group, [])
+    return {entry_point.name: entry_point.value for entry_point in found}
+
+
+class BackendRegistry(Generic[T]):
+    """The implementations of a kind of backend, by name.
+
+    Every backend is a "module:attribute" reference, and its module is imported only when the backend is picked: a
+    process pays the import of the backends it uses, not of all of them. Other packages can add backends through
+    the entry points of group; a deployment picks one with the env_var environment variable, by name or by
+    reference."""
+
+    def __init__(
+        self,
+        kind: str,
+        group: str,
+        env_var: str,
+        default: str,
+        backends: Dict[str, str],
+    ):
+        self.kind = kind
+        self.group = group
+        self.env_var = env_var
+        self.default = default
+        self._backends: Dict[str, Union[str, Type[T]]] = dict(backends)
+        self._entry_points: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, backend: Union[str, Type[T]]) -> None:
+        """Register a backend, as a class or as a "module:attribute" reference to import when it's picked."""
+        with self._lock:
+            self._backends[name] = backend
+
+    def names(self) -> List[str]:
+        """Return the names of the known backends, including the ones of the entry points."""
+        return list(dict.fromkeys([*self._backends, *self._load_entry_points()]))
+
+    def get(self, name: Optional[str] = None) -> Type[T]:
+        """Return the backend called name or, if None, the one picked with env_var (default, if unset).
+
+        A "module:attribute" reference names a backend that isn't registered."""
+        if name is None:
+            name = os.environ.get(self.env_var, self.default)
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = self._load_entry_points().get(name)
+        if backend is None and ":" in name:
+            backend = name
+        if backend is None:
+            raise ValueError(
+                f"Unknown {self.kind} backend: {name} (known: {', '.join(self.names())})"
+            )
+        if isinstance(backend, str):
+            backend = self._import(backend)
+            with self._lock:
+                self._backends[name] = backend
+        return backend
+
+    def _load_entry_points(self) -> Dict[str, str]:
+        # Reading them scans the metadata of every installed package: only when a name isn't registered
+        if self._entry_points is None:
+            self._entry_points = _entry_points(self.group)
+        return self._entry_points
+
+    def _import(self, reference: str) -> Type[T]:
+        module_name, _, attribute = reference.partition(":")
+        try:
+            return getattr(importlib.import_module(module_name), attribute)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(
+                f"Cannot import the {self.kind} backend {reference}: {e}"
+            ) from e
+
+
+CACHE_BACKENDS: BackendRegistry[Cache] = BackendRegistry(
+    kind="Cache",
+    group="ytpodcast.cache_backends",
+    env_var="YTPODCAST_CACHE_BACKEND",
+    default="sqlite",
+    backends={
+        "sqlite": "ytpodcast.cache:SqliteCache",
+        "redis": "ytpodcast.cache:RedisCache",
+        "shelve": "ytpodcast.cache:ShelveCache",
+        "memory": "ytpodcast.cache:MemoryCache",
+        "shared": "ytpodcast.shared_cache:SharedMemoryCache",
+    },
+)
+
+
+def cache_backend(name: Optional[str] = None) -> Type[Cache]:
+    """Return the Cache implementation called name or, if None, the one a deployment picked with the
+    YTPODCAST_CACHE_BACKEND environment variable (sqlite, if unset)."""
+    return CACHE_BACKENDS.get(name)
@@ -1,14 +1,130 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Optional
+from collections import OrderedDict
+import dataclasses
+import json
+import sys
+import time
+import zlib
+from typing import (
+    Any,
+    Callable,
+    Optional,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+    Union,
+    TYPE_CHECKING,
+)
 
-import shelve
-from redis import Redis
+import sqlite3
+import threading
 
-from ytpodcast.youtube import Video
+from ytpodcast.codec import Codec, BinaryCodec, decode
+from ytpodcast.youtube import Video, Unavailable, Membership
 
+if TYPE_CHECKING:
+    import shelve
 
-class Cache(ABC):
+    from redis import Redis
+    from redis.asyncio import Redis as AsyncRedis
+
+
+class Miss:
+    """The marker returned by Cache.get when nothing is cached for an id."""
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return "MISS"
+
+
+MISS = Miss()
+
+Lookup = Union[Video, Unavailable, Miss]
+
+VIDEO_FIELDS = tuple(field.name for field in dataclasses.fields(Video))
+
+
+@dataclasses.dataclass
+class CacheEntry:
+    """A cached value, with the time it was fetched from YouTube.
+
+    fetched_at is None for videos saved before fetch times were tracked. A stale entry can still be served, but it
+    should be fetched again. expires_at is when an Unavailable stops being remembered, if the cache can tell."""
+
+    value: Union[Video, Unavailable]
+    fetched_at: Optional[float]
+    stale: bool = False
+    expires_at: Optional[float] = None
+
+
+class BaseCache(ABC):
+    """What Cache and AsyncCache share: how videos are encoded and when they get stale or expire."""
+
+    # Seconds an unavailable video is remembered for: it could be made public again
+    unavailable_ttl: int = 60 * 60
+
+    def __init__(
+        self,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+    ):
+        """A video becomes stale ttl seconds after it was fetched (never, if ttl is None) and it expires stale_ttl
+        seconds later (never, if stale_ttl is None). Stale videos can still be served while they're refreshed.
+
+        Videos are stored encoded with codec (a BinaryCodec by default); whatever the codec, videos stored with any
+        other codec, like the JSON of older versions, can still be read."""
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.codec = codec if codec is not None else BinaryCodec()
+
+    @property
+    def expire_after(self) -> Optional[int]:
+        """Seconds after which a video expires, if it does."""
+        if self.ttl is None or self.stale_ttl is None:
+            return None
+        return self.ttl + self.stale_ttl
+
+    def _encode(self, video: Video) -> bytes:
+        return self.codec.encode(video)
+
+    def _decode(self, data: Union[bytes, str]) -> Video:
+        return decode(data)
+
+    def _entry(
+        self,
+        value: Union[Video, Unavailable],
+        fetched_at: Optional[float],
+        expires_at: Optional[float] = None,
+    ) -> Union[CacheEntry, Miss]:
+        """Build the CacheEntry of a value fetched at fetched_at, or MISS if it's expired."""
+        if isinstance(value, Unavailable):
+            return CacheEntry(value=value, fetched_at=fetched_at, expires_at=expires_at)
+        if self.ttl is None:
+            return CacheEntry(value=value, fetched_at=fetched_at)
+        if fetched_at is None:
+            return CacheEntry(value=value, fetched_at=fetched_at, stale=True)
+        age = time.time() - fetched_at
+        if self.expire_after is not None and age >= self.expire_after:
+            return MISS
+        return CacheEntry(value=value, fetched_at=fetched_at, stale=age >= self.ttl)
+
+    def _is_expired(self, fetched_at: Optional[float]) -> bool:
+        expire_after = self.expire_after
+        return (
+            expire_after is not None
+            and fetched_at is not None
+            and time.time() - fetched_at >= expire_after
+        )
+
+
+class Cache(BaseCache):
     """TODO"""
 
     @abstractmethod
@@ -23,48 +139,1091 @@ class Cache(ABC):
     def load(self, video_id: str) -> Optional[Video]:
         pass
 
+    @abstractmethod
+    def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        """Look up video_id with a single round trip.
+
+        Return the CacheEntry of the Video (or of the Unavailable, if the video is known to be unavailable) or MISS.
+        Expired videos are a MISS."""
+        pass
+
+    def get(self, video_id: str) -> Lookup:
+        """Return the cached Video, an Unavailable if the video is known to be unavailable or MISS."""
+        entry = self.lookup(video_id)
+        return entry.value if entry else MISS
 
-class RedisCache(Cache):
-    """TODO"""
+    @abstractmethod
+    def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        """Remember that video_id is unavailable for ttl seconds (unavailable_ttl by default)."""
+        pass
+
+    @abstractmethod
+    def cached_ids(self, video_ids: Iterable[str]) -> Set[str]:
+        """Return the subset of video_ids that are cached."""
+        pass
+
+    @abstractmethod
+    def save_many(self, videos: Iterable[Video]) -> None:
+        """Save all videos at once."""
+        pass
+
+    @abstractmethod
+    def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        """Look up all video_ids at once, like lookup. Return the found entries keyed by id, in the same order."""
+        pass
+
+    def load_many(self, video_ids: Iterable[str]) -> Dict[str, Video]:
+        """Load all cached videos among video_ids at once, keyed by id. Missing videos are left out."""
+        return {
+            video_id: entry.value
+            for video_id, entry in self.lookup_many(video_ids).items()
+            if isinstance(entry.value, Video)
+        }
+
+    @abstractmethod
+    def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Load a small record (anything but a video, like a playlist membership) saved with save_record."""
+        pass
+
+    @abstractmethod
+    def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        """Save a small, JSON serializable record, for ttl seconds if given."""
+        pass
+
+    # Serializes the updates of records in this process, for the caches that don't tell how to do it better
+    _update_lock = threading.Lock()
+
+    def update_record(
+        self,
+        kind: str,
+        key: str,
+        update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+        ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Replace a record with what update makes of it (of None, if there's none), for ttl seconds if given, and
+        return it. Concurrent updates of the same record are all applied, one after the other: update may be
+        called again if another one got in first.
+
+        Here only the updates of this process are serialized: the caches shared between processes override it."""
+        with self._update_lock:
+            data = update(self.load_record(kind, key))
+            self.save_record(kind, key, data, ttl)
+        return data
+
+    def load_membership(self, playlist_id: str) -> Optional[Membership]:
+        """Load the cached video ids of a playlist, if any."""
+        data = self.load_record("membership", playlist_id)
+        return Membership(**data) if data else None
+
+    def save_membership(self, membership: Membership) -> None:
+        self.save_record(
+            "membership", membership.playlist_id, dataclasses.asdict(membership)
+        )
+
+
+@dataclasses.dataclass
+class RedisOptions:
+    """How to connect to Redis: through unix_socket_path if given, else to host and port. Every client built from the
+    same options gets its own pool of up to max_connections connections (unbounded if None)."""
+
+    host: str = "localhost"
+    port: int = 6379
+    db: int = 0
+    unix_socket_path: Optional[str] = None
+    password: Optional[str] = None
+    max_connections: Optional[int] = None
+    socket_timeout: Optional[float] = None
+    socket_connect_timeout: Optional[float] = None
+
+    def client(self) -> Redis:
+        from redis import Redis
+
+        return Redis(**dataclasses.asdict(self))
+
+    def async_client(self) -> AsyncRedis:
+        from redis.asyncio import Redis as AsyncRedis
+
+        return AsyncRedis(**dataclasses.asdict(self))
+
+
+class RedisLayout:
+    """Where RedisCache and AsyncRedisCache keep things, under keys starting with key_prefix.
+
+    With the "blob" layout every video takes a key for its encoded payload and one for its fetch time, written
+    together so that they expire together. With the "hash" layout every video is a hash with a field per attribute
+    and one for its fetch time: single fields can be read with load_fields without decoding the whole video.
+    Descriptions longer than compress_description_over bytes are compressed with zlib in both layouts (never, if
+    None); in the "blob" layout that's up to the codec, when one is given."""
+
+    LAYOUTS = ("blob", "hash")
+
+    # The hash field flagging a zlib compressed description
+    COMPRESSED = "compressed"
+
+    def __init__(
+        self,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+        key_prefix: str = "ytpodcast",
+        layout: str = "blob",
+        compress_description_over: Optional[int] = 512,
+    ):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown redis layout: {layout}")
+        if codec is None:
+            codec = BinaryCodec(compress_over=compress_description_over)
+        super().__init__(ttl=ttl, stale_ttl=stale_ttl, codec=codec)
+        self.key_prefix = key_prefix
+        self.layout = layout
+        self.compress_description_over = compress_description_over
+
+    def _queue_save(self, pipe: Any, videos: Iterable[Video]) -> int:
+        """Queue on pipe the commands saving videos. Return how many videos were queued."""
+        now = time.time()
+        expire_after = self.expire_after
+        queued = 0
+        for video in videos:
+            if self.layout == "hash":
+                key = self._key_from_id(video.id)
+                mapping = self._hash_from_video(video)
+                mapping["fetched"] = now
+                pipe.hset(key, mapping=mapping)
+                if self.COMPRESSED not in mapping:
+                    pipe.hdel(key, self.COMPRESSED)
+                if expire_after is not None:
+                    pipe.expire(key, expire_after)
+                else:
+                    pipe.persist(key)
+            else:
+                pipe.set(
+                    self._key_from_id(video.id), self._encode(video), ex=expire_after
+                )
+                pipe.set(self._fetched_key_from_id(video.id), now, ex=expire_after)
+            queued += 1
+        return queued
+
+    def _queue_lookup(self, pipe: Any, video_ids: List[str]) -> None:
+        """Queue on pipe the commands looking up video_ids: a single MGET, or two commands per video for hashes."""
+        if self.layout == "hash":
+            for video_id in video_ids:
+                pipe.hgetall(self._key_from_id(video_id))
+                pipe.get(self._unavailable_key_from_id(video_id))
+        else:
+            keys = []
+            for video_id in video_ids:
+                keys.append(self._key_from_id(video_id))
+                keys.append(self._fetched_key_from_id(video_id))
+                keys.append(self._unavailable_key_from_id(video_id))
+            pipe.mget(keys)
+
+    def _entries(
+        self, video_ids: List[str], results: List[Any]
+    ) -> Dict[str, CacheEntry]:
+        """Build the entries of video_ids from the results of the commands queued by _queue_lookup."""
+        entries = {}
+        for i, video_id in enumerate(video_ids):
+            if self.layout == "hash":
+                fields, reason = results[i * 2 : i * 2 + 2]
+                video = self._video_from_hash(fields) if fields else None
+                fetched_at = fields.get(b"fetched") if fields else None
+            else:
+                data, fetched_at, reason = results[0][i * 3 : i * 3 + 3]
+                video = self._decode(data) if data is not None else None
+            if video is not None:
+                entry = self._entry(
+                    video, float(fetched_at) if fetched_at is not None else None
+                )
+            elif reason is not None:
+                entry = self._entry(
+                    Unavailable(video_id=video_id, reason=reason.decode("UTF-8")), None
+                )
+            else:
+                continue
+            if entry:
+                entries[video_id] = entry
+        return entries
+
+    def _hash_from_video(self, video: Video) -> Dict[str, Any]:
+        mapping: Dict[str, Any] = dataclasses.asdict(video)
+        description = video.description.encode("UTF-8")
+        over = self.compress_description_over
+        if over is not None and len(description) > over:
+            compressed = zlib.compress(description)
+            if len(compressed) < len(description):
+                mapping["description"] = compressed
+                mapping[self.COMPRESSED] = 1
+        return mapping
+
+    def _video_from_hash(self, fields: Dict[bytes, bytes]) -> Video:
+        values = self._values_from_hash(
+            {name.decode("UTF-8"): value for name, value in fields.items()}
+        )
+        return Video(**{field: values[field] for field in VIDEO_FIELDS})
+
+    def _values_from_hash(self, fields: Dict[str, Optional[bytes]]) -> Dict[str, Any]:
+        """Decode the raw fields of a video hash: the video attributes among them, and nothing else."""
+        values = {}
+        for field in VIDEO_FIELDS:
+            value = fields.get(field)
+            if value is None:
+                continue
+            if field == "length":
+                values[field] = int(value)
+            elif field == "description" and fields.get(self.COMPRESSED):
+                values[field] = zlib.decompress(value).decode("UTF-8")
+            else:
+                values[field] = value.decode("UTF-8")
+        return values
+
+    def _queue_load_fields(self, pipe: Any, video_id: str, fields: List[str]) -> None:
+        """Queue on pipe the command reading fields of a video: the whole video, with the "blob" layout."""
+        if self.layout == "hash":
+            pipe.hmget(self._key_from_id(video_id), fields + [self.COMPRESSED])
+        else:
+            pipe.get(self._key_from_id(video_id))
+
+    def _fields(self, fields: List[str], result: Any) -> Optional[Dict[str, Any]]:
+        """Build the fields read by the command queued by _queue_load_fields, or None if the video isn't cached."""
+        unknown = set(fields) - set(VIDEO_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown video fields: {', '.join(sorted(unknown))}")
+        if self.layout == "hash":
+            if all(value is None for value in result[:-1]):
+                return None
+            return self._values_from_hash(dict(zip(fields + [self.COMPRESSED], result)))
+        if result is None:
+            return None
+        video = self._decode(result)
+        return {field: getattr(video, field) for field in fields}
+
+    def _key_from_id(self, video_id: str) -> str:
+        kind = "video_hash" if self.layout == "hash" else "video"
+        return f"{self.key_prefix}:{kind}:{video_id}"
+
+    def _record_key(self, kind: str, key: str) -> str:
+        return f"{self.key_prefix}:{kind}:{key}"
+
+    def _fetched_key_from_id(self, video_id: str) -> str:
+        return f"{self.key_prefix}:fetched:{video_id}"
+
+    def _unavailable_key_from_id(self, video_id: str) -> str:
+        return f"{self.key_prefix}:unavailable:{video_id}"
+
+
+class RedisCache(RedisLayout, Cache):
+    """A cache in Redis, laid out as described by RedisLayout.
+
+    It connects with options (to localhost:6379/0 by default), unless it's given a redis client to share, with its
+    pool, with other caches."""
 
     r: Redis
 
-    def __init__(self):
-        self.r = Redis(host="localhost", port=6379, db=0)
+    def __init__(
+        self,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+        redis: Optional[Redis] = None,
+        options: Optional[RedisOptions] = None,
+        key_prefix: str = "ytpodcast",
+        layout: str = "blob",
+        compress_description_over: Optional[int] = 512,
+    ):
+        super().__init__(
+            ttl=ttl,
+            stale_ttl=stale_ttl,
+            codec=codec,
+            key_prefix=key_prefix,
+            layout=layout,
+            compress_description_over=compress_description_over,
+        )
+        if redis is None:
+            redis = (options if options is not None else RedisOptions()).client()
+        self.r = redis
 
     def is_cached(self, video_id: str) -> bool:
-        key = self._key_from_id(video_id)
-        return self.r.get(key) is not None
+        return bool(self.r.exists(self._key_from_id(video_id)))
 
     def save(self, video: Video) -> None:
-        key = self._key_from_id(video.id)
-        self.r.set(key, video.to_json())
+        self.save_many([video])
 
     def load(self, video_id: str) -> Optional[Video]:
         key = self._key_from_id(video_id)
-        data = self.r.get(key).decode("UTF-8")
-        return Video.from_json(data)
+        if self.layout == "hash":
+            fields = self.r.hgetall(key)
+            return self._video_from_hash(fields) if fields else None
+        return self._decode(self.r.get(key))
 
-    @staticmethod
-    def _key_from_id(video_id: str) -> str:
-        return f"ytpodcast:video:{video_id}"
+    def load_fields(self, video_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """Load some fields of a cached video, like its thumbnail or length, or return None if it isn't cached.
+
+        With the "hash" layout only those fields are read, and the video isn't decoded."""
+        fields = list(fields)
+        pipe = self.r.pipeline(transaction=False)
+        self._queue_load_fields(pipe, video_id, fields)
+        return self._fields(fields, pipe.execute()[0])
+
+    def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        return self.lookup_many([video_id]).get(video_id, MISS)
+
+    def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        key = self._unavailable_key_from_id(video_id)
+        self.r.set(key, reason, ex=self.unavailable_ttl if ttl is None else ttl)
+
+    def cached_ids(self, video_ids: Iterable[str]) -> Set[str]:
+        video_ids = list(video_ids)
+        pipe = self.r.pipeline(transaction=False)
+        for video_id in video_ids:
+            pipe.exists(self._key_from_id(video_id))
+        return {video_id for video_id, found in zip(video_ids, pipe.execute()) if found}
+
+    def save_many(self, videos: Iterable[Video]) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        if self._queue_save(pipe, videos):
+            pipe.execute()
+
+    def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        video_ids = list(video_ids)
+        if not video_ids:
+            return {}
+        pipe = self.r.pipeline(transaction=False)
+        self._queue_lookup(pipe, video_ids)
+        return self._entries(video_ids, pipe.execute())
+
+    def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        data = self.r.get(self._record_key(kind, key))
+        return json.loads(data) if data is not None else None
+
+    def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        self.r.set(self._record_key(kind, key), json.dumps(data), ex=ttl)
+
+    def update_record(
+        self,
+        kind: str,
+        key: str,
+        update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+        ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Update a record in a WATCH/MULTI transaction, updating it again if another client changed it first."""
+        from redis.exceptions import WatchError
+
+        record_key = self._record_key(kind, key)
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(record_key)
+                    found = pipe.get(record_key)
+                    data = update(json.loads(found) if found is not None else None)
+                    pipe.multi()
+                    pipe.set(record_key, json.dumps(data), ex=ttl)
+                    pipe.execute()
+                    return data
+                except WatchError:
+                    continue
 
 
 class ShelveCache(Cache):
-    def __init__(self, db_file: str = "db"):
-        self.db = shelve.open(db_file)
+    def __init__(
+        self,
+        db_file: str = "db",
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+    ):
+        super().__init__(ttl=ttl, stale_ttl=stale_ttl, codec=codec)
+        self.db = self._open_db(db_file)
+
+    @staticmethod
+    def _open_db(db_file: str, flag: str = "c") -> shelve.Shelf:
+        # shelve, and the dbm it picks, is imported only by the processes that open a shelve db
+        import shelve
+
+        return shelve.open(db_file, flag=flag)
 
     def is_cached(self, video_id: str) -> bool:
-        return self.db.get(video_id) is not None
+        return self.db.get(video_id) is not None and not self._is_expired(
+            self.db.get(self._fetched_key_from_id(video_id))
+        )
 
     def save(self, video: Video) -> None:
-        self.db[video.id] = video.to_json()
+        self.save_many([video])
 
     def load(self, video_id: str) -> Optional[Video]:
-        data_str = self.db[video_id]
-        return Video.from_json(data_str)
+        return self._decode(self.db[video_id])
+
+    def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        data = self.db.get(video_id)
+        if data is not None:
+            fetched_at = self.db.get(self._fetched_key_from_id(video_id))
+            return self._entry(self._decode(data), fetched_at)
+        unavailable = self.db.get(self._unavailable_key_from_id(video_id))
+        if unavailable is not None:
+            reason, expires_at = unavailable
+            if expires_at > time.time():
+                return self._entry(
+                    Unavailable(video_id=video_id, reason=reason), None, expires_at
+                )
+        return MISS
+
+    def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        expires_at = time.time() + (self.unavailable_ttl if ttl is None else ttl)
+        self.db[self._unavailable_key_from_id(video_id)] = (reason, expires_at)
+
+    def cached_ids(self, video_ids: Iterable[str]) -> Set[str]:
+        return {video_id for video_id in video_ids if self.is_cached(video_id)}
+
+    def save_many(self, videos: Iterable[Video]) -> None:
+        now = time.time()
+        for video in videos:
+            self.db[video.id] = self._encode(video)
+            self.db[self._fetched_key_from_id(video.id)] = now
+
+    def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        entries = {}
+        for video_id in video_ids:
+            entry = self.lookup(video_id)
+            if entry:
+                entries[video_id] = entry
+        return entries
+
+    def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        record = self.db.get(self._record_key(kind, key))
+        if record is None:
+            return None
+        data, expires_at = record
+        return data if expires_at is None or expires_at > time.time() else None
+
+    def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        expires_at = None if ttl is None else time.time() + ttl
+        self.db[self._record_key(kind, key)] = (data, expires_at)
+
+    @staticmethod
+    def _fetched_key_from_id(video_id: str) -> str:
+        return f"fetched:{video_id}"
+
+    @staticmethod
+    def _record_key(kind: str, key: str) -> str:
+        return f"record:{kind}:{key}"
+
+    @staticmethod
+    def _unavailable_key_from_id(video_id: str) -> str:
+        return f"unavailable:{video_id}"
 
     def __del__(self):
         # NOTE: cache is persisted on disk only when the object is destroyed
         # NOTE 2: writing to disk is costly, but it should not impact api answers; TODO verify this
         self.db.close()
+
+
+class SqliteCache(Cache):
+    """A durable cache on a SQLite database in WAL mode.
+
+    Every write is committed right away, so it's safe to share the database file between threads and worker
+    processes. Each thread gets its own connection, whose prepared statements are reused by sqlite3."""
+
+    # SQLite can bind at most 999 variables in a single statement on older versions
+    BATCH_SIZE = 500
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS videos "
+        "(id TEXT PRIMARY KEY, data BLOB NOT NULL, fetched_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS videos_fetched_at ON videos (fetched_at)",
+        "CREATE TABLE IF NOT EXISTS unavailable "
+        "(id TEXT PRIMARY KEY, reason TEXT NOT NULL, expires_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS records "
+        "(kind TEXT, key TEXT, data TEXT NOT NULL, expires_at REAL, PRIMARY KEY (kind, key))",
+    ]
+    SAVE = "INSERT OR REPLACE INTO videos (id, data, fetched_at) VALUES (?, ?, ?)"
+    LOAD = "SELECT data FROM videos WHERE id = ? AND fetched_at > ?"
+    LOOKUP = (
+        "SELECT data, fetched_at, NULL, NULL FROM videos WHERE id = ?1 AND fetched_at > ?2 "
+        "UNION ALL SELECT NULL, NULL, reason, expires_at FROM unavailable WHERE id = ?1 AND expires_at > ?3"
+    )
+    SAVE_UNAVAILABLE = (
+        "INSERT OR REPLACE INTO unavailable (id, reason, expires_at) VALUES (?, ?, ?)"
+    )
+    EVICT_OLDER_THAN = "DELETE FROM videos WHERE fetched_at < ?"
+    EVICT_OLDEST = (
+        "DELETE FROM videos WHERE id IN "
+        "(SELECT id FROM videos ORDER BY fetched_at LIMIT max((SELECT count(*) FROM videos) - ?, 0))"
+    )
+    PURGE_UNAVAILABLE = "DELETE FROM unavailable WHERE expires_at <= ?"
+    LOAD_RECORD = (
+        "SELECT data FROM records WHERE kind = ? AND key = ? "
+        "AND (expires_at IS NULL OR expires_at > ?)"
+    )
+    SAVE_RECORD = "INSERT OR REPLACE INTO records (kind, key, data, expires_at) VALUES (?, ?, ?, ?)"
+
+    def __init__(
+        self,
+        db_file: str = "db.sqlite3",
+        timeout: float = 30.0,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+    ):
+        super().__init__(ttl=ttl, stale_ttl=stale_ttl, codec=codec)
+        self.db_file = db_file
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._conn as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Return the connection of the current thread, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode this is still safe against corruption, only a power loss can lose the last commits
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_cached(self, video_id: str) -> bool:
+        row = self._conn.execute(self.LOAD, (video_id, self._min_fetched_at()))
+        return row.fetchone() is not None
+
+    def save(self, video: Video) -> None:
+        with self._conn as conn:
+            conn.execute(self.SAVE, (video.id, self._encode(video), time.time()))
+
+    def load(self, video_id: str) -> Optional[Video]:
+        row = self._conn.execute(self.LOAD, (video_id, self._min_fetched_at()))
+        row = row.fetchone()
+        return self._decode(row[0]) if row else None
+
+    def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        row = self._conn.execute(
+            self.LOOKUP, (video_id, self._min_fetched_at(), time.time())
+        ).fetchone()
+        if row is None:
+            return MISS
+        data, fetched_at, reason, expires_at = row
+        if data is not None:
+            return self._entry(self._decode(data), fetched_at)
+        return self._entry(
+            Unavailable(video_id=video_id, reason=reason), None, expires_at
+        )
+
+    def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        expires_at = time.time() + (self.unavailable_ttl if ttl is None else ttl)
+        with self._conn as conn:
+            conn.execute(self.SAVE_UNAVAILABLE, (video_id, reason, expires_at))
+
+    def cached_ids(self, video_ids: Iterable[str]) -> Set[str]:
+        return {
+            row[0]
+            for row in self._select_many(
+                "SELECT id FROM videos WHERE fetched_at > ? AND id IN ({})",
+                self._min_fetched_at(),
+                video_ids,
+            )
+        }
+
+    def save_many(self, videos: Iterable[Video]) -> None:
+        now = time.time()
+        with self._conn as conn:
+            conn.executemany(
+                self.SAVE,
+                ((video.id, self._encode(video), now) for video in videos),
+            )
+
+    def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        video_ids = list(video_ids)
+        found = {}
+        for video_id, data, fetched_at in self._select_many(
+            "SELECT id, data, fetched_at FROM videos WHERE fetched_at > ? AND id IN ({})",
+            self._min_fetched_at(),
+            video_ids,
+        ):
+            found[video_id] = self._entry(self._decode(data), fetched_at)
+        for video_id, reason, expires_at in self._select_many(
+            "SELECT id, reason, expires_at FROM unavailable WHERE expires_at > ? AND id IN ({})",
+            time.time(),
+            (video_id for video_id in video_ids if video_id not in found),
+        ):
+            found[video_id] = self._entry(
+                Unavailable(video_id, reason), None, expires_at
+            )
+        # Keep the order of video_ids, like the other caches
+        return {
+            video_id: found[video_id]
+            for video_id in dict.fromkeys(video_ids)
+            if found.get(video_id)
+        }
+
+    def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(self.LOAD_RECORD, (kind, key, time.time()))
+        row = row.fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        expires_at = None if ttl is None else time.time() + ttl
+        with self._conn as conn:
+            conn.execute(self.SAVE_RECORD, (kind, key, json.dumps(data), expires_at))
+
+    def update_record(
+        self,
+        kind: str,
+        key: str,
+        update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+        ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Update a record in a transaction taking the write lock of the database before reading it, so that no
+        other writer, of any process, gets in between."""
+        with self._conn as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(self.LOAD_RECORD, (kind, key, time.time())).fetchone()
+            data = update(json.loads(row[0]) if row else None)
+            expires_at = None if ttl is None else time.time() + ttl
+            conn.execute(self.SAVE_RECORD, (kind, key, json.dumps(data), expires_at))
+        return data
+
+    def evict_older_than(self, seconds: float) -> int:
+        """Delete the videos fetched more than seconds ago, returning how many were deleted."""
+        with self._conn as conn:
+            deleted = conn.execute(self.EVICT_OLDER_THAN, (time.time() - seconds,))
+            conn.execute(self.PURGE_UNAVAILABLE, (time.time(),))
+        return deleted.rowcount
+
+    def evict_oldest(self, max_entries: int) -> int:
+        """Delete the least recently fetched videos exceeding max_entries, returning how many were deleted."""
+        with self._conn as conn:
+            deleted = conn.execute(self.EVICT_OLDEST, (max_entries,))
+            conn.execute(self.PURGE_UNAVAILABLE, (time.time(),))
+        return deleted.rowcount
+
+    def import_shelve(self, db_file: str) -> int:
+        """Copy every entry of a ShelveCache db file in a single transaction, returning how many videos were copied.
+
+        Records are copied too, while anything else that isn't a video, like the records saved before they had
+        their own prefix, is skipped."""
+        now = time.time()
+        videos, unavailable, records = [], [], []
+        with ShelveCache._open_db(db_file, flag="r") as db:
+            for key, value in db.items():
+                if key.startswith("unavailable:"):
+                    reason, expires_at = value
+                    if expires_at > now:
+                        unavailable.append((key.split(":", 1)[1], reason, expires_at))
+                elif key.startswith("record:"):
+                    _, kind, record_key = key.split(":", 2)
+                    data, expires_at = value
+                    if expires_at is None or expires_at > now:
+                        records.append((kind, record_key, json.dumps(data), expires_at))
+                elif not key.startswith("fetched:") and isinstance(value, (bytes, str)):
+                    videos.append((key, value, db.get(f"fetched:{key}", now)))
+        with self._conn as conn:
+            conn.executemany(self.SAVE, videos)
+            conn.executemany(self.SAVE_UNAVAILABLE, unavailable)
+            conn.executemany(self.SAVE_RECORD, records)
+        return len(videos)
+
+    def close(self) -> None:
+        """Close the connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _min_fetched_at(self) -> float:
+        """Return the fetch time before which videos are expired."""
+        expire_after = self.expire_after
+        return float("-inf") if expire_after is None else time.time() - expire_after
+
+    def _select_many(
+        self, query: str, parameter: Any, video_ids: Iterable[str]
+    ) -> Iterator[Tuple]:
+        """Run a query with a parameter and an "IN ({})" placeholder for video_ids, in batches that fit a single
+        statement."""
+        video_ids = list(video_ids)
+        for start in range(0, len(video_ids), self.BATCH_SIZE):
+            batch = video_ids[start : start + self.BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            yield from self._conn.execute(
+                query.format(placeholders), [parameter, *batch]
+            )
+
+
+@dataclasses.dataclass
+class CacheStats:
+    """Counters of a MemoryCache."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class MemoryCache(Cache):
+    """A bounded, in-process LRU cache of decoded videos, optionally in front of another Cache.
+
+    Reads are served from memory when possible and fall back to the backend, writes go to both. Entries are
+    evicted, least recently used first, when there are more than max_entries or they take more than max_bytes,
+    and they're dropped after local_ttl seconds so that changes made to the backend by other processes are seen.
+    Unavailable videos are also dropped when they expire, like in the backend. Unless given, ttl and stale_ttl are
+    the ones of the backend."""
+
+    def __init__(
+        self,
+        backend: Optional[Cache] = None,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        local_ttl: Optional[float] = 60.0,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+    ):
+        super().__init__(
+            ttl=ttl if ttl is not None or not backend else backend.ttl,
+            stale_ttl=stale_ttl
+            if stale_ttl is not None or not backend
+            else backend.stale_ttl,
+        )
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.local_ttl = local_ttl
+        self.stats = CacheStats()
+        # id -> (value, fetched_at, local expiration, size, expiration of an Unavailable)
+        self._entries: OrderedDict[
+            str,
+            Tuple[
+                Union[Video, Unavailable],
+                Optional[float],
+                Optional[float],
+                int,
+                Optional[float],
+            ],
+        ] = OrderedDict()
+        # Records are few: they're held here only without a backend
+        self._records: Dict[
+            Tuple[str, str], Tuple[Dict[str, Any], Optional[float]]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def is_cached(self, video_id: str) -> bool:
+        entry = self._get_local(video_id, count=False)
+        if entry and isinstance(entry.value, Video):
+            return True
+        return self.backend is not None and self.backend.is_cached(video_id)
+
+    def save(self, video: Video) -> None:
+        self.save_many([video])
+
+    def load(self, video_id: str) -> Optional[Video]:
+        video = self.get(video_id)
+        return video if isinstance(video, Video) else None
+
+    def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        entry = self._get_local(video_id)
+        if not entry and self.backend:
+            entry = self.backend.lookup(video_id)
+            if entry:
+                self._put_local(
+                    video_id, entry.value, entry.fetched_at, entry.expires_at
+                )
+        return entry
+
+    def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        if self.backend:
+            self.backend.save_unavailable(video_id, reason, ttl)
+        expires_at = time.time() + (self.unavailable_ttl if ttl is None else ttl)
+        self._put_local(
+            video_id, Unavailable(video_id=video_id, reason=reason), None, expires_at
+        )
+
+    def cached_ids(self, video_ids: Iterable[str]) -> Set[str]:
+        video_ids = list(video_ids)
+        cached = set()
+        for video_id in video_ids:
+            entry = self._get_local(video_id, count=False)
+            if entry and isinstance(entry.value, Video):
+                cached.add(video_id)
+        if self.backend:
+            cached |= self.backend.cached_ids(
+                video_id for video_id in video_ids if video_id not in cached
+            )
+        return cached
+
+    def save_many(self, videos: Iterable[Video]) -> None:
+        videos = list(videos)
+        if self.backend:
+            self.backend.save_many(videos)
+        now = time.time()
+        for video in videos:
+            self._put_local(video.id, video, now)
+
+    def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        video_ids = list(video_ids)
+        entries = {}
+        for video_id in video_ids:
+            entry = self._get_local(video_id)
+            if entry:
+                entries[video_id] = entry
+        missing = [video_id for video_id in video_ids if video_id not in entries]
+        if missing and self.backend:
+            found = self.backend.lookup_many(missing)
+            for video_id, entry in found.items():
+                self._put_local(
+                    video_id, entry.value, entry.fetched_at, entry.expires_at
+                )
+            entries.update(found)
+            # Keep the order of video_ids, like the other caches
+            entries = {
+                video_id: entries[video_id]
+                for video_id in video_ids
+                if video_id in entries
+            }
+        return entries
+
+    def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        if self.backend:
+            return self.backend.load_record(kind, key)
+        with self._lock:
+            data, expires_at = self._records.get((kind, key), (None, None))
+        return data if expires_at is None or expires_at > time.monotonic() else None
+
+    def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        if self.backend:
+            self.backend.save_record(kind, key, data, ttl)
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._records[(kind, key)] = (data, expires_at)
+
+    def update_record(
+        self,
+        kind: str,
+        key: str,
+        update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+        ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        if self.backend:
+            return self.backend.update_record(kind, key, update, ttl)
+        return super().update_record(kind, key, update, ttl)
+
+    def clear(self) -> None:
+        """Drop every entry held in memory, leaving the backend untouched."""
+        with self._lock:
+            self._entries.clear()
+            self.stats.entries = self.stats.bytes = 0
+
+    def _get_local(self, video_id: str, count: bool = True) -> Union[CacheEntry, Miss]:
+        with self._lock:
+            local = self._entries.get(video_id)
+            if local is not None:
+                value, fetched_at, expires_at, _, unavailable_until = local
+                entry = self._entry(value, fetched_at, unavailable_until)
+                if (
+                    entry
+                    and (expires_at is None or expires_at > time.monotonic())
+                    and (unavailable_until is None or unavailable_until > time.time())
+                ):
+                    self._entries.move_to_end(video_id)
+                    if count:
+                        self.stats.hits += 1
+                    return entry
+                self._drop(video_id)
+            if count:
+                self.stats.misses += 1
+            return MISS
+
+    def _put_local(
+        self,
+        video_id: str,
+        value: Union[Video, Unavailable],
+        fetched_at: Optional[float],
+        unavailable_until: Optional[float] = None,
+    ) -> None:
+        size = self._size_of(value)
+        expires_at = (
+            None if self.local_ttl is None else time.monotonic() + self.local_ttl
+        )
+        if isinstance(value, Unavailable) and unavailable_until is None:
+            # The backend can't tell when it expires: don't keep it longer than it would
+            unavailable_until = time.time() + self.unavailable_ttl
+        with self._lock:
+            if video_id in self._entries:
+                self._drop(video_id)
+            self._entries[video_id] = (
+                value,
+                fetched_at,
+                expires_at,
+                size,
+                unavailable_until,
+            )
+            self.stats.entries += 1
+            self.stats.bytes += size
+            while self._entries and (
+                self.stats.entries > self.max_entries
+                or self.stats.bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def _drop(self, video_id: str) -> None:
+        """Remove an entry: the lock must be held."""
+        _, _, _, size, _ = self._entries.pop(video_id)
+        self.stats.entries -= 1
+        self.stats.bytes -= size
+
+    @staticmethod
+    def _size_of(value: Union[Video, Unavailable]) -> int:
+        """Estimate the memory taken by a cached value, strings included."""
+        fields = dataclasses.fields(value)
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(getattr(value, field.name)) for field in fields
+        )
+
+
+class AsyncCache(BaseCache):
+    """The asyncio counterpart of Cache, for AsyncYouTubeInfo: it offers the batch operations only."""
+
+    async def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        """Look up video_id, like Cache.lookup."""
+        return (await self.lookup_many([video_id])).get(video_id, MISS)
+
+    async def get(self, video_id: str) -> Lookup:
+        """Return the cached Video, an Unavailable if the video is known to be unavailable or MISS."""
+        entry = await self.lookup(video_id)
+        return entry.value if entry else MISS
+
+    async def save(self, video: Video) -> None:
+        await self.save_many([video])
+
+    @abstractmethod
+    async def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        """Remember that video_id is unavailable for ttl seconds (unavailable_ttl by default)."""
+        pass
+
+    @abstractmethod
+    async def save_many(self, videos: Iterable[Video]) -> None:
+        """Save all videos at once."""
+        pass
+
+    @abstractmethod
+    async def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        """Look up all video_ids at once, like Cache.lookup_many."""
+        pass
+
+    @abstractmethod
+    async def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Load a small record saved with save_record."""
+        pass
+
+    @abstractmethod
+    async def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        """Save a small, JSON serializable record, for ttl seconds if given."""
+        pass
+
+    async def load_membership(self, playlist_id: str) -> Optional[Membership]:
+        """Load the cached video ids of a playlist, if any."""
+        data = await self.load_record("membership", playlist_id)
+        return Membership(**data) if data else None
+
+    async def save_membership(self, membership: Membership) -> None:
+        await self.save_record(
+            "membership", membership.playlist_id, dataclasses.asdict(membership)
+        )
+
+    async def close(self) -> None:
+        """Release the connections of the cache."""
+        pass
+
+
+class AsyncRedisCache(RedisLayout, AsyncCache):
+    """A Redis cache for asyncio, sharing its keys (and so its entries) with a RedisCache with the same options."""
+
+    r: AsyncRedis
+
+    def __init__(
+        self,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+        redis: Optional[AsyncRedis] = None,
+        options: Optional[RedisOptions] = None,
+        key_prefix: str = "ytpodcast",
+        layout: str = "blob",
+        compress_description_over: Optional[int] = 512,
+    ):
+        super().__init__(
+            ttl=ttl,
+            stale_ttl=stale_ttl,
+            codec=codec,
+            key_prefix=key_prefix,
+            layout=layout,
+            compress_description_over=compress_description_over,
+        )
+        if redis is None:
+            redis = (options if options is not None else RedisOptions()).async_client()
+        self.r = redis
+
+    async def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        key = self._unavailable_key_from_id(video_id)
+        await self.r.set(key, reason, ex=self.unavailable_ttl if ttl is None else ttl)
+
+    async def save_many(self, videos: Iterable[Video]) -> None:
+        async with self.r.pipeline(transaction=False) as pipe:
+            if self._queue_save(pipe, videos):
+                await pipe.execute()
+
+    async def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        video_ids = list(video_ids)
+        if not video_ids:
+            return {}
+        async with self.r.pipeline(transaction=False) as pipe:
+            self._queue_lookup(pipe, video_ids)
+            return self._entries(video_ids, await pipe.execute())
+
+    async def load_fields(
+        self, video_id: str, fields: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Load some fields of a cached video, like RedisCache.load_fields."""
+        fields = list(fields)
+        async with self.r.pipeline(transaction=False) as pipe:
+            self._queue_load_fields(pipe, video_id, fields)
+            return self._fields(fields, (await pipe.execute())[0])
+
+    async def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        data = await self.r.get(self._record_key(kind, key))
+        return json.loads(data) if data is not None else None
+
+    async def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        await self.r.set(self._record_key(kind, key), json.dumps(data), ex=ttl)
+
+    async def close(self) -> None:
+        await self.r.aclose()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+import json
+import struct
+import zlib
+from typing import Dict, Optional, Union
+
+from ytpodcast.youtube import Video
+
+
+class Codec(ABC):
+    """Turns a Video into bytes to be cached, and back.
+
+    Every codec starts its payloads with a distinct marker byte: decode() reads it to pick the codec that can decode a
+    payload, so entries written with another codec stay readable."""
+
+    marker: bytes
+
+    @abstractmethod
+    def encode(self, video: Video) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Video:
+        pass
+
+
+class JsonCodec(Codec):
+    """The JSON payload of Video.to_json, the one cached before codecs existed."""
+
+    marker = b"{"
+
+    def encode(self, video: Video) -> bytes:
+        return video.to_json().encode("UTF-8")
+
+    def decode(self, data: bytes) -> Video:
+        return Video(**json.loads(data))
+
+
+class BinaryCodec(Codec):
+    """A compact, struct-packed payload: a header followed by the UTF-8 encoded strings of the video.
+
+    The header holds the format version, some flags, the video length and the size of every string. Descriptions
+    longer than compress_over bytes are compressed with zlib (never, if compress_over is None)."""
+
+    # The version byte: it must never collide with the marker of another codec
+    marker = b"\x01"
+
+    COMPRESSED_DESCRIPTION = 0x01
+
+    # version, flags, length and the sizes of id, title, description, thumbnail and url
+    HEADER = struct.Struct("<BBq5I")
+
+    def __init__(self, compress_over: Optional[int] = 512, level: int = 6):
+        self.compress_over = compress_over
+        self.level = level
+
+    def encode(self, video: Video) -> bytes:
+        flags = 0
+        description = video.description.encode("UTF-8")
+        if self.compress_over is not None and len(description) > self.compress_over:
+            compressed = zlib.compress(description, self.level)
+            if len(compressed) < len(description):
+                description = compressed
+                flags |= self.COMPRESSED_DESCRIPTION
+        strings = (
+            video.id.encode("UTF-8"),
+            video.title.encode("UTF-8"),
+            description,
+            video.thumbnail.encode("UTF-8"),
+            video.url.encode("UTF-8"),
+        )
+        header = self.HEADER.pack(
+            self.marker[0], flags, video.length, *(len(s) for s in strings)
+        )
+        return header + b"".join(strings)
+
+    def decode(self, data: bytes) -> Video:
+        version, flags, length, *sizes = self.HEADER.unpack_from(data)
+        if version != self.marker[0]:
+            raise ValueError(f"Unsupported binary payload version: {version}")
+        strings = []
+        start = self.HEADER.size
+        for size in sizes:
+            strings.append(data[start : start + size])
+            start += size
+        video_id, title, description, thumbnail, url = strings
+        if flags & self.COMPRESSED_DESCRIPTION:
+            description = zlib.decompress(description)
+        return Video(
+            id=video_id.decode("UTF-8"),
+            title=title.decode("UTF-8"),
+            description=description.decode("UTF-8"),
+            thumbnail=thumbnail.decode("UTF-8"),
+            url=url.decode("UTF-8"),
+            length=length,
+        )
+
+
+CODECS: Dict[bytes, Codec] = {
+    codec.marker: codec for codec in (JsonCodec(), BinaryCodec())
+}
+
+
+def decode(data: Union[bytes, str]) -> Video:
+    """Decode a cached video, whatever the codec it was encoded with."""
+    if isinstance(data, str):
+        data = data.encode("UTF-8")
+    codec = CODECS.get(data[:1])
+    if codec is None:
+        raise ValueError(f"Unknown video payload marker: {data[:1]!r}")
+    return codec.decode(data)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+import dataclasses
+import gzip
+import hashlib
+import threading
+import time
+from typing import Optional, Tuple
+
+from rfeed import Enclosure, Feed, Guid, Item, iTunes, iTunesItem
+
+from ytpodcast.api import get_thumbnail_url
+from ytpodcast.youtube import Playlist
+from ytpodcast.youtube.lazy import LazyVideo, LazyVideos
+
+
+def render_feed(
+    playlist: Playlist, base_url: str, proxy_thumbnails: bool = False
+) -> bytes:
+    """Render a playlist as a podcast RSS feed, whose episodes are served from base_url.
+
+    With proxy_thumbnails, the artwork is served from base_url too, instead of from YouTube."""
+    base_url = base_url.rstrip("/")
+    # The videos of a lazy playlist are resolved a batch at a time here, leaving out the ones that failed
+    videos = list(playlist.videos)
+
+    def image(video_id: str, thumbnail: str) -> str:
+        if proxy_thumbnails and thumbnail:
+            return f"{base_url}{get_thumbnail_url(video_id)}"
+        return thumbnail
+
+    items = [
+        Item(
+            title=video.title,
+            link=f"https://www.youtube.com/watch?v={video.id}",
+            description=video.description,
+            guid=Guid(video.id, isPermaLink=False),
+            enclosure=Enclosure(
+                url=f"{base_url}{video.url}", length=0, type="audio/mp4"
+            ),
+            extensions=[
+                # Without publication dates, the order tells podcast clients the newest episodes
+                iTunesItem(
+                    image=image(video.id, video.thumbnail),
+                    duration=str(video.length),
+                    order=position,
+                )
+            ],
+        )
+        for position, video in enumerate(videos, start=1)
+    ]
+    playlist_image = playlist.thumbnail
+    # The thumbnail of a playlist is the one of its first video, left empty by a lazy playlist until it's rendered
+    if videos and playlist.thumbnail in ("", videos[0].thumbnail):
+        playlist_image = image(videos[0].id, videos[0].thumbnail)
+    feed = Feed(
+        title=playlist.title,
+        link=playlist.url,
+        description=playlist.description or playlist.title,
+        items=items,
+        extensions=[iTunes(image=playlist_image, summary=playlist.description)],
+    )
+    return feed.rss().encode("UTF-8")
+
+
+def content_version(
+    playlist: Playlist, base_url: str, proxy_thumbnails: bool = False
+) -> str:
+    """Hash everything a feed is rendered from: the feed has to be rendered again only if this changes.
+
+    The videos of a lazy playlist not resolved yet count with their id only, so that checking a feed doesn't
+    resolve them all."""
+    digest = hashlib.sha256(base_url.encode("UTF-8"))
+    digest.update(b"\0proxy" if proxy_thumbnails else b"\0")
+    for field in (playlist.title, playlist.description, playlist.thumbnail):
+        digest.update(b"\0" + field.encode("UTF-8"))
+    digest.update(b"\0" + playlist.url.encode("UTF-8"))
+    videos = playlist.videos
+    if isinstance(videos, LazyVideos):
+        videos = [videos.peek(index) for index in range(len(videos))]
+    for video in videos:
+        if isinstance(video, LazyVideo) and not video.resolved:
+            digest.update(b"\0" + video.id.encode("UTF-8"))
+        else:
+            digest.update(b"\0" + video.to_json().encode("UTF-8"))
+    return digest.hexdigest()
+
+
+@dataclasses.dataclass
+class RenderedFeed:
+    """A feed rendered once per content version, ready to be served as it is or gzipped."""
+
+    version: str
+    body: bytes
+    gzipped: bytes
+    # When this version was first rendered, and when the playlist was last checked for changes
+    modified_at: float
+    checked_at: float
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version[:32]}"'
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.modified_at, usegmt=True)
+
+    def not_modified(
+        self, if_none_match: Optional[str], if_modified_since: Optional[str]
+    ) -> bool:
+        """Tell if a client holding a copy described by the conditional request headers can keep using it."""
+        if if_none_match is not None:
+            # It takes precedence over If-Modified-Since
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(
+                (tag[2:] if tag.startswith("W/") else tag) == self.etag for tag in tags
+            )
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.modified_at) <= since
+        return False
+
+
+class FeedCache:
+    """Holds the last rendered feed of the playlists, so that a poll costs a lookup and a hash compare.
+
+    A feed is served as it is for ttl seconds. Then the playlist is built again, which the caches of YouTubeInfo
+    make cheap, but the feed is rendered again only if its content changed. At most max_feeds feeds are held, the
+    least recently used are dropped first."""
+
+    def __init__(self, ttl: float = 5 * 60, max_feeds: int = 256):
+        self.ttl = ttl
+        self.max_feeds = max_feeds
+        self._feeds: OrderedDict[Tuple[str, str], RenderedFeed] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, playlist_id: str, base_url: str) -> Optional[RenderedFeed]:
+        """Return the feed of a playlist, if it was checked less than ttl seconds ago."""
+        with self._lock:
+            feed = self._feeds.get((playlist_id, base_url))
+            if feed is None or time.time() - feed.checked_at >= self.ttl:
+                return None
+            self._feeds.move_to_end((playlist_id, base_url))
+            return feed
+
+    def update(
+        self, playlist: Playlist, base_url: str, proxy_thumbnails: bool = False
+    ) -> RenderedFeed:
+        """Return the feed of a freshly built playlist, rendering it only if its content changed.
+
+        With proxy_thumbnails, the artwork of the feed is served from base_url: see render_feed."""
+        version = content_version(playlist, base_url, proxy_thumbnails)
+        now = time.time()
+        key = (playlist.id, base_url)
+        with self._lock:
+            feed = self._feeds.get(key)
+        if feed is None or feed.version != version:
+            body = render_feed(playlist, base_url, proxy_thumbnails)
+            feed = RenderedFeed(
+                version=version,
+                body=body,
+                gzipped=gzip.compress(body, compresslevel=9),
+                modified_at=now,
+                checked_at=now,
+            )
+        else:
+            feed = dataclasses.replace(feed, checked_at=now)
+        with self._lock:
+            self._feeds[key] = feed
+            self._feeds.move_to_end(key)
+            while len(self._feeds) > self.max_feeds:
+                self._feeds.popitem(last=False)
+        return feed
@@ -0,0 +1,238 @@
+from __future__ import annotations
+from contextvars import ContextVar
+from functools import wraps
+import inspect
+import time
+from typing import Any, Callable, Optional, Tuple, Union
+
+from ytpodcast.cache import AsyncCache, BaseCache, Cache
+from ytpodcast.metrics import Registry
+from ytpodcast.tracing import Tracer
+from ytpodcast.youtube.base import AsyncYouTubeInfo, YouTubeInfo
+
+
+# The methods timed and counted, on every YouTubeInfo and every cache
+INFO_METHODS = (
+    "video_from_id",
+    "playlist_from_id",
+    "cached_playlist",
+    "_video_from_url",
+)
+CACHE_METHODS = (
+    "is_cached",
+    "save",
+    "load",
+    "lookup",
+    "get",
+    "save_unavailable",
+    "cached_ids",
+    "save_many",
+    "lookup_many",
+    "load_many",
+    "load_record",
+    "save_record",
+    "load_membership",
+    "save_membership",
+    "close",
+)
+
+# How the cache methods looking videos up tell hits from misses: (hits, misses) from the ids asked and the result
+HitCounter = Callable[[Tuple, Any], Tuple[int, int]]
+
+
+def _single(args: Tuple, result: Any) -> Tuple[int, int]:
+    return (1, 0) if result else (0, 1)
+
+
+def _loaded(args: Tuple, result: Any) -> Tuple[int, int]:
+    return (1, 0) if result is not None else (0, 1)
+
+
+def _many(args: Tuple, result: Any) -> Tuple[int, int]:
+    return len(result), len(args[0]) - len(result) if args else 0
+
+
+HIT_COUNTERS = {
+    "is_cached": _single,
+    "lookup": _single,
+    "get": _single,
+    "load": _loaded,
+    "cached_ids": _many,
+    "lookup_many": _many,
+    "load_many": _many,
+}
+
+
+class Instrumentation:
+    """Metrics, and optionally spans, of the calls to YouTubeInfo and cache methods.
+
+    Instrumenting an object wraps its methods on the object itself: objects that aren't instrumented run exactly
+    the code they would run without this module, so disabled instrumentation costs nothing."""
+
+    def __init__(
+        self, registry: Optional[Registry] = None, tracer: Optional[Tracer] = None
+    ):
+        self.registry = registry if registry is not None else Registry()
+        self.tracer = tracer
+        labels = ("component", "backend", "method")
+        self.calls = self.registry.counter(
+            "ytpodcast_calls_total", "Calls made, by outcome.", labels + ("outcome",)
+        )
+        self.durations = self.registry.histogram(
+            "ytpodcast_call_duration_seconds", "Duration of the calls.", labels
+        )
+        self.in_flight = self.registry.gauge(
+            "ytpodcast_calls_in_flight", "Calls running right now.", labels
+        )
+        self.hits = self.registry.counter(
+            "ytpodcast_cache_hits_total", "Videos found in a cache.", labels
+        )
+        self.misses = self.registry.counter(
+            "ytpodcast_cache_misses_total", "Videos not found in a cache.", labels
+        )
+        self.bytes = self.registry.counter(
+            "ytpodcast_cache_bytes_total",
+            "Bytes of encoded videos read from or written to a cache.",
+            ("backend", "direction"),
+        )
+        self.requests = self.registry.counter(
+            "ytpodcast_http_requests_total",
+            "HTTP requests served, by status.",
+            ("method", "route", "status"),
+        )
+        self.request_durations = self.registry.histogram(
+            "ytpodcast_http_request_duration_seconds",
+            "Duration of the HTTP requests.",
+            ("method", "route"),
+        )
+
+    def instrument_info(self, info: Union[YouTubeInfo, AsyncYouTubeInfo]) -> None:
+        """Instrument info and its cache, if it has one."""
+        for method in INFO_METHODS:
+            self._wrap(info, "info", info.name, method)
+        if info.cache is not None:
+            self.instrument_cache(info.cache)
+
+    def instrument_cache(self, cache: Union[Cache, AsyncCache]) -> None:
+        backend = type(cache).__name__
+        # Set while a method of this cache counts its hits: the methods it calls on itself (get calls lookup, lookup
+        # calls lookup_many...) don't count them again
+        counting = ContextVar(f"counting_{backend}_{id(cache)}", default=False)
+        for method in CACHE_METHODS:
+            if hasattr(cache, method):
+                self._wrap(
+                    cache, "cache", backend, method, HIT_COUNTERS.get(method), counting
+                )
+        self._count_bytes(cache, backend)
+
+    def _wrap(
+        self,
+        obj: Any,
+        component: str,
+        backend: str,
+        method: str,
+        count_hits: Optional[HitCounter] = None,
+        counting: Optional[ContextVar] = None,
+    ) -> None:
+        fn = getattr(obj, method)
+        if getattr(fn, "__instrumented__", False):
+            return
+        labels = (component, backend, method)
+        ok = self.calls.labels(*labels, "ok")
+        errors = self.calls.labels(*labels, "error")
+        durations = self.durations.labels(*labels)
+        in_flight = self.in_flight.labels(*labels)
+        hits = self.hits.labels(*labels)
+        misses = self.misses.labels(*labels)
+        tracer = self.tracer
+        span_name = f"{component}.{method}"
+        attributes = {"backend": backend}
+
+        def outermost() -> Optional[Any]:
+            """Mark a call counting hits, if no other call of the same cache is counting them already."""
+            if count_hits is None or counting is None or counting.get():
+                return None
+            return counting.set(True)
+
+        def done(args: Tuple, result: Any, token: Optional[Any]) -> None:
+            ok.inc()
+            if token is not None:
+                found, missed = count_hits(args, result)
+                hits.inc(found)
+                misses.inc(missed)
+
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if count_hits is _many and args:
+                    args = (list(args[0]),) + args[1:]
+                in_flight.inc()
+                token = outermost()
+                start = time.perf_counter()
+                try:
+                    if tracer is None:
+                        result = await fn(*args, **kwargs)
+                    else:
+                        with tracer.span(span_name, attributes):
+                            result = await fn(*args, **kwargs)
+                except BaseException:
+                    errors.inc()
+                    raise
+                finally:
+                    if token is not None:
+                        counting.reset(token)
+                    in_flight.dec()
+                    durations.observe(time.perf_counter() - start)
+                done(args, result, token)
+                return result
+
+        else:
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if count_hits is _many and args:
+                    # Iterated twice: by the cache and to count the misses
+                    args = (list(args[0]),) + args[1:]
+                in_flight.inc()
+                token = outermost()
+                start = time.perf_counter()
+                try:
+                    if tracer is None:
+                        result = fn(*args, **kwargs)
+                    else:
+                        with tracer.span(span_name, attributes):
+                            result = fn(*args, **kwargs)
+                except BaseException:
+                    errors.inc()
+                    raise
+                finally:
+                    if token is not None:
+                        counting.reset(token)
+                    in_flight.dec()
+                    durations.observe(time.perf_counter() - start)
+                done(args, result, token)
+                return result
+
+        wrapper.__instrumented__ = True
+        setattr(obj, method, wrapper)
+
+    def _count_bytes(self, cache: BaseCache, backend: str) -> None:
+        if getattr(cache._encode, "__instrumented__", False):
+            return
+        encode, decode = cache._encode, cache._decode
+        written = self.bytes.labels(backend, "write")
+        read = self.bytes.labels(backend, "read")
+
+        def counting_encode(video):
+            data = encode(video)
+            written.inc(len(data))
+            return data
+
+        def counting_decode(data):
+            read.inc(len(data))
+            return decode(data)
+
+        counting_encode.__instrumented__ = True
+        cache._encode = counting_encode
+        cache._decode = counting_decode
@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import Mapping, Optional
+
+import httpx
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+
+
+class StreamProxy:
+    """Relays streams to clients that can't follow a redirect to them, a chunk at a time.
+
+    Range requests are passed through, so seeking works, and at most chunk_size bytes are held for each download
+    in progress. Upstream connections are reused from the pool of client."""
+
+    # The request headers passed upstream, and the response headers passed back
+    REQUEST_HEADERS = ("range", "if-range")
+    RESPONSE_HEADERS = (
+        "accept-ranges",
+        "content-length",
+        "content-range",
+        "content-type",
+        "etag",
+        "last-modified",
+    )
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        chunk_size: int = 64 * 1024,
+        max_connections: int = 100,
+        timeout: float = 30.0,
+    ):
+        """Pass a client to share its connection pool: it won't be closed by close(). Otherwise one is made,
+        keeping up to max_connections connections alive."""
+        self.chunk_size = chunk_size
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def relay(
+        self, url: str, method: str = "GET", headers: Optional[Mapping[str, str]] = None
+    ) -> Response:
+        """Request url and return a response relaying what it answers."""
+        headers = headers or {}
+        request = self.client.build_request(
+            method,
+            url,
+            headers={
+                name: headers[name] for name in self.REQUEST_HEADERS if name in headers
+            },
+        )
+        upstream = await self.client.send(request, stream=True)
+        relayed = {
+            name: upstream.headers[name]
+            for name in self.RESPONSE_HEADERS
+            if name in upstream.headers
+        }
+        if method == "HEAD":
+            await upstream.aclose()
+            return Response(status_code=upstream.status_code, headers=relayed)
+        return StreamingResponse(
+            upstream.aiter_raw(self.chunk_size),
+            status_code=upstream.status_code,
+            headers=relayed,
+            # Gives the connection back to the pool, even when the client goes away halfway
+            background=BackgroundTask(upstream.aclose),
+        )
+
+    async def close(self) -> None:
+        if self._owns_client:
+            await self.client.aclose()
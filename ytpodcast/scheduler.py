@@ -0,0 +1,233 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+import dataclasses
+import heapq
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from ytpodcast.cache import Cache
+from ytpodcast.utils import is_channel_id, uploads_playlist_id
+from ytpodcast.youtube.base import ChannelCrawler, YouTubeInfo
+
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionRegistry:
+    """The playlists kept fresh in the background by a RefreshScheduler.
+
+    With a cache, the registry is a cache record: every process sharing the cache sees the same subscriptions, and
+    changes them with Cache.update_record, so that concurrent changes aren't lost."""
+
+    def __init__(self, cache: Optional[Cache] = None):
+        self.cache = cache
+        self._playlist_ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def subscribe_playlist(self, playlist_id: str) -> None:
+        self._update(
+            lambda playlist_ids: playlist_ids
+            if playlist_id in playlist_ids
+            else playlist_ids + [playlist_id]
+        )
+
+    def subscribe_channel(self, channel_id: str, crawl: bool = False) -> None:
+        """Subscribe to the playlist of all the uploads of a channel or, with crawl, to the channel itself: its
+        refreshes crawl its back catalogue too, a few pages at a time (see YouTubeInfo.channel_from_id), with the
+        infos that can (see ChannelCrawler)."""
+        self.subscribe_playlist(
+            channel_id if crawl else uploads_playlist_id(channel_id)
+        )
+
+    def unsubscribe(self, playlist_id: str) -> None:
+        self._update(
+            lambda playlist_ids: [
+                other for other in playlist_ids if other != playlist_id
+            ]
+        )
+
+    def playlist_ids(self) -> List[str]:
+        with self._lock:
+            return self._load()
+
+    def __contains__(self, playlist_id: str) -> bool:
+        return playlist_id in self.playlist_ids()
+
+    def _load(self) -> List[str]:
+        if self.cache is None:
+            return list(self._playlist_ids)
+        record = self.cache.load_record("subscriptions", "playlists")
+        return record["playlist_ids"] if record else []
+
+    def _update(self, change: Callable[[List[str]], List[str]]) -> None:
+        """Replace the subscribed playlist ids with what change makes of them, atomically."""
+        if self.cache is None:
+            with self._lock:
+                self._playlist_ids = change(list(self._playlist_ids))
+            return
+        self.cache.update_record(
+            "subscriptions",
+            "playlists",
+            lambda record: {
+                "playlist_ids": change(record["playlist_ids"] if record else [])
+            },
+        )
+
+
+@dataclasses.dataclass
+class Subscription:
+    """The refresh schedule of a subscribed playlist."""
+
+    playlist_id: str
+    interval: float
+    next_due: float
+    # The videos seen by the last refresh, to tell if the next one finds new ones
+    video_ids: Optional[Set[str]] = None
+
+
+class RefreshScheduler:
+    """Refreshes the subscribed playlists in the background, writing them into the cache of info, so that requests
+    find them already built.
+
+    Playlists are refreshed when they're due, soonest first, at most max_concurrent at a time. The interval of a
+    playlist adapts to how often it gets new videos: it halves when a refresh finds some and grows by half when it
+    doesn't (or fails), between min_interval and max_interval. Every due time is shifted by up to jitter times the
+    interval, so that playlists subscribed together don't stay in lockstep. Channels are refreshed with
+    channel_from_id, resolving only their channel_limit newest uploads."""
+
+    def __init__(
+        self,
+        info: YouTubeInfo,
+        registry: SubscriptionRegistry,
+        min_interval: float = 10 * 60,
+        max_interval: float = 12 * 60 * 60,
+        jitter: float = 0.1,
+        max_concurrent: int = 2,
+        poll_interval: float = 1.0,
+        channel_limit: Optional[int] = 50,
+    ):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.info = info
+        self.registry = registry
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.channel_limit = channel_limit
+        self.subscriptions: Dict[str, Subscription] = {}
+        # (next due time, playlist id): entries whose due time doesn't match their subscription are outdated
+        self._queue: List[Tuple[float, str]] = []
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def run_pending(self, now: Optional[float] = None) -> List[Future]:
+        """Start refreshing the playlists that are due, within the concurrency budget. Return their futures."""
+        now = time.time() if now is None else now
+        self._sync(now)
+        started = []
+        with self._lock:
+            while self._queue and len(self._running) < self.max_concurrent:
+                next_due, playlist_id = self._queue[0]
+                if next_due > now:
+                    break
+                heapq.heappop(self._queue)
+                subscription = self.subscriptions.get(playlist_id)
+                if subscription is None or subscription.next_due != next_due:
+                    continue
+                self._running.add(playlist_id)
+                started.append(self._get_executor().submit(self._refresh, subscription))
+        return started
+
+    def start(self) -> None:
+        """Run pending refreshes from a background thread, until stop() is called."""
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="ytpodcast-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, waiting for the running refreshes."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Could not run the pending refreshes")
+            self._stopped.wait(self.poll_interval)
+
+    def _sync(self, now: float) -> None:
+        """Schedule the new subscriptions, the first time within min_interval, and forget the cancelled ones."""
+        playlist_ids = self.registry.playlist_ids()
+        with self._lock:
+            for playlist_id in set(self.subscriptions) - set(playlist_ids):
+                del self.subscriptions[playlist_id]
+            for playlist_id in playlist_ids:
+                if playlist_id not in self.subscriptions:
+                    subscription = Subscription(
+                        playlist_id=playlist_id,
+                        interval=self.min_interval,
+                        next_due=now
+                        + random.uniform(0, self.jitter) * self.min_interval,
+                    )
+                    self.subscriptions[playlist_id] = subscription
+                    heapq.heappush(self._queue, (subscription.next_due, playlist_id))
+
+    def _refresh(self, subscription: Subscription) -> None:
+        try:
+            if isinstance(self.info, ChannelCrawler) and is_channel_id(
+                subscription.playlist_id
+            ):
+                playlist = self.info.channel_from_id(
+                    subscription.playlist_id, limit=self.channel_limit
+                )
+            else:
+                playlist = self.info.playlist_from_id(subscription.playlist_id)
+            video_ids = {video.id for video in playlist.videos}
+            found_new = subscription.video_ids is not None and bool(
+                video_ids - subscription.video_ids
+            )
+            subscription.video_ids = video_ids
+        except Exception:
+            logger.exception("Could not refresh playlist %s", subscription.playlist_id)
+            found_new = False
+        if found_new:
+            interval = max(self.min_interval, subscription.interval / 2)
+        else:
+            interval = min(self.max_interval, subscription.interval * 1.5)
+        with self._lock:
+            self._running.discard(subscription.playlist_id)
+            if self.subscriptions.get(subscription.playlist_id) is not subscription:
+                return
+            subscription.interval = interval
+            subscription.next_due = time.time() + interval * random.uniform(
+                1 - self.jitter, 1 + self.jitter
+            )
+            heapq.heappush(
+                self._queue, (subscription.next_due, subscription.playlist_id)
+            )
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return the pool running the refreshes: the lock must be held."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrent, thread_name_prefix="ytpodcast-refresh"
+            )
+        return self._executor
@@ -0,0 +1,497 @@
+from __future__ import annotations
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
+
+from ytpodcast.cache import Cache, CacheEntry, CacheStats, MISS, Miss
+from ytpodcast.codec import Codec
+from ytpodcast.youtube import Unavailable, Video
+
+
+MAGIC = b"YTPCSHM1"
+
+# magic, index slots and data bytes, followed by the counters below
+HEADER = struct.Struct("<8sQQ")
+HEADER_SIZE = 64
+COUNTER = struct.Struct("<Q")
+# Odd while the writer is changing the segment
+SEQUENCE = 24
+# Where the next record goes and where the oldest one is, as ever growing positions in the data ring
+HEAD = 32
+TAIL = 40
+ENTRIES = 48
+
+# An index slot: the hash of a key and the position of its record plus one (0 for an empty slot)
+SLOT = struct.Struct("<QQ")
+
+# A record, taking a multiple of ALIGNMENT bytes: its size, the size of its key, its kind and a time, followed by the key and the payload
+RECORD = struct.Struct("<IHBxd")
+ALIGNMENT = 16
+
+PADDING = 0
+VIDEO = 1
+UNAVAILABLE = 2
+RECORD_DATA = 3
+
+# Times a read is retried when the writer changed the segment under it, before it's counted as a miss
+READ_ATTEMPTS = 8
+
+
+def default_path() -> str:
+    """The file of the segment: in /dev/shm, where there is one, so that it never hits the disk."""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "ytpodcast-cache")
+
+
+def _hash(key: bytes) -> int:
+    # hash() is salted differently in every process: the index needs the same hash everywhere
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def _aligned(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedMemoryCache(Cache):
+    """A cache of encoded videos in a memory segment shared by every process of the host, optionally in front of
+    another Cache.
+
+    Every uvicorn worker opening the same path sees the same videos: one fetches a video, or loads it from the
+    backend, and the others find it without a round trip of their own. The segment is a file mapped in memory,
+    holding an open addressing hash index over a ring of records. Reads take no lock: the writer makes the sequence
+    counter odd while it changes the segment and a read that saw it change is retried (then counted as a miss).
+    Writes are made by a single process at a time, holding a lock on the file; when the ring is full the writer
+    evicts the oldest records, first in first out.
+
+    A new segment gets max_bytes of records and slots index slots (a power of two; one per 256 bytes of records, by
+    default), while an existing one keeps the size it was created with. Unless given, ttl and stale_ttl are the ones
+    of the backend; records are kept in the segment only without a backend."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        backend: Optional[Cache] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+        slots: Optional[int] = None,
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        codec: Optional[Codec] = None,
+    ):
+        super().__init__(
+            ttl=ttl if ttl is not None or not backend else backend.ttl,
+            stale_ttl=stale_ttl
+            if stale_ttl is not None or not backend
+            else backend.stale_ttl,
+            codec=codec,
+        )
+        if slots is None:
+            slots = 1 << max(6, math.ceil(math.log2(max(1, max_bytes // 256))))
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.path = path if path is not None else default_path()
+        self.backend = backend
+        self._hits = self._misses = self._evictions = 0
+        # flock locks belong to the open file, so they exclude the other instances on the same path, in this process
+        # too, and closing them doesn't release ours; the threads sharing this instance take turns with this lock
+        self._lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._map = self._open(slots, _aligned(max_bytes))
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mask = self.slots - 1
+        self._index = HEADER_SIZE
+        self._data = HEADER_SIZE + self.slots * SLOT.size
+
+    @property
+    def stats(self) -> CacheStats:
+        """The hits, misses and evictions of this process, and what the segment holds."""
+        return CacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            entries=self._counter(ENTRIES),
+            bytes=self._counter(HEAD) - self._counter(TAIL),
+        )
+
+    def is_cached(self, video_id: str) -> bool:
+        entry = self._lookup_shared(video_id, count=False)
+        if entry and isinstance(entry.value, Video):
+            return True
+        return self.backend is not None and self.backend.is_cached(video_id)
+
+    def save(self, video: Video) -> None:
+        self.save_many([video])
+
+    def load(self, video_id: str) -> Optional[Video]:
+        video = self.get(video_id)
+        return video if isinstance(video, Video) else None
+
+    def lookup(self, video_id: str) -> Union[CacheEntry, Miss]:
+        entry = self._lookup_shared(video_id)
+        if not entry and self.backend:
+            entry = self.backend.lookup(video_id)
+            if entry:
+                self._put_entries({video_id: entry})
+        return entry
+
+    def save_unavailable(
+        self, video_id: str, reason: str, ttl: Optional[int] = None
+    ) -> None:
+        if self.backend:
+            self.backend.save_unavailable(video_id, reason, ttl)
+        expires_at = time.time() + (ttl if ttl is not None else self.unavailable_ttl)
+        with self._writing():
+            self._put(
+                b"v:" + video_id.encode("UTF-8"),
+                UNAVAILABLE,
+                expires_at,
+                reason.encode("UTF-8"),
+            )
+
+    def cached_ids(self, video_ids: Iterable[str]) -> Set[str]:
+        video_ids = list(video_ids)
+        cached = set()
+        for video_id in video_ids:
+            entry = self._lookup_shared(video_id, count=False)
+            if entry and isinstance(entry.value, Video):
+                cached.add(video_id)
+        if self.backend:
+            cached |= self.backend.cached_ids(
+                video_id for video_id in video_ids if video_id not in cached
+            )
+        return cached
+
+    def save_many(self, videos: Iterable[Video]) -> None:
+        videos = list(videos)
+        if self.backend:
+            self.backend.save_many(videos)
+        now = time.time()
+        self._put_entries(
+            {video.id: CacheEntry(value=video, fetched_at=now) for video in videos}
+        )
+
+    def lookup_many(self, video_ids: Iterable[str]) -> Dict[str, CacheEntry]:
+        video_ids = list(video_ids)
+        entries = {}
+        for video_id in video_ids:
+            entry = self._lookup_shared(video_id)
+            if entry:
+                entries[video_id] = entry
+        missing = [video_id for video_id in video_ids if video_id not in entries]
+        if missing and self.backend:
+            found = self.backend.lookup_many(missing)
+            self._put_entries(found)
+            entries.update(found)
+            # Keep the order of video_ids, like the other caches
+            entries = {
+                video_id: entries[video_id]
+                for video_id in video_ids
+                if video_id in entries
+            }
+        return entries
+
+    def load_record(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        if self.backend:
+            return self.backend.load_record(kind, key)
+        return self._record_data(self._read(self._record_key(kind, key)))
+
+    def save_record(
+        self, kind: str, key: str, data: Dict[str, Any], ttl: Optional[int] = None
+    ) -> None:
+        if self.backend:
+            self.backend.save_record(kind, key, data, ttl)
+            return
+        expires_at = math.nan if ttl is None else time.time() + ttl
+        with self._writing():
+            self._put(
+                self._record_key(kind, key),
+                RECORD_DATA,
+                expires_at,
+                json.dumps(data).encode("UTF-8"),
+            )
+
+    def update_record(
+        self,
+        kind: str,
+        key: str,
+        update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+        ttl: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Update a record being the writer of the segment, so that no other process gets in between."""
+        if self.backend:
+            return self.backend.update_record(kind, key, update, ttl)
+        record_key = self._record_key(kind, key)
+        expires_at = math.nan if ttl is None else time.time() + ttl
+        with self._writing():
+            # The writer reads without waiting for the writer to be done
+            data = update(self._record_data(self._find(record_key, _hash(record_key))))
+            self._put(
+                record_key,
+                RECORD_DATA,
+                expires_at,
+                json.dumps(data).encode("UTF-8"),
+            )
+        return data
+
+    @staticmethod
+    def _record_data(
+        found: Optional[Tuple[int, float, bytes]]
+    ) -> Optional[Dict[str, Any]]:
+        """Decode a record found in the segment, unless it expired."""
+        if found is None:
+            return None
+        _, expires_at, payload = found
+        if not math.isnan(expires_at) and expires_at <= time.time():
+            return None
+        return json.loads(payload)
+
+    def clear(self) -> None:
+        """Drop every entry of the segment, for every process, leaving the backend untouched."""
+        with self._writing():
+            self._reset()
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def _open(self, slots: int, data_bytes: int) -> mmap.mmap:
+        """Map the segment, creating it if the file doesn't hold one: the file lock must be held."""
+        header = os.pread(self._fd, HEADER.size, 0)
+        if len(header) == HEADER.size and header.startswith(MAGIC):
+            _, self.slots, self.data_bytes = HEADER.unpack(header)
+            return mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+        self.slots, self.data_bytes = slots, data_bytes
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, HEADER_SIZE + slots * SLOT.size + data_bytes)
+        segment = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+        # The magic goes last: a process dying here leaves a file the next one initializes again
+        HEADER.pack_into(segment, 0, b"\0" * len(MAGIC), slots, data_bytes)
+        segment[: len(MAGIC)] = MAGIC
+        return segment
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Be the writer of the segment, telling the readers with the sequence counter."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                sequence = self._counter(SEQUENCE)
+                self._set_counter(SEQUENCE, sequence | 1)
+                try:
+                    if sequence % 2:
+                        # A writer died halfway through: nothing it left can be trusted
+                        self._reset()
+                    yield
+                finally:
+                    self._set_counter(SEQUENCE, (sequence | 1) + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _reset(self) -> None:
+        """Empty the segment: the write lock must be held."""
+        self._map[self._index : self._data] = bytes(self._data - self._index)
+        head = self._counter(HEAD)
+        self._set_counter(TAIL, head)
+        self._set_counter(ENTRIES, 0)
+
+    def _counter(self, offset: int) -> int:
+        return COUNTER.unpack_from(self._map, offset)[0]
+
+    def _set_counter(self, offset: int, value: int) -> None:
+        COUNTER.pack_into(self._map, offset, value)
+
+    @staticmethod
+    def _record_key(kind: str, key: str) -> bytes:
+        return f"r:{kind}:{key}".encode("UTF-8")
+
+    def _lookup_shared(
+        self, video_id: str, count: bool = True
+    ) -> Union[CacheEntry, Miss]:
+        found = self._read(b"v:" + video_id.encode("UTF-8"))
+        entry: Union[CacheEntry, Miss] = MISS
+        if found is not None:
+            kind, at, payload = found
+            if kind == VIDEO:
+                fetched_at = None if math.isnan(at) else at
+                entry = self._entry(self._decode(payload), fetched_at)
+            elif at > time.time():
+                reason = payload.decode("UTF-8")
+                entry = CacheEntry(
+                    Unavailable(video_id=video_id, reason=reason), None, expires_at=at
+                )
+        if count:
+            if entry:
+                self._hits += 1
+            else:
+                self._misses += 1
+        return entry
+
+    def _read(self, key: bytes) -> Optional[Tuple[int, float, bytes]]:
+        """Return the kind, time and payload of the record of key, if any, without taking any lock."""
+        key_hash = _hash(key)
+        for _ in range(READ_ATTEMPTS):
+            sequence = self._counter(SEQUENCE)
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            try:
+                found = self._find(key, key_hash)
+            except (struct.error, ValueError):
+                # Torn by the writer: the sequence tells, below
+                found = None
+            if self._counter(SEQUENCE) == sequence:
+                return found
+        return None
+
+    def _find(self, key: bytes, key_hash: int) -> Optional[Tuple[int, float, bytes]]:
+        tail, head = self._counter(TAIL), self._counter(HEAD)
+        for slot in self._probe(key_hash):
+            stored_hash, stored = SLOT.unpack_from(
+                self._map, self._index + slot * SLOT.size
+            )
+            if not stored:
+                return None
+            position = stored - 1
+            if stored_hash != key_hash or not tail <= position < head:
+                continue
+            offset = self._data + position % self.data_bytes
+            size, key_size, kind, at = RECORD.unpack_from(self._map, offset)
+            start = offset + RECORD.size
+            if self._map[start : start + key_size] == key:
+                return kind, at, self._map[start + key_size : offset + size]
+        return None
+
+    def _probe(self, key_hash: int) -> Iterator[int]:
+        """The slots where key_hash may be, in order: an empty one ends the search."""
+        for step in range(self.slots):
+            yield (key_hash + step) & self._mask
+
+    def _put_entries(self, entries: Dict[str, CacheEntry]) -> None:
+        records = []
+        for video_id, entry in entries.items():
+            if isinstance(entry.value, Video):
+                at = math.nan if entry.fetched_at is None else entry.fetched_at
+                records.append((VIDEO, at, self._encode(entry.value)))
+            else:
+                expires_at = entry.expires_at
+                if expires_at is None:
+                    # The backend can't tell when it expires: don't keep it longer than it would
+                    expires_at = time.time() + self.unavailable_ttl
+                records.append(
+                    (UNAVAILABLE, expires_at, entry.value.reason.encode("UTF-8"))
+                )
+        if not records:
+            return
+        with self._writing():
+            for video_id, (kind, at, payload) in zip(entries, records):
+                self._put(b"v:" + video_id.encode("UTF-8"), kind, at, payload)
+
+    def _put(self, key: bytes, kind: int, at: float, payload: bytes) -> None:
+        """Append a record and point the index at it: the write lock must be held."""
+        key_hash = self._remove(key)
+        length = RECORD.size + len(key) + len(payload)
+        size = _aligned(length)
+        if size > self.data_bytes // 4:
+            # It would push out too many others: leave it to the backend
+            return
+        head = self._counter(HEAD)
+        room = self.data_bytes - head % self.data_bytes
+        if room < size:
+            # Records never wrap around: pad up to the end of the ring
+            self._make_room(head + room)
+            RECORD.pack_into(
+                self._map, self._data + head % self.data_bytes, room, 0, PADDING, 0
+            )
+            head += room
+            self._set_counter(HEAD, head)
+        self._make_room(head + size)
+        offset = self._data + head % self.data_bytes
+        RECORD.pack_into(self._map, offset, length, len(key), kind, at)
+        start = offset + RECORD.size
+        self._map[start : start + len(key) + len(payload)] = key + payload
+        self._set_counter(HEAD, head + size)
+        for slot in self._probe(key_hash):
+            if not SLOT.unpack_from(self._map, self._index + slot * SLOT.size)[1]:
+                SLOT.pack_into(
+                    self._map, self._index + slot * SLOT.size, key_hash, head + 1
+                )
+                break
+        self._set_counter(ENTRIES, self._counter(ENTRIES) + 1)
+
+    def _make_room(self, end: int) -> None:
+        """Evict the oldest records until the ring can hold everything up to end, keeping a quarter of the index
+        slots free so that probes stay short."""
+        while self._counter(TAIL) < self._counter(HEAD) and (
+            end - self._counter(TAIL) > self.data_bytes
+            or self._counter(ENTRIES) >= self.slots * 3 // 4
+        ):
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        tail = self._counter(TAIL)
+        offset = self._data + tail % self.data_bytes
+        size, key_size, kind, _ = RECORD.unpack_from(self._map, offset)
+        if kind != PADDING:
+            start = offset + RECORD.size
+            key_hash = _hash(self._map[start : start + key_size])
+            for slot in self._probe(key_hash):
+                stored = SLOT.unpack_from(self._map, self._index + slot * SLOT.size)[1]
+                if not stored:
+                    break
+                if stored == tail + 1:
+                    self._delete_slot(slot)
+                    self._evictions += 1
+                    break
+        self._set_counter(TAIL, tail + _aligned(size))
+
+    def _remove(self, key: bytes) -> int:
+        """Drop key from the index, if it's there, returning its hash: its record stays until it's evicted."""
+        key_hash = _hash(key)
+        tail = self._counter(TAIL)
+        for slot in self._probe(key_hash):
+            stored_hash, stored = SLOT.unpack_from(
+                self._map, self._index + slot * SLOT.size
+            )
+            if not stored:
+                break
+            if stored_hash != key_hash or stored - 1 < tail:
+                continue
+            offset = self._data + (stored - 1) % self.data_bytes
+            key_size = RECORD.unpack_from(self._map, offset)[1]
+            start = offset + RECORD.size
+            if self._map[start : start + key_size] == key:
+                self._delete_slot(slot)
+                break
+        return key_hash
+
+    def _delete_slot(self, slot: int) -> None:
+        """Empty a slot, moving back the entries after it so that no probe stops early (no tombstones)."""
+        hole = slot
+        probe = slot
+        while True:
+            probe = (probe + 1) & self._mask
+            stored_hash, stored = SLOT.unpack_from(
+                self._map, self._index + probe * SLOT.size
+            )
+            if not stored:
+                break
+            # It can fill the hole if the hole is on its probe path, between its home slot and where it is
+            home = stored_hash & self._mask
+            if (probe - home) & self._mask >= (probe - hole) & self._mask:
+                SLOT.pack_into(
+                    self._map, self._index + hole * SLOT.size, stored_hash, stored
+                )
+                hole = probe
+        SLOT.pack_into(self._map, self._index + hole * SLOT.size, 0, 0)
+        self._set_counter(ENTRIES, self._counter(ENTRIES) - 1)
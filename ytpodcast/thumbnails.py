@@ -0,0 +1,272 @@
+from __future__ import annotations
+from collections import OrderedDict
+import dataclasses
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from ytpodcast.youtube.singleflight import AsyncSingleFlight
+
+
+# The side of the square artwork podcast directories ask for
+ARTWORK_SIZE = 1400
+
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "bin": "application/octet-stream",
+}
+
+# Turns the bytes of an image and the side of the artwork into the bytes of the artwork and their extension
+Resize = Callable[[bytes, int], Tuple[bytes, str]]
+
+
+def sniff_extension(data: bytes) -> str:
+    """Tell the extension of an image from its first bytes."""
+    if data.startswith(b"\xff\xd8"):
+        return "jpg"
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "bin"
+
+
+def resize_artwork(data: bytes, size: int) -> Tuple[bytes, str]:
+    """Crop an image to its centered square and scale it to a size x size JPEG.
+
+    It needs Pillow: without it, the image is kept as it is."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data, sniff_extension(data)
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        width, height = image.size
+        side = min(width, height)
+        left, top = (width - side) // 2, (height - side) // 2
+        image = image.crop((left, top, left + side, top + side))
+        image = image.resize((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=85, optimize=True)
+    return out.getvalue(), "jpg"
+
+
+@dataclasses.dataclass
+class Artwork:
+    """A stored artwork: digest is the SHA-256 of its bytes, so it changes only if they do."""
+
+    path: str
+    digest: str
+    media_type: str
+
+
+class ThumbnailStore:
+    """An on-disk store of the artwork made from the thumbnails of YouTube.
+
+    A thumbnail is downloaded and resized once: the artwork is stored under the hash of its bytes, so thumbnails
+    making the same artwork share a file, and an index remembers which artwork every thumbnail url made. The store
+    keeps within max_bytes dropping the least recently used artwork first, with the index entries pointing to it,
+    and survives restarts: recency is kept in the modification times of the files."""
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        size: int = ARTWORK_SIZE,
+        resize: Resize = resize_artwork,
+        client: Optional[httpx.AsyncClient] = None,
+        timeout: float = 10.0,
+        max_age: int = 30 * 24 * 60 * 60,
+    ):
+        """Pass a client to share its connection pool: it won't be closed by close(). Clients can keep the served
+        artwork for max_age seconds."""
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.size = size
+        self.resize = resize
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(timeout=timeout)
+        self._objects = os.path.join(directory, "objects")
+        self._urls = os.path.join(directory, "urls")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._urls, exist_ok=True)
+        # Artwork names (relative to the objects directory) and sizes, least recently used first
+        self._lru: OrderedDict[str, int] = OrderedDict()
+        self._names: Dict[str, str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = AsyncSingleFlight()
+        self._scan()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def lookup(self, url: str) -> Optional[Artwork]:
+        """Return the artwork made from the thumbnail at url, if it's stored, marking it as just used."""
+        key = self._url_key(url)
+        name = self._names.get(key)
+        if name is None:
+            try:
+                with open(os.path.join(self._urls, key), encoding="UTF-8") as f:
+                    name = f.read().strip()
+            except FileNotFoundError:
+                return None
+        with self._lock:
+            stale = name not in self._lru
+            if not stale:
+                self._lru.move_to_end(name)
+                self._names[key] = name
+            elif self._names.get(key) == name:
+                del self._names[key]
+        if stale:
+            # An entry left pointing to artwork evicted since
+            self._remove_index(key, name)
+            return None
+        path = os.path.join(self._objects, name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return self._artwork(name)
+
+    async def artwork(self, url: str) -> Artwork:
+        """Return the artwork made from the thumbnail at url, downloading and storing it if it's not stored yet.
+
+        Concurrent requests of the same thumbnail download it once."""
+        artwork = await run_in_threadpool(self.lookup, url)
+        if artwork is not None:
+            return artwork
+        return await self._flight.do(url, lambda: self._download(url))
+
+    def store(self, url: str, data: bytes) -> Artwork:
+        """Resize and store the thumbnail at url, whose bytes are data."""
+        data, extension = self.resize(data, self.size)
+        digest = hashlib.sha256(data).hexdigest()
+        name = os.path.join(digest[:2], f"{digest}.{extension}")
+        path = os.path.join(self._objects, name)
+        with self._lock:
+            stored = name in self._lru
+        if not stored:
+            _write_atomically(path, data)
+        _write_atomically(
+            os.path.join(self._urls, self._url_key(url)), name.encode("UTF-8")
+        )
+        with self._lock:
+            if name not in self._lru:
+                self._bytes += len(data)
+            self._lru[name] = len(data)
+            self._lru.move_to_end(name)
+            self._names[self._url_key(url)] = name
+            evicted, keys = self._evict()
+        for old in evicted:
+            try:
+                os.remove(os.path.join(self._objects, old))
+            except FileNotFoundError:
+                pass
+        for key, old in keys.items():
+            self._remove_index(key, old)
+        return self._artwork(name)
+
+    async def close(self) -> None:
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _download(self, url: str) -> Artwork:
+        response = await self.client.get(url)
+        response.raise_for_status()
+        return await run_in_threadpool(self.store, url, response.content)
+
+    def _evict(self) -> Tuple[List[str], Dict[str, str]]:
+        """Drop the least recently used artwork until the store fits in max_bytes. Return the names dropped, and
+        the index entries that pointed to them.
+
+        The artwork just stored is always kept, even if it alone is bigger than max_bytes."""
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._lru) > 1:
+            name, size = self._lru.popitem(last=False)
+            self._bytes -= size
+            evicted.append(name)
+        keys = {}
+        if evicted:
+            dropped = set(evicted)
+            keys = {key: name for key, name in self._names.items() if name in dropped}
+            for key in keys:
+                del self._names[key]
+        return evicted, keys
+
+    def _remove_index(self, key: str, name: str) -> None:
+        """Remove the index entry of key, unless it was pointed to other artwork since."""
+        path = os.path.join(self._urls, key)
+        try:
+            with open(path, encoding="UTF-8") as f:
+                if f.read().strip() == name:
+                    os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _scan(self) -> None:
+        """Load the stored artwork, least recently used first, and its index, dropping what an interrupted write
+        left behind."""
+        found = []
+        for prefix in os.listdir(self._objects):
+            for file_name in os.listdir(os.path.join(self._objects, prefix)):
+                path = os.path.join(self._objects, prefix, file_name)
+                if file_name.startswith("."):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append(
+                    (stat.st_mtime, os.path.join(prefix, file_name), stat.st_size)
+                )
+        for _, name, size in sorted(found):
+            self._lru[name] = size
+            self._bytes += size
+        # The index, but the entries pointing to artwork evicted while they weren't known
+        for key in os.listdir(self._urls):
+            path = os.path.join(self._urls, key)
+            if key.startswith("."):
+                os.remove(path)
+                continue
+            with open(path, encoding="UTF-8") as f:
+                name = f.read().strip()
+            if name in self._lru:
+                self._names[key] = name
+            else:
+                os.remove(path)
+
+    def _artwork(self, name: str) -> Artwork:
+        file_name = os.path.basename(name)
+        digest, extension = file_name.split(".", 1)
+        return Artwork(
+            path=os.path.join(self._objects, name),
+            digest=digest,
+            media_type=MEDIA_TYPES.get(extension, MEDIA_TYPES["bin"]),
+        )
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha256(url.encode("UTF-8")).hexdigest()
+
+
+def _write_atomically(path: str, data: bytes) -> None:
+    """Write data to path through a temporary file, so that readers never see half a file."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,94 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import dataclasses
+import itertools
+import time
+from typing import Any, Callable, ContextManager, Deque, Dict, Iterator, List, Optional
+
+
+class Tracer(ABC):
+    """Times spans of work, like a request or the calls made to serve it, for a tracing backend."""
+
+    @abstractmethod
+    def span(self, name: str, attributes: Dict[str, Any]) -> ContextManager:
+        """Return a context manager timing the span of work it wraps."""
+        pass
+
+
+@dataclasses.dataclass
+class Span:
+    """A finished span: parent_id is the id of the span it ran within, trace_id the one of the outermost."""
+
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    trace_id: int
+    start: float
+    duration: float
+    attributes: Dict[str, Any]
+    error: Optional[str] = None
+
+
+class RecordingTracer(Tracer):
+    """A Tracer keeping the last max_spans finished spans, and handing each of them to the exporters, which can ship
+    them to a tracing backend.
+
+    Spans nest within the span running in the same context: a request and the calls made to serve it, even in the
+    threadpool of the application, share a trace."""
+
+    def __init__(
+        self,
+        max_spans: int = 1000,
+        exporters: Optional[List[Callable[[Span], None]]] = None,
+    ):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self.exporters = exporters or []
+        self._current: ContextVar[Optional[Span]] = ContextVar(
+            "ytpodcast_span", default=None
+        )
+        self._ids = itertools.count(1)
+
+    @contextmanager
+    def span(self, name: str, attributes: Dict[str, Any]) -> Iterator[Span]:
+        parent = self._current.get()
+        span_id = next(self._ids)
+        span = Span(
+            name=name,
+            span_id=span_id,
+            parent_id=parent.span_id if parent else None,
+            trace_id=parent.trace_id if parent else span_id,
+            start=time.time(),
+            duration=0.0,
+            attributes=dict(attributes),
+        )
+        token = self._current.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self._current.reset(token)
+            self.spans.append(span)
+            for export in self.exporters:
+                export(span)
+
+
+class OpenTelemetryTracer(Tracer):
+    """A Tracer shipping spans through OpenTelemetry, which must be installed: spans go to whatever exporter the
+    application configured for it."""
+
+    def __init__(self, tracer: Any = None):
+        if tracer is None:
+            from opentelemetry import trace
+
+            tracer = trace.get_tracer("ytpodcast")
+        self.tracer = tracer
+
+    def span(self, name: str, attributes: Dict[str, Any]) -> ContextManager:
+        return self.tracer.start_as_current_span(name, attributes=attributes)
@@ -1,8 +1,31 @@
+from urllib.parse import urlsplit, parse_qs
+
+
 def video_url_from_id(video_id: str) -> str:
     """Return the full video ulr starting from the id."""
     return f"https://www.youtube.com/watch?v={video_id}"
 
 
+def video_id_from_url(url: str) -> str:
+    """Return the video id starting from the full video url."""
+    return parse_qs(urlsplit(url).query)["v"][0]
+
+
 def playlist_url_from_id(playlist_id: str) -> str:
     """Return the full playlist ulr starting from the id."""
     return f"https://www.youtube.com/playlist?list={playlist_id}"
+
+
+def uploads_playlist_id(channel_id: str) -> str:
+    """Return the id of the playlist of all the uploads of a channel, starting from the channel id."""
+    return f"UU{channel_id[2:]}"
+
+
+def channel_url_from_id(channel_id: str) -> str:
+    """Return the full channel url starting from the id."""
+    return f"https://www.youtube.com/channel/{channel_id}"
+
+
+def is_channel_id(some_id: str) -> bool:
+    """Tell if an id is the one of a channel, rather than of a playlist."""
+    return some_id.startswith("UC")
@@ -1,3 +1,43 @@
-from ytpodcast.youtube.models import Video, Playlist, Channel
+from ytpodcast.youtube.models import (
+    Video,
+    Playlist,
+    Channel,
+    Unavailable,
+    Membership,
+    UploadsPage,
+)
+from ytpodcast.youtube.exceptions import UpstreamUnavailableError, VideoUnavailableError
 
-from ytpodcast.youtube.pytube import PytubeInfo
+# The backends, imported on first use: each of them pulls in its YouTube library
+_LAZY = {
+    "PytubeInfo": "ytpodcast.youtube.pytube",
+    "PytubeStream": "ytpodcast.youtube.pytube",
+    "AsyncPytubeInfo": "ytpodcast.youtube.pytube",
+    "YoutubeDLInfo": "ytpodcast.youtube.youtube_dl",
+}
+
+__all__ = [
+    "Video",
+    "Playlist",
+    "Channel",
+    "Unavailable",
+    "Membership",
+    "UploadsPage",
+    "VideoUnavailableError",
+    "UpstreamUnavailableError",
+    *_LAZY,
+]
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return __all__
@@ -0,0 +1,24 @@
+from __future__ import annotations
+from typing import Optional, Type
+
+from ytpodcast.backends import BackendRegistry
+from ytpodcast.youtube.base import YouTubeInfo
+
+
+# The YouTubeInfo implementations, by name: each is imported only when picked, since it pulls in its YouTube library
+INFO_BACKENDS: BackendRegistry[YouTubeInfo] = BackendRegistry(
+    kind="YouTubeInfo",
+    group="ytpodcast.info_backends",
+    env_var="YTPODCAST_INFO_BACKEND",
+    default="pytube",
+    backends={
+        "pytube": "ytpodcast.youtube.pytube:PytubeInfo",
+        "youtube_dl": "ytpodcast.youtube.youtube_dl:YoutubeDLInfo",
+    },
+)
+
+
+def info_backend(name: Optional[str] = None) -> Type[YouTubeInfo]:
+    """Return the YouTubeInfo implementation called name or, if None, the one a deployment picked with the
+    YTPODCAST_INFO_BACKEND environment variable (pytube, if unset)."""
+    return INFO_BACKENDS.get(name)
@@ -1,35 +1,919 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Optional, TYPE_CHECKING
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    Optional,
+    List,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+    TYPE_CHECKING,
+)
+from urllib.parse import parse_qs, urlsplit
 
 
 if TYPE_CHECKING:
-    from ytpodcast.cache import Cache
-from ytpodcast.youtube import Video, Channel
+    from ytpodcast.cache import AsyncCache, Cache, CacheEntry
+from ytpodcast.utils import video_id_from_url, video_url_from_id
+from ytpodcast.youtube import (
+    Video,
+    Channel,
+    Playlist,
+    Unavailable,
+    Membership,
+    UploadsPage,
+)
+from ytpodcast.youtube.exceptions import UpstreamUnavailableError, VideoUnavailableError
+from ytpodcast.youtube.governor import FATAL, UpstreamGovernor, classify, status_code
+from ytpodcast.youtube.lazy import LazyVideos
+from ytpodcast.youtube.resolver import ParallelResolver
+from ytpodcast.youtube.singleflight import AsyncSingleFlight, SingleFlight
 
 
-class YouTubeInfo(ABC):
-    def __init__(self, cache: Optional[Cache] = None):
-        self.cache = cache
+logger = logging.getLogger(__name__)
+
+
+class BaseYouTubeInfo(ABC):
+    """What YouTubeInfo and AsyncYouTubeInfo share: how cached entries and playlist memberships are used."""
+
+    # Seconds a video that failed for good (private, removed...) isn't asked to YouTube again for: doubled at every
+    # failure in a row, up to max_failure_ttl
+    failure_ttl: int = 60 * 60
+    max_failure_ttl: int = 7 * 24 * 60 * 60
+
+    def __init__(
+        self,
+        stale_while_revalidate: bool = False,
+        playlist_rebuild_after: Optional[int] = 24 * 60 * 60,
+        governor: Optional[UpstreamGovernor] = None,
+    ):
+        """With stale_while_revalidate, stale cached videos are returned right away and refreshed in the
+        background; otherwise they're fetched again before answering.
+
+        Playlists are refreshed incrementally from their cached membership, which is rebuilt walking the whole
+        playlist again every playlist_rebuild_after seconds (never, if None) to notice removed videos.
+
+        With a governor, videos are asked to YouTube paced and retried by it. While it refuses to call YouTube,
+        videos and playlists are served from the cache, even if stale."""
+        self.playlist_rebuild_after = playlist_rebuild_after
+        self.stale_while_revalidate = stale_while_revalidate
+        self.governor = governor
 
     @property
     @abstractmethod
     def name(self) -> str:
         pass
 
+    def _check_upstream(self) -> None:
+        """Raise an UpstreamUnavailableError if the governor refuses to call YouTube right now."""
+        if self.governor is not None and not self.governor.available:
+            raise UpstreamUnavailableError(
+                "YouTube is unhealthy: not calling it for a while",
+                self.governor.breaker.retry_after(),
+            )
+
+    @staticmethod
+    def _playlist_record(playlist: Channel) -> Dict[str, Any]:
+        """Return what's cached of a playlist besides its membership and its videos, and when it was built."""
+        return {
+            "title": playlist.title,
+            "description": playlist.description,
+            "thumbnail": playlist.thumbnail,
+            "url": playlist.url,
+            "built_at": time.time(),
+        }
+
+    @classmethod
+    def _playlist_from_cached(
+        cls,
+        playlist_id: str,
+        record: Optional[Dict[str, Any]],
+        video_ids: List[str],
+        entries: Dict[str, CacheEntry],
+        kind: Type[Playlist] = Playlist,
+    ) -> Optional[Channel]:
+        """Build a playlist, or another kind of it, from its cached record and the cache entries of its video_ids,
+        or return None if anything is missing. Unavailable videos are left out, and reported in its errors; a
+        record without a thumbnail, like the one of a channel, gets the one of its first video."""
+        if record is None or any(video_id not in entries for video_id in video_ids):
+            return None
+        videos = [
+            entries[video_id].value
+            for video_id in video_ids
+            if isinstance(entries[video_id].value, Video)
+        ]
+        info = {field: value for field, value in record.items() if field != "built_at"}
+        if not info.get("thumbnail"):
+            info["thumbnail"] = cls._thumbnail_of(videos)
+        playlist = kind(id=playlist_id, videos=videos, **info)
+        playlist.errors = {
+            video_id: entries[video_id].value.reason
+            for video_id in video_ids
+            if isinstance(entries[video_id].value, Unavailable)
+        }
+        return playlist
+
+    @classmethod
+    def _partial(
+        cls, video_ids: List[str], results: List[Union[Video, Exception]]
+    ) -> Tuple[List[Video], Dict[str, str]]:
+        """Split what resolving the videos of a playlist gave into the videos and why the others failed, by id, so
+        that a video that went private doesn't take the playlist down with it.
+
+        YouTube being unavailable is raised instead: a playlist missing every video YouTube didn't answer for is
+        worse than the cached one."""
+        videos, errors = [], {}
+        for video_id, result in zip(video_ids, results):
+            if isinstance(result, UpstreamUnavailableError):
+                raise result
+            if isinstance(result, Exception):
+                errors[video_id] = cls._describe(result)
+            else:
+                videos.append(result)
+        return videos, errors
+
+    @staticmethod
+    def _thumbnail_of(videos: Sequence[Video]) -> str:
+        """The thumbnail of a playlist: the one of its first video, if it has any.
+
+        It's left empty for LazyVideos, not to resolve their first batch for it: the feed takes the one of the first
+        video it renders."""
+        if isinstance(videos, LazyVideos):
+            return ""
+        for video in videos:
+            return video.thumbnail
+        return ""
+
+    def _failure_ttl(
+        self, record: Optional[Dict[str, Any]]
+    ) -> Tuple[int, Dict[str, Any]]:
+        """Return for how many seconds to remember that a video failed once more, after the failures in a row of
+        its record, and its new record."""
+        failures = (record or {}).get("failures", 0) + 1
+        ttl = min(self.failure_ttl * 2 ** (failures - 1), self.max_failure_ttl)
+        return ttl, {"failures": failures}
+
+    @staticmethod
+    def _describe(error: Exception) -> str:
+        """Tell why a video failed, the same way whether it just failed or its failure was cached."""
+        if isinstance(error, VideoUnavailableError):
+            return error.reason
+        return f"{type(error).__name__}: {error}"
+
+    @classmethod
+    def _failure_reason(cls, error: Exception) -> Optional[str]:
+        """Return why a video failed for good, to be remembered, or None if it could go better if asked again.
+
+        Only an unavailable video or a request YouTube refused with a 4xx failed for good: an error nobody knows,
+        like the parser of a library breaking, would otherwise keep every video it hit out of the feeds for days."""
+        if isinstance(error, VideoUnavailableError):
+            return cls._describe(error)
+        code = status_code(error)
+        if code is not None and 400 <= code < 500 and classify(error) == FATAL:
+            return cls._describe(error)
+        return None
+
+    @staticmethod
+    def _log_errors(playlist: Channel) -> None:
+        if playlist.errors:
+            logger.warning(
+                "Left %d videos out of %s: %s",
+                len(playlist.errors),
+                playlist.id,
+                ", ".join(f"{k} ({v})" for k, v in playlist.errors.items()),
+            )
+
+    def _split_entries(
+        self, urls: List[str], entries: Dict[str, CacheEntry]
+    ) -> Tuple[Dict[str, Video], List[Exception], List[str], List[str]]:
+        """Split urls by what the cache knows about them, returning the usable cached videos keyed by id, the
+        known failures, the urls to fetch and the stale urls to refresh in the background."""
+        videos, unavailable, missing, stale = {}, [], [], []
+        for url in urls:
+            video_id = video_id_from_url(url)
+            entry = entries.get(video_id)
+            if entry and isinstance(entry.value, Unavailable):
+                unavailable.append(VideoUnavailableError(video_id, entry.value.reason))
+            elif entry and (not entry.stale or self.stale_while_revalidate):
+                videos[video_id] = entry.value
+                if entry.stale:
+                    stale.append(url)
+            else:
+                missing.append(url)
+        return videos, unavailable, missing, stale
+
+    def _walk_playlist(
+        self,
+        playlist_id: str,
+        membership: Optional[Membership],
+        video_urls: Iterator[str],
+        limit: Optional[int] = None,
+    ) -> Tuple[List[str], Optional[Membership]]:
+        """Walk video_urls, which lists a playlist newest first, returning its video ids and the membership to
+        cache, if it changed.
+
+        With a recent enough membership the walk stops at the first known video and only the new ones are added to
+        it, so that refreshing a playlist costs as much as what's new in it."""
+        if membership and (
+            self.playlist_rebuild_after is None
+            or time.time() - membership.fetched_at < self.playlist_rebuild_after
+        ):
+            known = set(membership.video_ids)
+            new_ids = []
+            for url in video_urls:
+                video_id = video_id_from_url(url)
+                if video_id in known:
+                    break
+                new_ids.append(video_id)
+            video_ids = new_ids + membership.video_ids
+            if new_ids:
+                return video_ids, Membership(
+                    playlist_id, video_ids, membership.fetched_at
+                )
+            return video_ids, None
+        video_ids = []
+        for url in video_urls:
+            video_ids.append(video_id_from_url(url))
+            if limit and len(video_ids) >= limit:
+                # Only a complete walk can be used to refresh the playlist later
+                return video_ids, None
+        return video_ids, Membership(playlist_id, video_ids, time.time())
+
+
+class ChannelCrawler(ABC):
+    """A YouTubeInfo that can page through the uploads of a channel: only then channel_from_id can crawl a channel,
+    and the feeds and refreshes of a channel id read it as a channel rather than as a playlist."""
+
     @abstractmethod
+    def _uploads_page(
+        self, channel_id: str, continuation: Optional[str] = None
+    ) -> UploadsPage:
+        """Return the page of the uploads of a channel that continuation points to, or the first one if None."""
+        pass
+
+
+class YouTubeInfo(BaseYouTubeInfo):
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        workers: int = 1,
+        max_per_host: Optional[int] = None,
+        stale_while_revalidate: bool = False,
+        playlist_rebuild_after: Optional[int] = 24 * 60 * 60,
+        single_flight: Optional[SingleFlight] = None,
+        lazy: bool = False,
+        batch_size: int = 20,
+        governor: Optional[UpstreamGovernor] = None,
+    ):
+        """Concurrent requests for the same video or playlist are coalesced by single_flight: pass a
+        RedisSingleFlight to coalesce them across processes too.
+
+        If lazy, the videos of a playlist are LazyVideos, resolved batch_size at a time only when they're reached,
+        and a playlist is returned as soon as it's listed."""
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        super().__init__(
+            stale_while_revalidate=stale_while_revalidate,
+            playlist_rebuild_after=playlist_rebuild_after,
+            governor=governor,
+        )
+        self.cache = cache
+        self.lazy = lazy
+        self.batch_size = batch_size
+        self.resolver = ParallelResolver(workers=workers, max_per_host=max_per_host)
+        self.single_flight = (
+            single_flight if single_flight is not None else SingleFlight()
+        )
+        self._refreshing: Set[str] = set()
+        self._refresh_lock = threading.Lock()
+        self._refresher: Optional[ThreadPoolExecutor] = None
+
     def video_from_id(self, video_id: str) -> Video:
+        url = video_url_from_id(video_id)
+        entry = self.cache.lookup(video_id) if self.cache else None
+        if entry:
+            if isinstance(entry.value, Unavailable):
+                raise VideoUnavailableError(video_id, entry.value.reason)
+            if not entry.stale:
+                return entry.value
+            if self.stale_while_revalidate:
+                self._schedule_refresh([url])
+                return entry.value
+        return self._fetch_video(url)
+
+    def playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        return self.single_flight.do(
+            f"playlist:{playlist_id}:{limit}",
+            partial(self._build_playlist, playlist_id, limit),
+            partial(self._built_playlist, playlist_id, limit, time.time()),
+        )
+
+    def cached_playlist(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Optional[Channel]:
+        """Return a playlist as it was last built, from the cache only, or None if it's not all cached."""
+        membership = self.cache.load_membership(playlist_id) if self.cache else None
+        if membership is None:
+            return None
+        video_ids = membership.video_ids[:limit]
+        return self._playlist_from_cached(
+            playlist_id,
+            self.cache.load_record("playlist", playlist_id),
+            video_ids,
+            self.cache.lookup_many(video_ids),
+        )
+
+    def cached_channel(
+        self, channel_id: str, limit: Optional[int] = None
+    ) -> Optional[Channel]:
+        """Return the first limit uploads of a channel found so far, from the cache only, or None if they're not
+        all cached."""
+        membership = self.cache.load_membership(channel_id) if self.cache else None
+        if membership is None:
+            return None
+        video_ids = membership.video_ids[:limit]
+        return self._playlist_from_cached(
+            channel_id,
+            self.cache.load_record("channel", channel_id),
+            video_ids,
+            self.cache.lookup_many(video_ids),
+            Channel,
+        )
+
+    def channel_from_id(
+        self,
+        channel_id: str,
+        limit: Optional[int] = None,
+        max_pages: Optional[int] = 10,
+    ) -> Channel:
+        """Return the first limit uploads (all, if None) of a channel found so far, newest first.
+
+        The uploads are crawled a page at a time, resolving and caching the videos of every page before the next
+        one: the new uploads first, then up to max_pages pages (all, if None) of the back catalogue, from where
+        the last crawl stopped. With a cache, where a crawl stopped is cached after every page, so that a large
+        channel is crawled over many calls, like the runs of a RefreshScheduler, and in bounded memory.
+
+        Only a ChannelCrawler can crawl a channel: any other info raises a TypeError."""
+        if not isinstance(self, ChannelCrawler):
+            raise TypeError(f"{self.name} can't page through the uploads of a channel")
+        try:
+            self._check_upstream()
+            info, video_ids = self.single_flight.do(
+                f"crawl:{channel_id}",
+                partial(self._crawl_channel, channel_id, max_pages),
+            )
+        except UpstreamUnavailableError:
+            record = (
+                self.cache.load_record("channel", channel_id) if self.cache else None
+            )
+            membership = self.cache.load_membership(channel_id) if self.cache else None
+            if record is None or membership is None:
+                raise
+            logger.warning(
+                "YouTube is unavailable: serving %s from the cache", channel_id
+            )
+            info, video_ids = record, membership.video_ids
+        urls = [video_url_from_id(video_id) for video_id in video_ids[:limit]]
+        videos, errors = self._videos_from_urls(urls)
+        channel = Channel(
+            id=channel_id, thumbnail=self._thumbnail_of(videos), videos=videos, **info
+        )
+        channel.errors = errors
+        self._log_errors(channel)
+        return channel
+
+    @abstractmethod
+    def _playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
         pass
 
     @abstractmethod
-    def playlist_from_id(
+    def _video_from_url(self, url: str) -> Video:
+        pass
+
+    def _crawl_channel(
+        self, channel_id: str, max_pages: Optional[int]
+    ) -> Tuple[Dict[str, str], List[str]]:
+        """Crawl the uploads of a channel as channel_from_id tells, returning the info of the channel and the ids
+        of the uploads found so far, newest first."""
+        membership = self.cache.load_membership(channel_id) if self.cache else None
+        state = self.cache.load_record("crawl", channel_id) if self.cache else None
+        # A crawl without a continuation, and not complete, starts from the first page
+        state = state or {"continuation": None, "complete": False}
+        video_ids = list(membership.video_ids) if membership else []
+        known = set(video_ids)
+        info = None
+        if video_ids or state["complete"]:
+            # The new uploads, down to the first known one
+            new_ids: List[str] = []
+            continuation = None
+            while True:
+                page = self._page(channel_id, continuation)
+                info = info or page.info
+                fresh = []
+                for video_id in page.video_ids:
+                    if video_id in known:
+                        break
+                    fresh.append(video_id)
+                self._prefetch(fresh)
+                new_ids += fresh
+                continuation = page.continuation
+                if len(fresh) < len(page.video_ids) or continuation is None:
+                    break
+            video_ids = new_ids + video_ids
+            known.update(new_ids)
+            self._save_crawl(channel_id, video_ids, state)
+        pages = 0
+        while not state["complete"] and (max_pages is None or pages < max_pages):
+            try:
+                page = self._page(channel_id, state["continuation"])
+            except Exception as e:
+                if (
+                    state["continuation"] is None
+                    or isinstance(e, UpstreamUnavailableError)
+                    or classify(e) != FATAL
+                ):
+                    raise
+                # Continuations expire: walk again from the first page, skipping what's known, next time
+                logger.warning(
+                    "Could not resume the crawl of %s, restarting it: %s", channel_id, e
+                )
+                state = {"continuation": None, "complete": False}
+                self._save_crawl(channel_id, video_ids, state)
+                break
+            pages += 1
+            info = info or page.info
+            fresh = [video_id for video_id in page.video_ids if video_id not in known]
+            self._prefetch(fresh)
+            video_ids += fresh
+            known.update(fresh)
+            state = {
+                "continuation": page.continuation,
+                "complete": page.continuation is None,
+            }
+            self._save_crawl(channel_id, video_ids, state)
+        if info is None:
+            # The first page wasn't read, like when resuming a crawl without any upload found yet
+            record = (
+                self.cache.load_record("channel", channel_id) if self.cache else None
+            )
+            info = record or self._page(channel_id, None).info
+        if self.cache:
+            self.cache.save_record("channel", channel_id, info)
+        return info, video_ids
+
+    def _prefetch(self, video_ids: List[str]) -> None:
+        """Resolve and cache the videos of a page before reading the next one. Without a cache they would be thrown
+        away: channel_from_id resolves the ones it returns anyway."""
+        if self.cache:
+            self._resolve_batch([video_url_from_id(video_id) for video_id in video_ids])
+
+    def _page(self, channel_id: str, continuation: Optional[str]) -> UploadsPage:
+        if self.governor is None:
+            return self._uploads_page(channel_id, continuation)
+        return self.governor.call(self._uploads_page, channel_id, continuation)
+
+    def _save_crawl(
+        self, channel_id: str, video_ids: List[str], state: Dict[str, Any]
+    ) -> None:
+        """Cache the uploads found so far and where the crawl stopped."""
+        if self.cache:
+            self.cache.save_membership(Membership(channel_id, video_ids, time.time()))
+            self.cache.save_record("crawl", channel_id, state)
+
+    def _build_playlist(self, playlist_id: str, limit: Optional[int] = None) -> Channel:
+        try:
+            self._check_upstream()
+            playlist = self._playlist_from_id(playlist_id, limit)
+        except UpstreamUnavailableError:
+            cached = self.cached_playlist(playlist_id, limit)
+            if cached is None:
+                raise
+            logger.warning(
+                "YouTube is unavailable: serving %s from the cache", playlist_id
+            )
+            return cached
+        self._log_errors(playlist)
+        if self.cache:
+            self.cache.save_record(
+                "playlist", playlist_id, self._playlist_record(playlist)
+            )
+        return playlist
+
+    def _videos_from_urls(
+        self, urls: List[str]
+    ) -> Tuple[Sequence[Video], Dict[str, str]]:
+        """Resolve all urls, keeping their order, or leave them to LazyVideos if lazy.
+
+        Return the videos and why the ones left out failed, by id (see _partial). LazyVideos leave a failed video
+        out when they're iterated, adding why to the same errors as they go."""
+        if self.lazy:
+            videos = LazyVideos(
+                urls, self._resolve_batch, self.batch_size, self._describe
+            )
+            return videos, videos.errors
+        results = self._resolve_batch(urls)
+        ids = [video_id_from_url(url) for url in urls]
+        return self._partial(ids, [results[video_id] for video_id in ids])
+
+    def _resolve_batch(self, urls: List[str]) -> Dict[str, Union[Video, Exception]]:
+        """Resolve urls, returning every video, or why it failed, by id.
+
+        Cached videos are looked up in a single batch and only the missing (or stale) ones are fetched, and then
+        saved, with the resolver."""
+        ids = [video_id_from_url(url) for url in urls]
+        entries = self.cache.lookup_many(ids) if self.cache else {}
+        videos, unavailable, missing, stale = self._split_entries(urls, entries)
+        if stale:
+            self._schedule_refresh(stale)
+        results: Dict[str, Union[Video, Exception]] = dict(videos)
+        results.update((error.video_id, error) for error in unavailable)
+        outcomes = self.resolver.resolve(self._fetch_video, missing)
+        results.update(
+            (video_id_from_url(url), outcome) for url, outcome in zip(missing, outcomes)
+        )
+        return results
+
+    def _playlist_video_urls(
+        self, playlist_id: str, video_urls: Iterator[str], limit: Optional[int] = None
+    ) -> List[str]:
+        """Return the first limit urls (all, if None) of a playlist from video_urls, which walks the playlist
+        newest first, keeping its cached membership up to date."""
+        membership = self.cache.load_membership(playlist_id) if self.cache else None
+        video_ids, membership = self._walk_playlist(
+            playlist_id, membership, video_urls, limit
+        )
+        if self.cache and membership:
+            self.cache.save_membership(membership)
+        return [video_url_from_id(video_id) for video_id in video_ids[:limit]]
+
+    def _fetch(self, urls: List[str]) -> Tuple[List[Video], List[Exception]]:
+        """Fetch urls with the resolver, returning the videos and the failures."""
+        results = self.resolver.resolve(self._fetch_video, urls)
+        fetched = [result for result in results if not isinstance(result, Exception)]
+        failures = [result for result in results if isinstance(result, Exception)]
+        return fetched, failures
+
+    def _fetch_video(self, url: str) -> Video:
+        """Fetch a video, coalescing concurrent fetches of the same one."""
+        video_id = video_id_from_url(url)
+        return self.single_flight.do(
+            f"video:{video_id}",
+            partial(self._fetch_and_save, url),
+            partial(self._fresh_video, video_id),
+        )
+
+    def _fetch_and_save(self, url: str) -> Video:
+        """Fetch a video and cache it, or remember that it failed for good.
+
+        If YouTube is unavailable, the cached video is returned even if stale."""
+        try:
+            if self.governor is None:
+                video = self._video_from_url(url)
+            else:
+                video = self.governor.call(self._video_from_url, url)
+        except UpstreamUnavailableError:
+            entry = self.cache.lookup(video_id_from_url(url)) if self.cache else None
+            if not entry or not isinstance(entry.value, Video):
+                raise
+            return entry.value
+        except Exception as e:
+            reason = self._failure_reason(e)
+            if reason is not None:
+                self._remember_failure(video_id_from_url(url), reason)
+            raise
+        if self.cache:
+            self.cache.save(video)
+        return video
+
+    def _built_playlist(
+        self, playlist_id: str, limit: Optional[int], since: float
+    ) -> Optional[Channel]:
+        """Return the playlist from the cache if it was built since then, like by another process."""
+        record = self.cache.load_record("playlist", playlist_id) if self.cache else None
+        if record is None or record.get("built_at", 0) < since:
+            return None
+        return self.cached_playlist(playlist_id, limit)
+
+    def _fresh_video(self, video_id: str) -> Optional[Video]:
+        """Return the video if it's cached and fresh, like after another process fetched it."""
+        entry = self.cache.lookup(video_id) if self.cache else None
+        if entry and isinstance(entry.value, Unavailable):
+            raise VideoUnavailableError(video_id, entry.value.reason)
+        return entry.value if entry and not entry.stale else None
+
+    def _remember_failure(self, video_id: str, reason: str) -> None:
+        """Negatively cache a video that failed for good, so that it's not asked to YouTube again for a while:
+        longer at every failure in a row."""
+        if self.cache:
+            ttl, record = self._failure_ttl(self.cache.load_record("failure", video_id))
+            self.cache.save_unavailable(video_id, reason, ttl)
+            # The count outlives the negative entry, to be found when the video is asked again and fails again
+            self.cache.save_record("failure", video_id, record, ttl * 2)
+
+    def _schedule_refresh(self, urls: List[str]) -> None:
+        """Refresh the videos in the background, unless a refresh is already running for them."""
+        with self._refresh_lock:
+            urls = [url for url in urls if url not in self._refreshing]
+            if not urls:
+                return
+            self._refreshing.update(urls)
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="ytpodcast-refresher"
+                )
+            self._refresher.submit(self._refresh, urls)
+
+    def _refresh(self, urls: List[str]) -> None:
+        try:
+            _, failures = self._fetch(urls)
+            for failure in failures:
+                logger.warning("Could not refresh a stale video: %s", failure)
+        finally:
+            with self._refresh_lock:
+                self._refreshing.difference_update(urls)
+
+
+class AsyncYouTubeInfo(BaseYouTubeInfo):
+    """The asyncio counterpart of YouTubeInfo: a playlist resolves its videos concurrently, up to concurrency at a
+    time, without tying up a thread for each one."""
+
+    def __init__(
+        self,
+        cache: Optional[AsyncCache] = None,
+        concurrency: int = 16,
+        stale_while_revalidate: bool = False,
+        playlist_rebuild_after: Optional[int] = 24 * 60 * 60,
+        governor: Optional[UpstreamGovernor] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        super().__init__(
+            stale_while_revalidate=stale_while_revalidate,
+            playlist_rebuild_after=playlist_rebuild_after,
+            governor=governor,
+        )
+        self.cache = cache
+        self.concurrency = concurrency
+        self.single_flight = AsyncSingleFlight()
+        # Created on first use, since before python 3.10 it's bound to the event loop running when it's created
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._refreshing: Set[str] = set()
+        self._refreshes: Set[asyncio.Future] = set()
+
+    async def video_from_id(self, video_id: str) -> Video:
+        url = video_url_from_id(video_id)
+        entry = await self.cache.lookup(video_id) if self.cache else None
+        if entry:
+            if isinstance(entry.value, Unavailable):
+                raise VideoUnavailableError(video_id, entry.value.reason)
+            if not entry.stale:
+                return entry.value
+            if self.stale_while_revalidate:
+                self._schedule_refresh([url])
+                return entry.value
+        return await self._fetch_video(url)
+
+    async def playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        return await self.single_flight.do(
+            f"playlist:{playlist_id}:{limit}",
+            partial(self._build_playlist, playlist_id, limit),
+        )
+
+    async def cached_playlist(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Optional[Channel]:
+        """Return a playlist as it was last built, from the cache only, or None if it's not all cached."""
+        membership = (
+            await self.cache.load_membership(playlist_id) if self.cache else None
+        )
+        if membership is None:
+            return None
+        video_ids = membership.video_ids[:limit]
+        return self._playlist_from_cached(
+            playlist_id,
+            await self.cache.load_record("playlist", playlist_id),
+            video_ids,
+            await self.cache.lookup_many(video_ids),
+        )
+
+    async def _build_playlist(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        try:
+            self._check_upstream()
+            playlist = await self._playlist_from_id(playlist_id, limit)
+        except UpstreamUnavailableError:
+            cached = await self.cached_playlist(playlist_id, limit)
+            if cached is None:
+                raise
+            logger.warning(
+                "YouTube is unavailable: serving %s from the cache", playlist_id
+            )
+            return cached
+        self._log_errors(playlist)
+        if self.cache:
+            await self.cache.save_record(
+                "playlist", playlist_id, self._playlist_record(playlist)
+            )
+        return playlist
+
+    @abstractmethod
+    async def _playlist_from_id(
         self, playlist_id: str, limit: Optional[int] = None
     ) -> Channel:
         pass
 
+    @abstractmethod
+    async def _video_from_url(self, url: str) -> Video:
+        pass
+
+    async def close(self) -> None:
+        """Wait for the background refreshes still running."""
+        if self._refreshes:
+            await asyncio.gather(*self._refreshes, return_exceptions=True)
+
+    async def _videos_from_urls(
+        self, urls: List[str]
+    ) -> Tuple[List[Video], Dict[str, str]]:
+        """Resolve all urls, keeping their order, returning the videos and why the ones left out failed, like
+        YouTubeInfo._videos_from_urls."""
+        ids = [video_id_from_url(url) for url in urls]
+        entries = await self.cache.lookup_many(ids) if self.cache else {}
+        videos, unavailable, missing, stale = self._split_entries(urls, entries)
+        if stale:
+            self._schedule_refresh(stale)
+        results: Dict[str, Union[Video, Exception]] = dict(videos)
+        results.update((error.video_id, error) for error in unavailable)
+        outcomes = await self._resolve(missing)
+        results.update(
+            (video_id_from_url(url), outcome) for url, outcome in zip(missing, outcomes)
+        )
+        return self._partial(ids, [results[video_id] for video_id in ids])
+
+    async def _playlist_video_urls(
+        self, playlist_id: str, video_urls: Iterator[str], limit: Optional[int] = None
+    ) -> List[str]:
+        """Return the first limit urls (all, if None) of a playlist, like YouTubeInfo._playlist_video_urls.
+
+        video_urls can block: it's walked in the default executor."""
+        membership = (
+            await self.cache.load_membership(playlist_id) if self.cache else None
+        )
+        video_ids, membership = await asyncio.get_event_loop().run_in_executor(
+            None, self._walk_playlist, playlist_id, membership, video_urls, limit
+        )
+        if self.cache and membership:
+            await self.cache.save_membership(membership)
+        return [video_url_from_id(video_id) for video_id in video_ids[:limit]]
+
+    async def _resolve(self, urls: List[str]) -> List[Union[Video, Exception]]:
+        """Fetch urls concurrently, returning every video, or why it failed, in order."""
+        results = await asyncio.gather(
+            *(self._fetch_video(url) for url in urls), return_exceptions=True
+        )
+        for result in results:
+            # Like a cancellation: it's not a failure of a single video
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        return results
+
+    async def _fetch(self, urls: List[str]) -> Tuple[List[Video], List[Exception]]:
+        """Fetch urls concurrently, returning the videos and the failures."""
+        results = await self._resolve(urls)
+        fetched = [result for result in results if not isinstance(result, Exception)]
+        failures = [result for result in results if isinstance(result, Exception)]
+        return fetched, failures
+
+    async def _fetch_video(self, url: str) -> Video:
+        """Fetch a video, coalescing concurrent fetches of the same one."""
+        return await self.single_flight.do(
+            f"video:{video_id_from_url(url)}", partial(self._fetch_and_save, url)
+        )
+
+    async def _fetch_and_save(self, url: str) -> Video:
+        """Fetch a video, up to concurrency at a time, and cache it, or remember that it failed for good, like
+        YouTubeInfo._fetch_and_save."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._semaphore:
+                if self.governor is None:
+                    video = await self._video_from_url(url)
+                else:
+                    video = await self.governor.call_async(self._video_from_url, url)
+        except UpstreamUnavailableError:
+            entry = (
+                await self.cache.lookup(video_id_from_url(url)) if self.cache else None
+            )
+            if not entry or not isinstance(entry.value, Video):
+                raise
+            return entry.value
+        except Exception as e:
+            reason = self._failure_reason(e)
+            if reason is not None:
+                await self._remember_failure(video_id_from_url(url), reason)
+            raise
+        if self.cache:
+            await self.cache.save(video)
+        return video
+
+    async def _remember_failure(self, video_id: str, reason: str) -> None:
+        if self.cache:
+            record = await self.cache.load_record("failure", video_id)
+            ttl, record = self._failure_ttl(record)
+            await self.cache.save_unavailable(video_id, reason, ttl)
+            await self.cache.save_record("failure", video_id, record, ttl * 2)
+
+    def _schedule_refresh(self, urls: List[str]) -> None:
+        """Refresh the videos in a background task, unless a refresh is already running for them."""
+        urls = [url for url in urls if url not in self._refreshing]
+        if not urls:
+            return
+        self._refreshing.update(urls)
+        refresh = asyncio.ensure_future(self._refresh(urls))
+        self._refreshes.add(refresh)
+        refresh.add_done_callback(self._refreshes.discard)
+
+    async def _refresh(self, urls: List[str]) -> None:
+        try:
+            _, failures = await self._fetch(urls)
+            for failure in failures:
+                logger.warning("Could not refresh a stale video: %s", failure)
+        finally:
+            self._refreshing.difference_update(urls)
+
 
 class YouTubeStream(ABC):
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        expire_margin: int = 5 * 60,
+        single_flight: Optional[SingleFlight] = None,
+        governor: Optional[UpstreamGovernor] = None,
+    ):
+        """Stream urls are signed and expire: they're cached until expire_margin seconds before they do, so that a
+        client has the time to start downloading. With a governor, they're asked to YouTube paced and retried by
+        it."""
+        self.cache = cache
+        self.expire_margin = expire_margin
+        self.governor = governor
+        self.single_flight = (
+            single_flight if single_flight is not None else SingleFlight()
+        )
+
     @property
     @abstractmethod
     def name(self) -> str:
         pass
+
+    def stream_url(self, video_id: str) -> str:
+        """Return the url of the best audio stream of a video."""
+        url = self._cached_stream_url(video_id)
+        if url is not None:
+            return url
+        return self.single_flight.do(
+            f"stream:{video_id}",
+            partial(self._resolve_and_save, video_id),
+            partial(self._cached_stream_url, video_id),
+        )
+
+    @abstractmethod
+    def _stream_url_from_id(self, video_id: str) -> str:
+        pass
+
+    def _cached_stream_url(self, video_id: str) -> Optional[str]:
+        record = self.cache.load_record("stream", video_id) if self.cache else None
+        if record and record["expires_at"] - self.expire_margin > time.time():
+            return record["url"]
+        return None
+
+    def _resolve_and_save(self, video_id: str) -> str:
+        if self.governor is None:
+            url = self._stream_url_from_id(video_id)
+        else:
+            url = self.governor.call(self._stream_url_from_id, video_id)
+        expire = parse_qs(urlsplit(url).query).get("expire")
+        if self.cache and expire:
+            expires_at = int(expire[0])
+            ttl = int(expires_at - self.expire_margin - time.time())
+            if ttl > 0:
+                self.cache.save_record(
+                    "stream", video_id, {"url": url, "expires_at": expires_at}, ttl
+                )
+        return url
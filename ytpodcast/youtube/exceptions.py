@@ -0,0 +1,26 @@
+from typing import Optional
+
+
+class VideoUnavailableError(Exception):
+    """Raised when a video cannot be fetched because it's private, deleted, geo-blocked or otherwise unavailable."""
+
+    def __init__(self, video_id: str, reason: str):
+        super().__init__(f"Video {video_id} is unavailable: {reason}")
+        self.video_id = video_id
+        self.reason = reason
+
+    def __reduce__(self):
+        # Rebuilt from its fields, so that it survives being raised in another process
+        return type(self), (self.video_id, self.reason)
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when YouTube is not asked, or not asked again, because it's throttling us or failing: retry_after is
+    how many seconds to wait before trying again, if known."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        return type(self), (str(self), self.retry_after)
@@ -0,0 +1,343 @@
+from __future__ import annotations
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from ytpodcast.youtube.exceptions import UpstreamUnavailableError, VideoUnavailableError
+
+
+T = TypeVar("T")
+
+# How a call to YouTube went
+OK = "ok"
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+FATAL = "fatal"
+# Cancelled or interrupted before it answered: it says nothing about YouTube
+INTERRUPTED = "interrupted"
+
+Clock = Callable[[], float]
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """Return the HTTP status of a failed request, as urllib (pytube), httpx or youtube_dl report it, if any."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    code = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(code, int):
+        return code
+    match = re.search(r"HTTP Error (\d{3})", str(error))
+    return int(match.group(1)) if match else None
+
+
+def classify(error: BaseException) -> str:
+    """Tell if an error means YouTube is throttling us, if it's worth retrying, or neither."""
+    if isinstance(error, VideoUnavailableError):
+        return FATAL
+    code = status_code(error)
+    if code == 429:
+        return THROTTLED
+    if code is not None:
+        return TRANSIENT if code >= 500 or code == 408 else FATAL
+    # Connection errors and timeouts: OSError for urllib, TransportError for httpx
+    if isinstance(error, OSError) or any(
+        cls.__name__ == "TransportError" for cls in type(error).__mro__
+    ):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Return the seconds the Retry-After header of a failed request asks to wait, if any."""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Allows rate calls a second, in bursts of up to burst calls.
+
+    Tokens are handed out in order, even before they're available: a caller is told how long to wait for its
+    token, so that waiting callers can't starve each other."""
+
+    def __init__(
+        self, rate: float, burst: Optional[int] = None, clock: Clock = time.monotonic
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning the seconds to wait before using it."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class AdaptiveConcurrency:
+    """A limit on the calls in flight, adapted to what YouTube tolerates (AIMD).
+
+    Every call that went well and answered within latency_target seconds raises the limit by about one per round
+    of calls; a throttled or slow call multiplies it by decrease, at most once every decrease_interval seconds so
+    that a burst of failures of the same round counts once."""
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        latency_target: Optional[float] = 5.0,
+        decrease: float = 0.5,
+        decrease_interval: float = 1.0,
+        clock: Clock = time.monotonic,
+    ):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("It must be 1 <= minimum <= initial <= maximum")
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.decrease_interval = decrease_interval
+        self.clock = clock
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    def try_enter(self) -> bool:
+        """Take a slot if there's one free."""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def enter(self) -> None:
+        """Take a slot, waiting for one to be free."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def exit(self, outcome: str, latency: float) -> None:
+        """Give a slot back, adapting the limit to how the call went."""
+        with self._condition:
+            self.in_flight -= 1
+            slow = self.latency_target is not None and latency > self.latency_target
+            if outcome == THROTTLED or (outcome == OK and slow):
+                now = self.clock()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+            elif outcome == OK:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Stops calling YouTube after failure_threshold failures in a row, for reset_timeout seconds.
+
+    Then a single call is let through to probe it: if it goes well calls flow again, otherwise the breaker opens
+    for another reset_timeout seconds."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Clock = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def rejecting(self) -> bool:
+        """Tell if calls are being refused, without taking the place of the probe."""
+        with self._lock:
+            return self.state == self.OPEN and self.retry_after() > 0
+
+    def allow(self) -> bool:
+        """Tell if a call can go: when the breaker is half open, only the probe can."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.retry_after() > 0:
+                    return False
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+            self._probing = False
+
+    def release(self) -> None:
+        """Let another probe through, if the call that was probing never answered."""
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self) -> float:
+        """Seconds left before the breaker lets a probe through."""
+        return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+
+class UpstreamGovernor:
+    """Paces the calls to YouTube, to keep them at the highest rate it tolerates without falling into retry storms.
+
+    A call waits for a token of bucket (no rate limit, if None) and for a slot of concurrency. If YouTube throttles
+    it or fails it retries, up to max_attempts attempts, after an exponential backoff with full jitter (or after
+    the Retry-After YouTube asked for, if longer). Once breaker opens, calls are refused right away with an
+    UpstreamUnavailableError, so that callers can serve what they have cached; they also get one when the attempts
+    run out. Share a governor between everything calling YouTube."""
+
+    def __init__(
+        self,
+        bucket: Optional[TokenBucket] = None,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = 4,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        sleep: Callable[[float], Any] = time.sleep,
+        jitter: Callable[[], float] = random.random,
+        clock: Clock = time.monotonic,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.bucket = bucket
+        self.concurrency = (
+            concurrency if concurrency is not None else AdaptiveConcurrency()
+        )
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.sleep = sleep
+        self.jitter = jitter
+        self.clock = clock
+
+    @property
+    def available(self) -> bool:
+        """Tell if YouTube can be called, or if calls are being refused."""
+        return not self.breaker.rejecting
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Return the seconds to wait after the failed attempt (counting from 0)."""
+        delay = self.jitter() * min(self.backoff_cap, self.backoff_base * 2**attempt)
+        asked = retry_after(error)
+        return max(delay, min(asked, self.backoff_cap)) if asked is not None else delay
+
+    def call(self, fn: Callable[..., T], *args: Any) -> T:
+        """Return fn(*args), paced and retried."""
+        for attempt in range(self.max_attempts):
+            self._admit()
+            if self.bucket is not None:
+                self.sleep(self.bucket.reserve())
+            self.concurrency.enter()
+            start = self.clock()
+            outcome = INTERRUPTED
+            try:
+                result = fn(*args)
+                outcome = OK
+                return result
+            except Exception as e:
+                outcome = classify(e)
+                if outcome == FATAL:
+                    raise
+                error = e
+            finally:
+                self._done(outcome, start)
+            if attempt + 1 < self.max_attempts:
+                self.sleep(self.backoff(attempt, error))
+        raise self._exhausted(error) from error
+
+    async def call_async(self, fn: Callable[..., Awaitable[T]], *args: Any) -> T:
+        """Return await fn(*args), paced and retried like call, without blocking the event loop."""
+        for attempt in range(self.max_attempts):
+            self._admit()
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+            # The slots are shared with threads: poll for one instead of blocking the loop
+            while not self.concurrency.try_enter():
+                await asyncio.sleep(0.01)
+            start = self.clock()
+            outcome = INTERRUPTED
+            try:
+                result = await fn(*args)
+                outcome = OK
+                return result
+            except asyncio.CancelledError:
+                # An Exception before Python 3.8
+                raise
+            except Exception as e:
+                outcome = classify(e)
+                if outcome == FATAL:
+                    raise
+                error = e
+            finally:
+                self._done(outcome, start)
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(self.backoff(attempt, error))
+        raise self._exhausted(error) from error
+
+    def _admit(self) -> None:
+        if not self.breaker.allow():
+            raise UpstreamUnavailableError(
+                "YouTube is unhealthy: not calling it for a while",
+                self.breaker.retry_after(),
+            )
+
+    def _done(self, outcome: str, start: float) -> None:
+        self.concurrency.exit(outcome, self.clock() - start)
+        if outcome == INTERRUPTED:
+            self.breaker.release()
+        elif outcome in (THROTTLED, TRANSIENT):
+            self.breaker.record_failure()
+        else:
+            # A video that doesn't exist is still an answer: YouTube is healthy
+            self.breaker.record_success()
+
+    def _exhausted(self, error: BaseException) -> UpstreamUnavailableError:
+        return UpstreamUnavailableError(
+            f"YouTube kept failing after {self.max_attempts} attempts: {error}",
+            retry_after(error),
+        )
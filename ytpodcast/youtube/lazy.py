@@ -0,0 +1,170 @@
+from __future__ import annotations
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union, overload
+
+from ytpodcast.api import get_stream_url
+from ytpodcast.utils import video_id_from_url
+from ytpodcast.youtube.exceptions import (
+    UpstreamUnavailableError,
+    VideoUnavailableError,
+)
+from ytpodcast.youtube.models import Video
+
+
+# Resolves a batch of video urls, returning every video, or why it failed, by id
+BatchResolver = Callable[[List[str]], Dict[str, Union[Video, Exception]]]
+
+# The fields of a LazyVideo set when it's resolved: its id and url are known before, but the url is set again in
+# case the resolved video has another one
+RESOLVED_FIELDS = tuple(field for field in Video.__slots__ if field != "id")
+
+# The fields of a LazyVideo whose video failed
+FAILED_FIELDS = {"title": "", "description": "", "thumbnail": "", "length": 0}
+
+
+class _Batch:
+    """Videos resolved together, the first time one of them is needed."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        resolve: BatchResolver,
+        errors: Dict[str, str],
+        describe: Callable[[Exception], str],
+    ):
+        self.urls = urls
+        self.stubs = [LazyVideo(url, self) for url in urls]
+        self.resolved = False
+        self._resolve = resolve
+        self._errors = errors
+        self._describe = describe
+        self._lock = threading.Lock()
+
+    def fill(self) -> None:
+        """Resolve the batch, if it wasn't yet, setting the fields of its stubs.
+
+        A stub whose video failed gets the FAILED_FIELDS and why it failed, also added to errors. YouTube being
+        unavailable is raised instead, leaving the batch to be resolved again."""
+        with self._lock:
+            if self.resolved:
+                return
+            results = self._resolve(self.urls)
+            for result in results.values():
+                if isinstance(result, UpstreamUnavailableError):
+                    raise result
+            for stub in self.stubs:
+                result = results[stub.id]
+                if isinstance(result, Exception):
+                    stub.error = self._describe(result)
+                    self._errors[stub.id] = stub.error
+                    for field, value in FAILED_FIELDS.items():
+                        setattr(stub, field, value)
+                else:
+                    for field in RESOLVED_FIELDS:
+                        setattr(stub, field, getattr(result, field))
+            self.resolved = True
+
+
+class LazyVideo(Video):
+    """A Video of which only id and url are known: its other fields are fetched on first access, together with the
+    ones of the other videos in its batch. If its video failed, error tells why."""
+
+    __slots__ = ("_batch", "error")
+
+    def __init__(self, url: str, batch: _Batch):
+        self.id = video_id_from_url(url)
+        self.url = get_stream_url(self.id)
+        self.error: Optional[str] = None
+        self._batch = batch
+
+    @property
+    def resolved(self) -> bool:
+        """Tell if the fields of the video are set, without resolving it."""
+        return self._batch.resolved
+
+    def __getattr__(self, name: str):
+        # Only called for the slots not set yet
+        if name not in RESOLVED_FIELDS:
+            raise AttributeError(name)
+        self._batch.fill()
+        return object.__getattribute__(self, name)
+
+    def __eq__(self, other):
+        if not isinstance(other, Video):
+            return NotImplemented
+        return all(
+            getattr(self, field) == getattr(other, field) for field in Video.__slots__
+        )
+
+    __hash__ = None
+
+
+class LazyVideos(Sequence[Video]):
+    """The videos of a playlist as LazyVideo stubs, made only when reached and resolved batch_size at a time, so that
+    they can be consumed while the rest of the playlist is still unresolved.
+
+    Every view resolves the batches it reaches, adding why a video failed to errors, by id, as it's found: describe
+    tells it. The length counts every video listed; indexing, or slicing, a video that failed raises a
+    VideoUnavailableError with that reason, and iterating leaves it out. peek returns a stub without resolving it."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        resolve: BatchResolver,
+        batch_size: int = 20,
+        describe: Callable[[Exception], str] = str,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._urls = urls
+        self._resolve = resolve
+        self.batch_size = batch_size
+        self.errors: Dict[str, str] = {}
+        self._describe = describe
+        self._stubs: List[LazyVideo] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    @overload
+    def __getitem__(self, index: int) -> Video:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Video]:
+        ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        stub = self.peek(index)
+        stub._batch.fill()
+        if stub.error is not None:
+            raise VideoUnavailableError(stub.id, stub.error)
+        return stub
+
+    def __iter__(self) -> Iterator[Video]:
+        for index in range(len(self)):
+            stub = self._stub(index)
+            stub._batch.fill()
+            if stub.error is None:
+                yield stub
+
+    def peek(self, index: int) -> LazyVideo:
+        """Return the stub of the video at index without resolving it, even if its video failed."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("playlist index out of range")
+        return self._stub(index)
+
+    def _stub(self, index: int) -> LazyVideo:
+        with self._lock:
+            # Stubs are made a batch at a time, up to the one holding index
+            while len(self._stubs) <= index:
+                start = len(self._stubs)
+                urls = self._urls[start : start + self.batch_size]
+                batch = _Batch(urls, self._resolve, self.errors, self._describe)
+                self._stubs.extend(batch.stubs)
+            return self._stubs[index]
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import dataclasses
 import json
-from typing import List
+from typing import Dict, List, Optional, Sequence
 
 
 class EnhancedJSONEncoder(json.JSONEncoder):
@@ -17,6 +17,8 @@ class EnhancedJSONEncoder(json.JSONEncoder):
 class Video:
     """TODO"""
 
+    __slots__ = ("id", "title", "description", "thumbnail", "url", "length")
+
     id: str
     title: str
     description: str
@@ -26,7 +28,17 @@ class Video:
 
     def to_json(self) -> str:
         """TODO"""
-        return json.dumps(self, cls=EnhancedJSONEncoder)
+        # Cheaper than dataclasses.asdict, which deep copies every field
+        return json.dumps(
+            {
+                "id": self.id,
+                "title": self.title,
+                "description": self.description,
+                "thumbnail": self.thumbnail,
+                "url": self.url,
+                "length": self.length,
+            }
+        )
 
     @staticmethod
     def from_json(json_str: str) -> Video:
@@ -35,18 +47,56 @@ class Video:
         return Video(**data)
 
 
+@dataclasses.dataclass
+class Unavailable:
+    """A video known to be unavailable (private, deleted, geo-blocked...), cached to avoid asking YouTube again."""
+
+    video_id: str
+    reason: str
+
+
+@dataclasses.dataclass
+class Membership:
+    """The ordered ids of the videos of a playlist, newest first, as they were at fetched_at."""
+
+    playlist_id: str
+    video_ids: List[str]
+    fetched_at: float
+
+
+@dataclasses.dataclass
+class UploadsPage:
+    """A page of the uploads of a channel, newest first.
+
+    continuation fetches the next page, if there's one. The first page also holds the title, description and url
+    of the channel in info."""
+
+    video_ids: List[str]
+    continuation: Optional[str]
+    info: Optional[Dict[str, str]] = None
+
+
 @dataclasses.dataclass
 class Playlist:
     """TODO"""
 
+    # errors is not a field: it's set by whoever resolved the videos, and it's not compared
+    __slots__ = ("id", "title", "description", "thumbnail", "url", "videos", "errors")
+
     id: str
     title: str
     description: str
     thumbnail: str
     url: str
-    videos: List[Video]
+    videos: Sequence[Video]
+
+    def __post_init__(self):
+        # Why the videos left out of the playlist failed, by id, in playlist order
+        self.errors: Dict[str, str] = {}
 
 
 @dataclasses.dataclass
 class Channel(Playlist):
     """TODO"""
+
+    __slots__ = ()
@@ -1,52 +1,84 @@
-from typing import Optional, Any, List
+from __future__ import annotations
+import asyncio
+import json
+import logging
+from typing import Optional, Any, Dict, Iterator, List, Tuple, TYPE_CHECKING
 from functools import partial
 
 from pytube import YouTube, Playlist as _Playlist
+from pytube import exceptions as pytube_exceptions
+from pytube import extract, request
+from pytube.innertube import InnerTube
 
-from ytpodcast.utils import video_url_from_id, playlist_url_from_id
+from ytpodcast.utils import (
+    channel_url_from_id,
+    playlist_url_from_id,
+    uploads_playlist_id,
+    video_id_from_url,
+    video_url_from_id,
+)
 from ytpodcast.api import get_stream_url
-from ytpodcast.youtube import Video, Channel, Playlist
-from ytpodcast.youtube.base import YouTubeInfo
+from ytpodcast.youtube import Video, Channel, Playlist, UploadsPage
+from ytpodcast.youtube.exceptions import VideoUnavailableError
+from ytpodcast.youtube.base import (
+    AsyncYouTubeInfo,
+    ChannelCrawler,
+    YouTubeInfo,
+    YouTubeStream,
+)
+from ytpodcast.youtube.governor import UpstreamGovernor
 
+if TYPE_CHECKING:
+    import httpx
 
-class PytubeInfo(YouTubeInfo):
+    from ytpodcast.cache import AsyncCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class PytubeInfo(YouTubeInfo, ChannelCrawler):
     """TODO"""
 
     name = "pytube"
+    # Why pytube refused a video, from the most to the least specific exception
+    UNAVAILABLE_REASONS = [
+        (pytube_exceptions.VideoPrivate, "private"),
+        (pytube_exceptions.VideoRegionBlocked, "region_blocked"),
+        (pytube_exceptions.MembersOnly, "members_only"),
+        (pytube_exceptions.AgeRestrictedError, "age_restricted"),
+        (pytube_exceptions.RecordingUnavailable, "recording_unavailable"),
+        (pytube_exceptions.LiveStreamError, "live_stream"),
+        (pytube_exceptions.VideoUnavailable, "unavailable"),
+    ]
 
-    def video_from_id(self, video_id: str) -> Video:
-        if self.cache and self.cache.is_cached(video_id):
-            video = self.cache.load(video_id)
-        else:
-            url = video_url_from_id(video_id)
-            video = self._video_from_url(url)
-            if self.cache:
-                self.cache.save(video)
-        return video
-
-    @staticmethod
-    def _video_from_url(url: str) -> Video:
+    @classmethod
+    def _video_from_url(cls, url: str) -> Video:
         video = YouTube(url)
-        return Video(
-            id=video.video_id,
-            title=video.title,
-            description=video.description,
-            thumbnail=video.thumbnail_url,
-            url=get_stream_url(video.video_id),
-            length=video.length,
-        )
+        try:
+            return Video(
+                id=video.video_id,
+                title=video.title,
+                description=video.description,
+                thumbnail=video.thumbnail_url,
+                url=get_stream_url(video.video_id),
+                length=video.length,
+            )
+        except pytube_exceptions.VideoUnavailable as e:
+            raise cls._unavailable_error(video.video_id, e) from e
 
-    def playlist_from_id(
+    def _playlist_from_id(
         self, playlist_id: str, limit: Optional[int] = None
     ) -> Channel:
         url = playlist_url_from_id(playlist_id)
         playlist = _Playlist(url)
         get = partial(self._get_field, playlist)
-        videos = []
-        for video_url in self._generate_video_list(playlist, limit):
-            videos.append(self._video_from_url(video_url))
-        thumbnail = videos[0].thumbnail
-        return Playlist(
+        video_urls = self._playlist_video_urls(
+            playlist_id, self._playlist_urls(playlist, self.governor), limit
+        )
+        videos, errors = self._videos_from_urls(video_urls)
+        thumbnail = self._thumbnail_of(videos)
+        playlist = Playlist(
             id=playlist_id,
             title=get("title", playlist_id),
             description=get("description"),
@@ -54,26 +86,240 @@ class PytubeInfo(YouTubeInfo):
             videos=videos,
             thumbnail=thumbnail,
         )
+        playlist.errors = errors
+        return playlist
+
+    @staticmethod
+    def _playlist_page(
+        playlist: _Playlist, continuation: Optional[str]
+    ) -> Tuple[List[str], Optional[str]]:
+        """Return the /watch?v=... paths of a page of playlist and the continuation of the next one, asking YouTube
+        like pytube does while walking it: the first page comes with its html."""
+        if continuation is None:
+            return _Playlist._extract_videos(
+                json.dumps(extract.initial_data(playlist.html))
+            )
+        url, headers, data = playlist._build_continuation_url(continuation)
+        return _Playlist._extract_videos(
+            request.post(url, extra_headers=headers, data=data)
+        )
+
+    @staticmethod
+    def _playlist_urls(
+        playlist: _Playlist, governor: Optional[UpstreamGovernor] = None
+    ) -> Iterator[str]:
+        """Walk the video urls of playlist a page at a time, asking for each page through governor, if any: a page
+        that failed is asked again, while pytube's own walk would just stop there."""
+
+        def page(continuation: Optional[str]) -> Tuple[List[str], Optional[str]]:
+            if governor is None:
+                return PytubeInfo._playlist_page(playlist, continuation)
+            return governor.call(PytubeInfo._playlist_page, playlist, continuation)
+
+        paths, continuation = page(None)
+        while True:
+            for path in paths:
+                yield video_url_from_id(video_id_from_url(path))
+            if not continuation:
+                return
+            paths, continuation = page(continuation)
+
+    def _uploads_page(
+        self, channel_id: str, continuation: Optional[str] = None
+    ) -> UploadsPage:
+        """The first page comes with the page of the uploads playlist, the others from the browse endpoint of
+        innertube, which pytube only uses while walking a playlist: its parsing is pytube's."""
+        if continuation is None:
+            playlist = _Playlist(playlist_url_from_id(uploads_playlist_id(channel_id)))
+            get = partial(self._get_field, playlist)
+            urls, continuation = _Playlist._extract_videos(
+                json.dumps(extract.initial_data(playlist.html))
+            )
+            info = {
+                "title": get("owner", channel_id),
+                "description": get("description"),
+                "url": channel_url_from_id(channel_id),
+            }
+        else:
+            innertube = InnerTube(client="WEB")
+            response = innertube._call_api(
+                f"{innertube.base_url}/browse",
+                innertube.base_params,
+                {**innertube.base_data, "continuation": continuation},
+            )
+            urls, continuation = _Playlist._extract_videos(json.dumps(response))
+            info = None
+        # They're /watch?v=... paths
+        video_ids = [video_id_from_url(url) for url in urls]
+        return UploadsPage(video_ids, continuation, info)
+
+    @classmethod
+    def _unavailable_error(
+        cls, video_id: str, error: pytube_exceptions.VideoUnavailable
+    ) -> VideoUnavailableError:
+        reason = next(
+            reason
+            for exception, reason in cls.UNAVAILABLE_REASONS
+            if isinstance(error, exception)
+        )
+        return VideoUnavailableError(video_id, reason)
 
     @staticmethod
     def _get_field(obj: Any, name: str, default: str = "") -> str:
-        """Since pytube delays getting single attributes (which are properties), they can fail when accessed."""
+        """Since pytube delays getting single attributes (which are properties), they can fail when accessed.
+
+        Only a field missing from what YouTube answered gives default: a failed request is raised, so that it's
+        not mistaken for an empty field."""
         try:
             return getattr(obj, name)
-        except (Exception,):
+        except (KeyError, IndexError, TypeError, pytube_exceptions.RegexMatchError):
+            logger.debug("%s has no %s: using %r", type(obj).__name__, name, default)
             return default
 
-    @staticmethod
-    def _generate_video_list(
-        entity: _Playlist, limit: Optional[int] = None
-    ) -> List[str]:
-        """Return a list of all the videos from a pytube.Playlist or pytube.Channel."""
-        if limit:
-            videos = []
-            for video in entity.video_urls.gen:
-                videos.append(video)
-                if len(videos) >= limit:
-                    break
-            return videos
-        else:
-            return list(entity.video_urls)
+
+class PytubeStream(YouTubeStream):
+    """Finds the best m4a audio stream of a video with pytube: the feeds declare their episodes as audio/mp4, which
+    the webm/opus streams, often of a higher bitrate, are not."""
+
+    name = "pytube"
+
+    def _stream_url_from_id(self, video_id: str) -> str:
+        video = YouTube(video_url_from_id(video_id))
+        try:
+            stream = (
+                video.streams.filter(only_audio=True, mime_type="audio/mp4")
+                .order_by("abr")
+                .last()
+            )
+        except pytube_exceptions.VideoUnavailable as e:
+            raise PytubeInfo._unavailable_error(video_id, e) from e
+        if stream is None:
+            raise VideoUnavailableError(video_id, "no_audio_stream")
+        return stream.url
+
+
+class AsyncPytubeInfo(AsyncYouTubeInfo):
+    """An AsyncYouTubeInfo asking videos to the innertube player API, like pytube does, through a pooled httpx client.
+
+    Walking a playlist still goes through pytube, in the default executor: it's a handful of requests, one after
+    the other, while the many requests for its videos are concurrent."""
+
+    name = "pytube"
+
+    # Why the player API refused a video, by a distinctive part of its message
+    PLAYABILITY_REASONS = [
+        ("private video", "private"),
+        ("not made this video available in your country", "region_blocked"),
+        ("members-only", "members_only"),
+        ("confirm your age", "age_restricted"),
+        ("recording is not available", "recording_unavailable"),
+    ]
+
+    def __init__(
+        self,
+        cache: Optional[AsyncCache] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        concurrency: int = 16,
+        timeout: float = 10.0,
+        stale_while_revalidate: bool = False,
+        playlist_rebuild_after: Optional[int] = 24 * 60 * 60,
+        governor: Optional[UpstreamGovernor] = None,
+    ):
+        """Pass a client to share its connection pool with the rest of the application: it won't be closed by
+        close(). Otherwise one is made, keeping up to concurrency connections alive."""
+        super().__init__(
+            cache=cache,
+            concurrency=concurrency,
+            stale_while_revalidate=stale_while_revalidate,
+            playlist_rebuild_after=playlist_rebuild_after,
+            governor=governor,
+        )
+        # Only the async info needs httpx: the others don't pay for importing it
+        import httpx
+
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+        )
+        self._innertube = InnerTube(client="ANDROID")
+
+    async def _video_from_url(self, url: str) -> Video:
+        video_id = video_id_from_url(url)
+        response = await self.client.post(
+            f"{self._innertube.base_url}/player",
+            params={**self._innertube.base_params, "videoId": video_id},
+            json=self._innertube.base_data,
+        )
+        response.raise_for_status()
+        info = response.json()
+        reason = self._unavailable_reason(info.get("playabilityStatus", {}))
+        if reason:
+            raise VideoUnavailableError(video_id, reason)
+        details = info["videoDetails"]
+        thumbnails = details.get("thumbnail", {}).get("thumbnails")
+        return Video(
+            id=video_id,
+            title=details["title"],
+            description=details.get("shortDescription", ""),
+            thumbnail=thumbnails[-1]["url"]
+            if thumbnails
+            else f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
+            url=get_stream_url(video_id),
+            length=int(details["lengthSeconds"]),
+        )
+
+    async def _playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        url = playlist_url_from_id(playlist_id)
+        playlist = _Playlist(url)
+        get = partial(PytubeInfo._get_field, playlist)
+        video_urls = await self._playlist_video_urls(
+            playlist_id, PytubeInfo._playlist_urls(playlist, self.governor), limit
+        )
+        videos, errors = await self._videos_from_urls(video_urls)
+        thumbnail = self._thumbnail_of(videos)
+        (
+            title,
+            description,
+            playlist_url,
+        ) = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: (
+                get("title", playlist_id),
+                get("description"),
+                get("playlist_url", url),
+            ),
+        )
+        playlist = Playlist(
+            id=playlist_id,
+            title=title,
+            description=description,
+            url=playlist_url,
+            videos=videos,
+            thumbnail=thumbnail,
+        )
+        playlist.errors = errors
+        return playlist
+
+    async def close(self) -> None:
+        await super().close()
+        if self._owns_client:
+            await self.client.aclose()
+
+    @classmethod
+    def _unavailable_reason(cls, playability: Dict[str, Any]) -> Optional[str]:
+        """Return why a video can't be played, from the playabilityStatus of the player API, or None if it can."""
+        status = playability.get("status", "OK")
+        if status == "OK":
+            return None
+        if status == "LIVE_STREAM":
+            return "live_stream"
+        message = playability.get("reason", "")
+        return next(
+            (reason for text, reason in cls.PLAYABILITY_REASONS if text in message),
+            "unavailable",
+        )
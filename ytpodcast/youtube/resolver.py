@@ -0,0 +1,77 @@
+from __future__ import annotations
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar, Union
+from urllib.parse import urlsplit
+
+
+T = TypeVar("T")
+Outcome = Union[T, Exception]
+
+
+class ParallelResolver:
+    """Resolve a list of urls with a bounded pool of workers.
+
+    Results keep the order of the input urls. Every url is always resolved: a failure is returned in place of its
+    result instead of cancelling the others."""
+
+    def __init__(self, workers: int = 1, max_per_host: Optional[int] = None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if max_per_host is not None and max_per_host < 1:
+            raise ValueError("max_per_host must be at least 1")
+        self.workers = workers
+        self.max_per_host = max_per_host
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, fn: Callable[[str], T], urls: List[str]) -> List[Outcome]:
+        """Call fn on every url, returning results (or the raised exceptions) in the same order of urls."""
+
+        def call(url: str) -> Outcome:
+            try:
+                return self._with_host_slot(fn, url)
+            except Exception as e:
+                return e
+
+        if self.workers == 1 or len(urls) <= 1:
+            return [call(url) for url in urls]
+        return list(self._get_executor().map(call, urls))
+
+    def shutdown(self) -> None:
+        """Release the worker threads, if any was started."""
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="ytpodcast-resolver"
+                )
+            return self._executor
+
+    def _host_slot(self, url: str) -> Optional[threading.BoundedSemaphore]:
+        if self.max_per_host is None:
+            return None
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._host_slots[host] = slot
+            return slot
+
+    def _with_host_slot(self, fn: Callable[[str], T], url: str) -> T:
+        slot = self._host_slot(url)
+        if slot is None:
+            return fn(url)
+        with slot:
+            return fn(url)
+
+    def __del__(self):
+        if getattr(self, "_executor", None):
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Generic, Optional, TypeVar, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from redis import Redis
+
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """A call in flight: the followers wait for done, then share its result or error."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key: the first one (the leader) runs, the others wait for it and get
+    its result, or its exception, instead of running again."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        result: Optional[Callable[[], Optional[T]]] = None,
+    ) -> T:
+        """Return fn(), unless a call for key is already in flight: then return what that call returns.
+
+        result, if given, looks up what a leader produced elsewhere (like in a cache): it's used by subclasses
+        coalescing calls across processes."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._run(key, fn, result)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        result: Optional[Callable[[], Optional[T]]],
+    ) -> T:
+        return fn()
+
+
+class RedisSingleFlight(SingleFlight):
+    """A SingleFlight also coalescing calls across the processes sharing a Redis server.
+
+    The leader of a process runs fn only holding the Redis lock of its key. If another process holds it, the leader
+    waits for the lock to be released and then asks result() for what the other process produced; it runs fn
+    itself only if there's nothing, or if it waited wait_timeout seconds. A lock is released automatically after
+    lock_ttl seconds, in case its holder died."""
+
+    def __init__(
+        self,
+        redis: Optional[Redis] = None,
+        lock_ttl: float = 60.0,
+        wait_timeout: float = 30.0,
+        poll_interval: float = 0.05,
+    ):
+        super().__init__()
+        if redis is None:
+            from redis import Redis
+
+            redis = Redis(host="localhost", port=6379, db=0)
+        self.r = redis
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    def _run(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        result: Optional[Callable[[], Optional[T]]],
+    ) -> T:
+        from redis.exceptions import LockError
+
+        lock = self.r.lock(self._lock_key(key), timeout=self.lock_ttl, blocking=False)
+        if lock.acquire():
+            try:
+                return fn()
+            finally:
+                try:
+                    lock.release()
+                except LockError:
+                    # It expired while fn was running: someone else may hold it by now
+                    pass
+        deadline = time.monotonic() + self.wait_timeout
+        while lock.locked() and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+        found = result() if result is not None else None
+        return found if found is not None else fn()
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return f"ytpodcast:lock:{key}"
+
+
+class AsyncSingleFlight:
+    """The asyncio counterpart of SingleFlight, coalescing the calls of the tasks of an event loop."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return await fn(), unless a call for key is already in flight: then return what that call returns."""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = asyncio.ensure_future(fn())
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shielded: a cancelled caller must not cancel the call the others are waiting for
+        return await asyncio.shield(call)
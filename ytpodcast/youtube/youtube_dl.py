@@ -0,0 +1,263 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+from youtube_dl import YoutubeDL
+from youtube_dl.utils import DownloadError
+
+from ytpodcast.api import get_stream_url
+from ytpodcast.utils import (
+    channel_url_from_id,
+    playlist_url_from_id,
+    uploads_playlist_id,
+    video_id_from_url,
+    video_url_from_id,
+)
+from ytpodcast.youtube import Video, Channel, Playlist, UploadsPage
+from ytpodcast.youtube.exceptions import VideoUnavailableError
+from ytpodcast.youtube.base import ChannelCrawler, YouTubeInfo
+from ytpodcast.youtube.governor import UpstreamGovernor
+from ytpodcast.youtube.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from ytpodcast.cache import Cache
+
+
+# The options of every YoutubeDL: nothing is ever downloaded, nor printed
+YDL_OPTIONS = {"quiet": True, "no_warnings": True, "skip_download": True}
+
+# Why youtube_dl refused a video, by a distinctive part of its message
+UNAVAILABLE_REASONS = [
+    ("private video", "private"),
+    ("available in your country", "region_blocked"),
+    ("members-only", "members_only"),
+    ("confirm your age", "age_restricted"),
+    ("recording is not available", "recording_unavailable"),
+    ("live event will begin", "live_stream"),
+    ("video unavailable", "unavailable"),
+    ("video is unavailable", "unavailable"),
+    ("has been removed", "unavailable"),
+]
+
+# The uploads of a channel in a page, like YouTube pages them
+UPLOADS_PAGE_SIZE = 100
+
+# Seconds the flat listing of the uploads of a channel is read on from, page after page, before it's walked again
+UPLOADS_LISTING_TTL = 30 * 60
+
+# A YoutubeDL per thread of every process, since building one loads all its extractors
+_local = threading.local()
+
+
+def _downloader() -> YoutubeDL:
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        ydl = _local.ydl = YoutubeDL(YDL_OPTIONS)
+    return ydl
+
+
+def extract_video(url: str) -> Video:
+    """Extract a video with youtube_dl, deciphering its signatures and parsing its formats.
+
+    It's the CPU heavy part of getting a video, and it can run in a worker process: what it returns or raises
+    can be pickled."""
+    try:
+        info = _downloader().extract_info(url, download=False)
+    except DownloadError as e:
+        message = str(e)
+        reason = next(
+            (
+                reason
+                for pattern, reason in UNAVAILABLE_REASONS
+                if pattern in message.lower()
+            ),
+            None,
+        )
+        if reason is not None:
+            raise VideoUnavailableError(video_id_from_url(url), reason) from None
+        # Without the traceback it holds, which can't be pickled
+        raise DownloadError(message) from None
+    return Video(
+        id=info["id"],
+        title=info.get("title") or "",
+        description=info.get("description") or "",
+        thumbnail=info.get("thumbnail") or "",
+        url=get_stream_url(info["id"]),
+        length=int(info.get("duration") or 0),
+    )
+
+
+class _UploadsListing:
+    """A flat listing of the uploads of a channel, read forward: its pages are sliced from where the last one
+    stopped, so that crawling a channel walks its listing once."""
+
+    def __init__(self, listing: Dict[str, Any]):
+        self.listing = listing
+        self.started_at = time.monotonic()
+        # The urls read but not sliced yet, from the one at offset
+        self.offset = 0
+        self._buffered: List[str] = []
+        self._urls = YoutubeDLInfo._entry_urls(listing)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.started_at > UPLOADS_LISTING_TTL
+
+    def read(self, offset: int, count: int) -> List[str]:
+        """Return up to count urls from offset on, which can't come before the offset of the last read."""
+        skip = offset - self.offset
+        if skip >= len(self._buffered):
+            deque(islice(self._urls, skip - len(self._buffered)), maxlen=0)
+            self._buffered = []
+        else:
+            del self._buffered[:skip]
+        self.offset = offset
+        self._buffered += islice(self._urls, max(0, count - len(self._buffered)))
+        return self._buffered[:count]
+
+
+class YoutubeDLInfo(YouTubeInfo, ChannelCrawler):
+    """A YouTubeInfo getting everything with youtube_dl.
+
+    A playlist is listed with a flat extraction: its pages are walked without loading the page of every video, and
+    only as far as needed. Videos are extracted in a pool of processes (processes of them, by default one per CPU),
+    so that deciphering signatures and parsing formats don't hold the GIL of the application; with processes=0 they
+    are extracted in the calling thread instead."""
+
+    name = "youtube_dl"
+
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        workers: int = 1,
+        max_per_host: Optional[int] = None,
+        processes: Optional[int] = None,
+        stale_while_revalidate: bool = False,
+        playlist_rebuild_after: Optional[int] = 24 * 60 * 60,
+        single_flight: Optional[SingleFlight] = None,
+        lazy: bool = False,
+        batch_size: int = 20,
+        governor: Optional[UpstreamGovernor] = None,
+    ):
+        """workers threads wait, each, for a video being extracted in the pool: there should be at least as many
+        as processes to keep it busy."""
+        super().__init__(
+            cache=cache,
+            workers=workers,
+            max_per_host=max_per_host,
+            stale_while_revalidate=stale_while_revalidate,
+            playlist_rebuild_after=playlist_rebuild_after,
+            single_flight=single_flight,
+            lazy=lazy,
+            batch_size=batch_size,
+            governor=governor,
+        )
+        if processes is not None and processes < 0:
+            raise ValueError("processes can't be negative")
+        self.processes = processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # The listings of the channels being crawled, by id
+        self._uploads: Dict[str, _UploadsListing] = {}
+        self._uploads_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Stop the worker processes, if any was started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _video_from_url(self, url: str) -> Video:
+        if self.processes == 0:
+            return extract_video(url)
+        return self._get_pool().submit(extract_video, url).result()
+
+    def _playlist_from_id(
+        self, playlist_id: str, limit: Optional[int] = None
+    ) -> Channel:
+        url = playlist_url_from_id(playlist_id)
+        listing = self._flat_listing(url)
+        video_urls = self._playlist_video_urls(
+            playlist_id, self._entry_urls(listing), limit
+        )
+        videos, errors = self._videos_from_urls(video_urls)
+        playlist = Playlist(
+            id=playlist_id,
+            title=listing.get("title") or playlist_id,
+            description=listing.get("description") or "",
+            url=listing.get("webpage_url") or url,
+            videos=videos,
+            thumbnail=self._thumbnail_of(videos),
+        )
+        playlist.errors = errors
+        return playlist
+
+    def _uploads_page(
+        self, channel_id: str, continuation: Optional[str] = None
+    ) -> UploadsPage:
+        """youtube_dl doesn't tell its continuations: here a continuation is how many uploads come before the page.
+        The listing is read on from one page to the next. It's walked again from the start to look for new uploads,
+        when it expired, or when resuming a crawl another process left, or a failed page broke off: up to there,
+        paying its pages but not its videos."""
+        offset = int(continuation or 0)
+        with self._uploads_lock:
+            uploads = self._uploads.pop(channel_id, None)
+        if (
+            uploads is None
+            or continuation is None
+            or uploads.offset > offset
+            or uploads.expired
+        ):
+            uploads = _UploadsListing(
+                self._flat_listing(
+                    playlist_url_from_id(uploads_playlist_id(channel_id))
+                )
+            )
+        # A listing that failed is left: its entries can't be read any further
+        urls = uploads.read(offset, UPLOADS_PAGE_SIZE + 1)
+        video_ids = [video_id_from_url(url) for url in urls[:UPLOADS_PAGE_SIZE]]
+        continuation = None
+        if len(urls) > UPLOADS_PAGE_SIZE:
+            continuation = str(offset + UPLOADS_PAGE_SIZE)
+            with self._uploads_lock:
+                self._uploads[channel_id] = uploads
+        info = None
+        if offset == 0:
+            listing = uploads.listing
+            info = {
+                "title": listing.get("uploader") or listing.get("title") or channel_id,
+                "description": listing.get("description") or "",
+                "url": channel_url_from_id(channel_id),
+            }
+        return UploadsPage(video_ids, continuation, info)
+
+    @staticmethod
+    def _flat_listing(url: str) -> Dict[str, Any]:
+        """Return the unprocessed playlist youtube_dl extracts: its entries are a generator, loading the pages of
+        the listing only when they're reached."""
+        listing = _downloader().extract_info(url, download=False, process=False)
+        # A playlist url may only point to its actual listing
+        for _ in range(3):
+            if listing.get("_type") not in ("url", "url_transparent"):
+                break
+            listing = _downloader().extract_info(
+                listing["url"], download=False, process=False
+            )
+        return listing
+
+    @staticmethod
+    def _entry_urls(listing: Dict[str, Any]) -> Iterator[str]:
+        for entry in listing.get("entries") or []:
+            if entry and entry.get("id"):
+                yield video_url_from_id(entry["id"])
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._pool